@@ -0,0 +1,270 @@
+######## Hotplate Run Analytics #######
+# Aligns recorded telemetry logs with the recipe steps that produced them and
+# computes per-step rise time, overshoot, time to stabilize and dwell error,
+# plus each run's cooling time to 30 °C, over whole archives of logs.
+# Note: Steps are found from the log's Step column and phases from its Phase
+# column (see the GUI's CSV export). All metrics are computed for every step at
+# once with numpy reduceat over the step boundaries.
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import hotplate_recipe
+from hotplate_estimator import format_duration, HEATER_OFF_TEMP
+from hotplate_replay import LOG_EXTENSIONS, load_telemetry
+from hotplate_telemetry import PHASES
+
+STABLE_BAND = 2.0      # °C, the recipe runner's "at temperature" tolerance
+RISE_LOW, RISE_HIGH = 0.1, 0.9   # rise time is measured between these fractions of the swing
+COOL_TEMP = 30.0       # °C, end of the run's final cooling
+
+STEP_FIELDS = ("step", "target", "start_temp", "duration", "rise_time", "overshoot", "settle_time",
+               "dwell", "dwell_error")
+DWELL = PHASES.index("dwell")
+FINAL_COOLING = PHASES.index("final_cooling")
+
+
+def _first(mask, values, starts, missing=np.nan):
+    """Per segment, values at the first index where mask holds (missing if it never does)"""
+    index = np.arange(len(mask))
+    first = np.minimum.reduceat(np.where(mask, index, len(mask)), starts)
+    found = first < len(mask)
+    return np.where(found, values[np.minimum(first, len(mask) - 1)], missing)
+
+
+def _last(mask, values, starts, missing=np.nan):
+    """Per segment, values at the last index where mask holds (missing if it never does)"""
+    index = np.arange(len(mask))
+    last = np.maximum.reduceat(np.where(mask, index, -1), starts)
+    return np.where(last >= 0, values[np.maximum(last, 0)], missing)
+
+
+def _recipe_steps(recipe, numbers):
+    """{step number: step dict} for the step numbers seen in a log"""
+    wanted = set(int(n) for n in numbers)
+    steps = {}
+    for number, step in recipe.enumerate(start=min(wanted) if wanted else 1):
+        if number > max(wanted):
+            break
+        if number in wanted:
+            steps[number] = step
+    return steps
+
+
+def step_metrics(telemetry, recipe=None):
+    """Per-step metrics of one log as a dict of numpy columns (see STEP_FIELDS).
+
+    telemetry is a load_telemetry() dict. With a Recipe, targets and dwell
+    times come from its steps; otherwise the target is the step's last
+    recorded setpoint and the dwell error is unknown (NaN).
+    Times are in seconds, temperatures in °C.
+    """
+    times = telemetry["elapsed"]
+    temps = telemetry["current_temp"]
+    steps = np.nan_to_num(telemetry.get("step", np.zeros(len(times))))
+    phases = telemetry.get("phase", np.full(len(times), np.nan))
+    setpoints = telemetry.get("setpoint_temp", np.full(len(times), np.nan))
+
+    # Recipe samples only, without the final cooling tail
+    keep = (steps > 0) & np.isfinite(temps) & (phases != FINAL_COOLING)
+    times, temps, steps, phases, setpoints = times[keep], temps[keep], steps[keep], phases[keep], setpoints[keep]
+    if not len(times):
+        return {name: np.array([]) for name in STEP_FIELDS}
+
+    starts = np.r_[0, np.flatnonzero(np.diff(steps)) + 1]
+    ends = np.r_[starts[1:], len(times)]
+    segment = np.repeat(np.arange(len(starts)), ends - starts)
+    numbers = steps[starts]
+    start_times, start_temps = times[starts], temps[starts]
+    end_times = np.r_[times[starts[1:]], times[-1]]
+
+    targets = setpoints[ends - 1].astype(float)
+    dwell = np.full(len(starts), np.nan)
+    if recipe is not None:
+        recipe_steps = _recipe_steps(recipe, numbers)
+        for i, number in enumerate(numbers):
+            step = recipe_steps.get(int(number))
+            if step and step["kind"] == "setpoint":
+                targets[i] = step["target_temp"]
+                dwell[i] = step["dwell_seconds"]
+
+    # Signed progress towards the target: 0 at the step's start temperature, 1 at the target
+    swing = (targets - start_temps)[segment]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        progress = np.where(swing != 0, (temps - start_temps[segment]) / swing, 1.0)
+    rise_start = _first(progress >= RISE_LOW, times, starts)
+    rise_end = _first(progress >= RISE_HIGH, times, starts)
+
+    heating = targets >= start_temps
+    overshoot = np.where(heating, np.maximum.reduceat(temps, starts) - targets,
+                         targets - np.minimum.reduceat(temps, starts))
+
+    # Stable from the dwell phase on when it was logged, else from the last sample outside the band
+    outside = np.abs(temps - targets[segment]) > STABLE_BAND
+    settled_at = _last(outside, times, starts, missing=-np.inf)
+    settled_at = np.where(np.isfinite(settled_at), settled_at, start_times)
+    dwell_start = _first(phases == DWELL, times, starts)
+    dwell_end = _last(phases == DWELL, times, starts)
+    settled_at = np.where(np.isfinite(dwell_start), dwell_start, settled_at)
+
+    period = np.median(np.diff(times)) if len(times) > 1 else 0.0
+    dwelled = np.where(np.isfinite(dwell_start), dwell_end - dwell_start + period, end_times - settled_at)
+
+    return {
+        "step": numbers.astype(int),
+        "target": targets,
+        "start_temp": start_temps,
+        "duration": end_times - start_times,
+        "rise_time": rise_end - rise_start,
+        "overshoot": np.maximum(overshoot, 0.0),
+        "settle_time": settled_at - start_times,
+        "dwell": dwelled,
+        "dwell_error": dwelled - dwell
+    }
+
+
+def cooling_time(telemetry, last_target=None, cool_temp=COOL_TEMP):
+    """Seconds from the start of the run's final cooling until the plate is at or below cool_temp.
+
+    Cooling starts at the final cooling phase or, without one, at the last
+    step if that step turns the heater off (its target, last_target, defaults
+    to the logged setpoint). NaN if no cooling was logged.
+    """
+    times, temps = telemetry["elapsed"], telemetry["current_temp"]
+    phases = telemetry.get("phase", np.full(len(times), np.nan))
+    steps = np.nan_to_num(telemetry.get("step", np.zeros(len(times))))
+    setpoints = telemetry.get("setpoint_temp", np.full(len(times), np.nan))
+    cooling = np.flatnonzero(phases == FINAL_COOLING)
+    if not len(cooling) and np.any(steps > 0):
+        last_step = np.flatnonzero(steps == steps[steps > 0][-1])
+        if (setpoints[last_step[-1]] if last_target is None else last_target) <= HEATER_OFF_TEMP:
+            cooling = last_step
+    if not len(cooling):
+        return np.nan
+    start = cooling[0]
+    cool = np.flatnonzero(temps[start:] <= cool_temp)
+    return float(times[start + cool[0]] - times[start]) if len(cool) else np.nan
+
+
+def analyze_log(path, recipe_path=None):
+    """Metrics of one log. Returns a dict with path, group, steps, run summary values, or an error."""
+    result = {"path": path, "group": os.path.basename(os.path.dirname(os.path.abspath(path)))}
+    try:
+        telemetry = load_telemetry(path)
+        recipe = hotplate_recipe.load_recipe(recipe_path) if recipe_path else None
+        steps = step_metrics(telemetry, recipe)
+        result.update({
+            "steps": steps,
+            "duration": float(telemetry["elapsed"][-1] - telemetry["elapsed"][0]),
+            "settle_seconds": float(np.nansum(steps["settle_time"])),
+            "max_overshoot": float(np.nanmax(steps["overshoot"])) if len(steps["step"]) else np.nan,
+            "cooling_seconds": cooling_time(telemetry, steps["target"][-1] if len(steps["step"]) else None)
+        })
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def _analyze_case(case):
+    return analyze_log(*case)
+
+
+def analyze_archive(paths, recipe_path=None, workers=None):
+    """Analyzes every log (files or folders of .csv / .npz logs, searched recursively) in a process pool"""
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                logs += sorted(os.path.join(folder, name) for name in names if name.lower().endswith(LOG_EXTENSIONS))
+        else:
+            logs.append(path)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_analyze_case, [(log, recipe_path) for log in logs]))
+
+
+### Summary tables ###
+def _cell(value, digits=1):
+    return "--" if value is None or not np.isfinite(value) else f"{value:.{digits}f}"
+
+
+def print_runs(results):
+    """One line per run, the runs spending longest getting to temperature first"""
+    print(f"{'Log':<32} {'Steps':>5} {'Duration':>9} {'Settling':>9} {'Max over':>8} {'Cool <30':>9}")
+    ok = sorted((r for r in results if "error" not in r), key=lambda r: -r["settle_seconds"])
+    for r in ok:
+        print(f"{os.path.basename(r['path'])[:32]:<32} {len(r['steps']['step']):>5} "
+              f"{format_duration(r['duration']):>9} {format_duration(r['settle_seconds']):>9} "
+              f"{_cell(r['max_overshoot']):>8} {format_duration(r['cooling_seconds']):>9}")
+    for r in results:
+        if "error" in r:
+            print(f"{os.path.basename(r['path'])[:32]:<32} FAILED {r['error']}")
+
+
+def print_groups(results):
+    """Mean per-run metrics per folder (e.g. one folder per plate or recipe)"""
+    groups = {}
+    for r in results:
+        if "error" not in r:
+            groups.setdefault(r["group"], []).append(r)
+    print(f"{'Folder':<24} {'Runs':>5} {'Settling':>9} {'Max over':>8} {'Cool <30':>9}")
+    for group, runs in sorted(groups.items(), key=lambda g: -np.mean([r["settle_seconds"] for r in g[1]])):
+        mean = lambda key: float(np.nanmean([r[key] for r in runs])) if any(
+            np.isfinite(r[key]) for r in runs) else np.nan
+        print(f"{group[:24]:<24} {len(runs):>5} {format_duration(mean('settle_seconds')):>9} "
+              f"{_cell(mean('max_overshoot')):>8} {format_duration(mean('cooling_seconds')):>9}")
+
+
+def print_steps(result):
+    """Per-step table of one run"""
+    steps = result["steps"]
+    print(os.path.basename(result["path"]))
+    print(f"{'Step':>4} {'Target':>7} {'Rise':>9} {'Overshoot':>9} {'Settle':>9} {'Dwell':>9} {'Dwell err':>9}")
+    for i in range(len(steps["step"])):
+        print(f"{steps['step'][i]:>4} {_cell(steps['target'][i]):>7} {format_duration(steps['rise_time'][i]):>9} "
+              f"{_cell(steps['overshoot'][i]):>9} {format_duration(steps['settle_time'][i]):>9} "
+              f"{format_duration(steps['dwell'][i]):>9} {_cell(steps['dwell_error'][i], 0):>9}")
+
+
+def write_step_csv(results, path):
+    """All runs' per-step metrics in one CSV"""
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(("log", "folder") + STEP_FIELDS)
+        for r in results:
+            if "error" in r:
+                continue
+            steps = r["steps"]
+            for i in range(len(steps["step"])):
+                writer.writerow([r["path"], r["group"]]
+                                + ["" if not np.isfinite(steps[name][i]) else steps[name][i] for name in STEP_FIELDS])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-step overshoot, settle time and dwell accuracy of recorded runs")
+    parser.add_argument("logs", nargs="+", help="telemetry logs (.csv / .npz) or folders of them")
+    parser.add_argument("--recipe", help="recipe the logs were recorded with (for targets and dwell times)")
+    parser.add_argument("--steps", action="store_true", help="also print each run's per-step table")
+    parser.add_argument("--csv", help="write every run's per-step metrics to this CSV file")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    results = analyze_archive(args.logs, args.recipe, args.workers)
+    print_runs(results)
+    print()
+    print_groups(results)
+    if args.steps:
+        for r in results:
+            if "error" not in r:
+                print()
+                print_steps(r)
+    if args.csv:
+        write_step_csv(results, args.csv)
+        print(f"Step metrics written to {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+######## Hotplate Serial Arbiter - Priority Lanes #######
+# Replaces the plain serial lock with priority classes, so a heater-off never
+# queues behind telemetry polling: safety, then operator, then recipe, then
+# telemetry. Each class has a lane object usable anywhere a lock was.
+# Note: The arbiter registers a frame hook with hotplate_wrapper, so a
+# lower-priority holder running several commands in a row hands the port over
+# between frames whenever a higher class is waiting. An abort therefore waits
+# for at most the one command already on the wire.
+
+import threading
+import time
+from collections import deque
+
+import hotplate_wrapper
+
+SAFETY, OPERATOR, RECIPE, TELEMETRY = range(4)
+CLASS_NAMES = ("safety", "operator", "recipe", "telemetry")
+
+
+class _Lane:
+    """Lock-like handle that acquires the arbiter at one priority"""
+    def __init__(self, arbiter, priority):
+        self.arbiter = arbiter
+        self.priority = priority
+
+    def acquire(self, blocking=True, timeout=-1):
+        return self.arbiter.acquire(self.priority, blocking, timeout)
+
+    def release(self):
+        self.arbiter.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SerialArbiter:
+    """Grants the serial port to the highest-priority waiter, first come first served within a class"""
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queues = [deque() for _ in CLASS_NAMES]
+        self.owner = None          # (thread id, priority)
+        self.lanes = [_Lane(self, priority) for priority in range(len(CLASS_NAMES))]
+        self.stats = [{"requests": 0, "total_wait": 0.0, "max_wait": 0.0, "yields": 0} for _ in CLASS_NAMES]
+
+    def lane(self, priority):
+        return self.lanes[priority]
+
+    def attach(self, ser):
+        """Lets holders of this port yield between command frames"""
+        hotplate_wrapper.set_frame_hook(ser, self.yield_point)
+
+    def _head(self):
+        for queue in self.queues:
+            if queue:
+                return queue[0]
+        return None
+
+    def acquire(self, priority, blocking=True, timeout=-1):
+        ticket = object()
+        started = time.monotonic()
+        deadline = None if timeout is None or timeout < 0 else started + timeout
+        with self.condition:
+            queue = self.queues[priority]
+            queue.append(ticket)
+            while self.owner is not None or self._head() is not ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not blocking or (remaining is not None and remaining <= 0):
+                    queue.remove(ticket)
+                    self.condition.notify_all()
+                    return False
+                self.condition.wait(remaining)
+            queue.popleft()
+            self.owner = (threading.get_ident(), priority)
+            wait = time.monotonic() - started
+            stats = self.stats[priority]
+            stats["requests"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+        return True
+
+    def release(self):
+        with self.condition:
+            self.owner = None
+            self.condition.notify_all()
+
+    def yield_point(self):
+        """Called before each command frame: hands the port to a higher class if one is waiting"""
+        with self.condition:
+            if self.owner is None or self.owner[0] != threading.get_ident():
+                return
+            priority = self.owner[1]
+            if not any(self.queues[p] for p in range(priority)):
+                return
+            self.stats[priority]["yields"] += 1
+        self.release()
+        self.acquire(priority)
+
+    def report(self):
+        """Per-class request count, mean and worst-case queueing delay (s) and yields"""
+        with self.condition:
+            return {name: {"requests": s["requests"],
+                           "mean_wait": s["total_wait"] / s["requests"] if s["requests"] else 0.0,
+                           "max_wait": s["max_wait"],
+                           "yields": s["yields"]}
+                    for name, s in zip(CLASS_NAMES, self.stats)}
+
+
+def print_report(arbiter):
+    print("Serial access   requests   mean wait   max wait   yields")
+    for name, s in arbiter.report().items():
+        print(f"{name:<14} {s['requests']:>9}   {s['mean_wait'] * 1000:>6.1f} ms  {s['max_wait'] * 1000:>6.1f} ms"
+              f"   {s['yields']:>6}")
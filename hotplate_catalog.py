@@ -0,0 +1,235 @@
+######## Hotplate Run Catalog #######
+# SQLite index of recorded runs: plate, recipe and its hash, start and end
+# time, outcome and per-step statistics, so questions like "PMMA bakes on COM4
+# in the last 30 days with more than 3 °C overshoot" are one indexed query
+# instead of a scan over every CSV.
+# Note: The telemetry itself stays in the CSV files; the catalog only stores
+# their paths and the metrics computed by hotplate_analytics when a run is added.
+
+import argparse
+import contextlib
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+
+import hotplate_analytics
+import hotplate_checkpoint
+import hotplate_recipe
+from hotplate_estimator import format_duration
+from hotplate_replay import LOG_EXTENSIONS, load_telemetry
+
+CATALOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_catalog.db")
+RUNS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    device TEXT,
+    recipe TEXT,
+    recipe_hash TEXT,
+    started REAL,
+    ended REAL,
+    outcome TEXT,
+    steps INTEGER,
+    max_overshoot REAL,
+    settle_seconds REAL,
+    cooling_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    step INTEGER,
+    target REAL,
+    duration REAL,
+    rise_time REAL,
+    overshoot REAL,
+    settle_time REAL,
+    dwell_error REAL
+);
+CREATE INDEX IF NOT EXISTS runs_device_started ON runs (device, started);
+CREATE INDEX IF NOT EXISTS runs_recipe_hash ON runs (recipe_hash);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id);
+"""
+
+STEP_COLUMNS = ("step", "target", "duration", "rise_time", "overshoot", "settle_time", "dwell_error")
+
+
+def run_file(device, recipe, started, directory=RUNS_DIR):
+    """Path for a new run's telemetry, e.g. runs/COM3_20260301-142000_PMMATransferBake.csv"""
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started))
+    name = os.path.splitext(os.path.basename(recipe))[0] if recipe else "manual"
+    return os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]', '_', f"{device or 'plate'}_{stamp}_{name}") + ".csv")
+
+
+def _number(value):
+    """SQLite value for a metric: NaN is stored as NULL"""
+    return None if value is None or not np.isfinite(value) else float(value)
+
+
+class RunCatalog:
+    """The run index. Safe to open from several threads; each call uses its own connection."""
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """A connection for one transaction: committed on success, rolled back on error, then closed"""
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA foreign_keys = ON")
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add_run(self, path, device=None, recipe=None, started=None, ended=None, outcome=None, telemetry=None):
+        """Indexes a telemetry CSV and its per-step metrics (replacing an existing entry for the path).
+
+        started / ended are Unix times; by default the file's modification time
+        minus / at the end of the log. Returns the run id.
+        """
+        path = os.path.abspath(path)
+        if telemetry is None:
+            telemetry = load_telemetry(path)
+        parsed = None
+        if recipe:
+            try:
+                parsed = hotplate_recipe.load_recipe(recipe)
+            except Exception as e:
+                print(f"Warning: recipe {recipe} not used for targets: {e}")
+        steps = hotplate_analytics.step_metrics(telemetry, parsed)
+        duration = float(telemetry["elapsed"][-1] - telemetry["elapsed"][0]) if len(telemetry["elapsed"]) else 0.0
+        if ended is None:
+            ended = os.path.getmtime(path)
+        if started is None:
+            started = ended - duration
+        last_target = steps["target"][-1] if len(steps["step"]) else None
+
+        with self._connect() as db:
+            db.execute("DELETE FROM runs WHERE path = ?", (path,))
+            run_id = db.execute(
+                "INSERT INTO runs (path, device, recipe, recipe_hash, started, ended, outcome, steps, "
+                "max_overshoot, settle_seconds, cooling_seconds) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, device, os.path.abspath(recipe) if recipe else None,
+                 hotplate_checkpoint.recipe_hash(recipe) if recipe and os.path.exists(recipe) else None,
+                 started, ended, outcome, len(steps["step"]),
+                 _number(np.nanmax(steps["overshoot"])) if len(steps["step"]) else None,
+                 _number(np.nansum(steps["settle_time"])),
+                 _number(hotplate_analytics.cooling_time(telemetry, last_target)))).lastrowid
+            db.executemany(
+                "INSERT INTO steps (run_id, " + ", ".join(STEP_COLUMNS) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, *(_number(steps[name][i]) for name in STEP_COLUMNS)) for i in range(len(steps["step"]))])
+        return run_id
+
+    def index_folder(self, folder, device=None):
+        """Adds every telemetry log (CSV or .npz export) under folder not yet in the catalog. Returns (added, failed) counts."""
+        with self._connect() as db:
+            known = {row["path"] for row in db.execute("SELECT path FROM runs")}
+        added = failed = 0
+        for directory, _, names in os.walk(folder):
+            for name in sorted(names):
+                path = os.path.abspath(os.path.join(directory, name))
+                if not name.lower().endswith(LOG_EXTENSIONS) or path in known:
+                    continue
+                try:
+                    self.add_run(path, device=device)
+                    added += 1
+                except Exception as e:
+                    print(f"Skipping {path}: {e}")
+                    failed += 1
+        return added, failed
+
+    def query(self, device=None, recipe=None, recipe_hash=None, since=None, until=None, outcome=None,
+              min_overshoot=None, limit=500):
+        """Runs matching every given filter, newest first, as dicts.
+
+        recipe matches part of the recipe file name; since / until are Unix
+        times; min_overshoot selects runs with any step overshooting by more
+        than that many °C.
+        """
+        clauses, values = [], []
+        for clause, value in (("device = ?", device), ("recipe LIKE ?", recipe and f"%{recipe}%"),
+                              ("recipe_hash = ?", recipe_hash), ("started >= ?", since), ("started <= ?", until),
+                              ("outcome = ?", outcome), ("max_overshoot > ?", min_overshoot)):
+            if value is not None:
+                clauses.append(clause)
+                values.append(value)
+        sql = "SELECT * FROM runs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY started DESC LIMIT ?"
+        with self._connect() as db:
+            return [dict(row) for row in db.execute(sql, values + [limit])]
+
+    def run(self, run_id):
+        """One run as a dict, or None"""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def steps(self, run_id):
+        """Per-step statistics of a run"""
+        with self._connect() as db:
+            return [dict(row) for row in db.execute("SELECT * FROM steps WHERE run_id = ? ORDER BY step", (run_id,))]
+
+    def remove(self, run_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+
+
+def format_run(run):
+    """One table line for a run"""
+    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started"])) if run["started"] else "--"
+    overshoot = "--" if run["max_overshoot"] is None else f"{run['max_overshoot']:.1f}"
+    recipe = os.path.basename(run["recipe"]) if run["recipe"] else os.path.basename(run["path"])
+    return (f"{run['id']:>5} {started:<16} {str(run['device']):<8} {recipe[:28]:<28} {str(run['outcome']):<9} "
+            f"{format_duration(run['ended'] - run['started']) if run['started'] else '--':>9} {overshoot:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and search recorded hotplate runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="add every telemetry log (.csv / .npz) in a folder")
+    index.add_argument("folder")
+    index.add_argument("--device", help="plate the logs were recorded on")
+    query = commands.add_parser("query", help="list matching runs, newest first")
+    query.add_argument("--device")
+    query.add_argument("--recipe", help="part of the recipe file name")
+    query.add_argument("--days", type=float, help="only runs started in the last DAYS days")
+    query.add_argument("--outcome", choices=("done", "cancelled", "failed"))
+    query.add_argument("--min-overshoot", type=float, help="°C")
+    query.add_argument("--steps", action="store_true", help="also list each run's step statistics")
+    parser.add_argument("--catalog", default=CATALOG_FILE)
+    args = parser.parse_args(argv)
+
+    catalog = RunCatalog(args.catalog)
+    if args.command == "index":
+        added, failed = catalog.index_folder(args.folder, args.device)
+        print(f"Indexed {added} runs ({failed} skipped)")
+        return
+
+    started = time.perf_counter()
+    runs = catalog.query(device=args.device, recipe=args.recipe, outcome=args.outcome,
+                         since=time.time() - args.days * 86400 if args.days else None,
+                         min_overshoot=args.min_overshoot)
+    elapsed = time.perf_counter() - started
+    print(f"{'Id':>5} {'Started':<16} {'Device':<8} {'Recipe':<28} {'Outcome':<9} {'Duration':>9} {'Max over':>8}")
+    for run in runs:
+        print(format_run(run))
+        if args.steps:
+            for step in catalog.steps(run["id"]):
+                cells = ["--" if step[name] is None else f"{step[name]:.1f}" for name in STEP_COLUMNS[1:]]
+                print(f"        step {step['step']:>3}: " + "  ".join(
+                    f"{name} {cell}" for name, cell in zip(STEP_COLUMNS[1:], cells)))
+    print(f"{len(runs)} runs in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
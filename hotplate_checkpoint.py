@@ -0,0 +1,89 @@
+######## Hotplate Recipe Checkpoints #######
+# run_recipe saves a small checkpoint on every phase change so a recipe
+# interrupted by a crash or disconnect can resume at the same phase instead
+# of restarting from line 1.
+
+import hashlib
+import json
+import os
+import time
+
+import hotplate_recipe
+
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recipe_checkpoint.json")
+DWELL_SAVE_INTERVAL = 30   # s, how often dwell progress is saved between phase changes
+
+# Phases in the order a setpoint step goes through them
+PHASES = ("setpoint", "stabilizing", "dwell", "final_cooling", "profile")
+
+
+def recipe_hash(input_file):
+    """Hash of the recipe contents (and files it includes), so a checkpoint is never resumed on an edited recipe"""
+    digest = hashlib.sha256()
+    try:
+        files = hotplate_recipe.load_recipe(input_file).files
+    except Exception:
+        files = [input_file]
+    for path in files:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def save_checkpoint(path, recipe, digest, step, phase, elapsed=0.0, device_state=None):
+    """Atomically writes a checkpoint. digest is recipe_hash(recipe)."""
+    checkpoint = {
+        "recipe": os.path.abspath(recipe),
+        "recipe_hash": digest,
+        "step": step,
+        "phase": phase,
+        "elapsed": round(elapsed, 1),
+        "device": device_state or {},
+        "saved_at": time.time()
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """Returns the saved checkpoint, or None"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable checkpoint: {e}")
+        return None
+
+
+def clear_checkpoint(path=CHECKPOINT_FILE):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def resumable_checkpoint(path=CHECKPOINT_FILE, recipe=None):
+    """The saved checkpoint if its recipe still exists unchanged (and matches recipe, if given)"""
+    checkpoint = load_checkpoint(path)
+    if not checkpoint or not os.path.exists(checkpoint["recipe"]):
+        return None
+    if recipe and os.path.abspath(recipe) != checkpoint["recipe"]:
+        return None
+    if recipe_hash(checkpoint["recipe"]) != checkpoint["recipe_hash"]:
+        print("Recipe changed since the checkpoint was saved, not resuming")
+        return None
+    return checkpoint
+
+
+def describe(checkpoint):
+    """One-line summary for resume prompts"""
+    text = f"{os.path.basename(checkpoint['recipe'])}: step {checkpoint['step']}, {checkpoint['phase']}"
+    if checkpoint.get("elapsed"):
+        text += f" ({checkpoint['elapsed']:.0f} s done)"
+    return text + f", saved {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(checkpoint['saved_at']))}"
@@ -0,0 +1,58 @@
+######## Hotplate Clocks - Pluggable Time and Sleep #######
+# run_recipe and the setpoint streamer take a clock object instead of calling
+# time.monotonic() / time.sleep() directly, so recipes can run against the
+# device simulator much faster than real time.
+
+import threading
+import time
+
+
+class SystemClock:
+    """Real time: monotonic seconds and a blocking sleep"""
+    def time(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class VirtualClock:
+    """Deterministic simulated time: sleep() advances the clock instantly.
+
+    Meant for one engine thread driving a simulator; a whole recipe runs as
+    fast as the host can execute its control flow.
+    """
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
+
+
+class ScaledClock:
+    """Real time sped up by a constant factor, e.g. speed=1000 turns a 2 h recipe into 7.2 s.
+
+    Unlike VirtualClock it stays consistent across threads (GUI polling + recipe).
+    """
+    def __init__(self, speed=1000.0, start=0.0):
+        self.speed = speed
+        self._start = start
+        self._real_start = time.monotonic()
+
+    def time(self):
+        return self._start + (time.monotonic() - self._real_start) * self.speed
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+
+SYSTEM_CLOCK = SystemClock()
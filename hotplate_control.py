@@ -0,0 +1,105 @@
+######## Hotplate Setpoint Shaping - Host-Side Control #######
+# Streams intermediate setpoints to the plate while a recipe step is
+# stabilizing, so the plate reaches and holds the target faster than by
+# sending the target once and waiting.
+# Note: The plate's own controller still closes the loop; these shapers only
+# choose which setpoint to send it, within hard safety limits.
+
+import math
+from abc import ABC, abstractmethod
+
+from hotplate_estimator import ThermalModel, HEATER_OFF_TEMP
+
+SAFETY_MAX_TEMP = 340      # °C, no shaper ever commands a setpoint above this
+MAX_BOOST = 30             # °C, furthest a shaped setpoint may sit from the target's setpoint
+MAX_OVERSHOOT = 1.0        # °C, above target + this the shaper backs the setpoint off
+CONTROL_MODES = ("mpc", "pid")
+
+
+class _SetpointShaper(ABC):
+    """Common setpoint limits for the shapers below"""
+    def __init__(self, target, model=None, max_boost=MAX_BOOST, max_overshoot=MAX_OVERSHOOT,
+                 max_temp=SAFETY_MAX_TEMP):
+        self.target = target
+        self.model = model or ThermalModel()
+        self.max_overshoot = max_overshoot
+        self.max_temp = max_temp
+        # Setpoint at which the model settles exactly on the target
+        self.hold_setpoint = self.model.ambient + (target - self.model.ambient) / self.model.gain
+        self.low = max(HEATER_OFF_TEMP + 1, self.hold_setpoint - max_boost)
+        self.high = min(max_temp, self.hold_setpoint + max_boost)
+        self.setpoint = target
+
+    def _limit(self, temp, setpoint):
+        if temp > self.target + self.max_overshoot:
+            # Overshooting: drop to the lowest allowed setpoint until back in band
+            setpoint = self.low
+        setpoint = min(max(setpoint, self.low), self.high)
+        self.setpoint = int(round(min(setpoint, self.max_temp)))
+        return self.setpoint
+
+    @abstractmethod
+    def next_setpoint(self, temp, now):
+        """Setpoint to send for the plate temperature temp at time now (s)"""
+
+
+class ModelPredictiveShaper(_SetpointShaper):
+    """Chooses the setpoint that lands the model on the target one horizon after the dead time"""
+    def __init__(self, target, model=None, horizon=None, **limits):
+        super().__init__(target, model, **limits)
+        self.horizon = horizon
+
+    def next_setpoint(self, temp, now):
+        model = self.model
+        heating = temp < self.target
+        tau = model.tau_heat if heating else model.tau_cool
+        horizon = self.horizon or max(tau / 3.0, 2.0 * model.dead_time, 1.0)
+
+        # Temperature once the setpoint already sent has worked through the dead time
+        settle = model.ambient + model.gain * (self.setpoint - model.ambient)
+        predicted = settle + (temp - settle) * math.exp(-model.dead_time / tau)
+
+        decay = math.exp(-horizon / tau)
+        needed = (self.target - predicted * decay) / (1.0 - decay)
+        setpoint = model.ambient + (needed - model.ambient) / model.gain
+        return self._limit(temp, setpoint)
+
+
+class PIDShaper(_SetpointShaper):
+    """Feed-forward hold setpoint plus PID correction tuned from the thermal model"""
+    def __init__(self, target, model=None, kp=None, ti=None, td=None, **limits):
+        super().__init__(target, model, **limits)
+        model = self.model
+        # Lambda tuning of a first-order-plus-dead-time plant
+        closed_loop = max(model.dead_time, model.tau_heat / 3.0, 1.0)
+        self.kp = kp if kp is not None else model.tau_heat / (model.gain * (closed_loop + model.dead_time))
+        self.ti = ti if ti is not None else model.tau_heat
+        self.td = td if td is not None else model.dead_time / 2.0
+        self.integral = 0.0
+        self.last_error = None
+        self.last_time = None
+
+    def next_setpoint(self, temp, now):
+        error = self.target - temp
+        dt = 0.0 if self.last_time is None else max(now - self.last_time, 0.0)
+        derivative = 0.0 if self.last_error is None or dt == 0 else (error - self.last_error) / dt
+        integral = self.integral + error * dt
+        output = self.hold_setpoint + self.kp * (error + integral / self.ti + self.td * derivative)
+
+        # Anti-windup: only keep integrating while the output is not saturated
+        if self.low < output < self.high:
+            self.integral = integral
+        self.last_error = error
+        self.last_time = now
+        return self._limit(temp, output)
+
+
+def make_shaper(mode, target, model=None, **limits):
+    """Returns a setpoint shaper for a recipe step, or None for plain plate control"""
+    if not mode or target <= HEATER_OFF_TEMP:
+        return None
+    if mode == "mpc":
+        return ModelPredictiveShaper(target, model, **limits)
+    if mode == "pid":
+        return PIDShaper(target, model, **limits)
+    raise ValueError(f"Unknown control mode: {mode}")
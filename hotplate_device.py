@@ -0,0 +1,346 @@
+######## Hotplate Device I/O Process #######
+# Runs the serial port, polling, watchdog and recipes in a separate process
+# so their timing does not depend on how busy the GUI's Tk / matplotlib
+# process is. Samples are published into a shared-memory ring buffer that the
+# GUI reads; commands and recipe events travel over a multiprocessing pipe.
+# Note: The ring has a single writer (the device process). A reader copies the
+# rows written since its last read and then re-checks the write count, dropping
+# any rows the writer may have overwritten during the copy.
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import hotplate_arbiter
+import hotplate_checkpoint
+import hotplate_link
+import hotplate_runscript
+import hotplate_simulator
+import hotplate_telemetry
+import hotplate_watchdog
+import hotplate_wrapper
+
+RING_SLOTS = 4096                 # samples held in shared memory (over an hour at 1 Hz)
+# time is the time.monotonic() acquisition stamp (the same clock in every process), latency the read's duration
+RING_FIELDS = ("time", "latency", "temp") + hotplate_telemetry.CHANNELS
+CALL_TIMEOUT = 10.0               # s to wait for a command's result
+
+# Commands the GUI may call, and the serial priority they run at
+REMOTE_CALLS = {
+    "set_heater_temp": hotplate_arbiter.OPERATOR,
+    "set_heater_ramp": hotplate_arbiter.OPERATOR,
+    "set_stir": hotplate_arbiter.OPERATOR,
+    "set_many": hotplate_arbiter.OPERATOR,
+    "set_heater_off": hotplate_arbiter.SAFETY,
+    "set_stir_off": hotplate_arbiter.SAFETY,
+}
+
+
+class SampleRing:
+    """Fixed-size sample table in shared memory: an int64 write count, then rows of RING_FIELDS"""
+    HEADER = 8
+
+    def __init__(self, name, create=False, slots=RING_SLOTS):
+        size = self.HEADER + slots * len(RING_FIELDS) * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.slots = slots
+        self.count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.rows = np.ndarray((slots, len(RING_FIELDS)), dtype=np.float64, buffer=self.shm.buf,
+                               offset=self.HEADER)
+        if create:
+            self.count[0] = 0
+        elif os.name == "posix":
+            # Only the creating process unlinks the block; stop this one's tracker claiming it too
+            # (Windows frees the block with its last handle and has no tracker entry to drop)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.read_count = 0
+
+    def write(self, row):
+        """Writer side: stores a row, then publishes it by bumping the count"""
+        n = int(self.count[0])
+        self.rows[n % self.slots] = row
+        self.count[0] = n + 1
+
+    def read_new(self):
+        """Reader side: rows written since the last call, oldest first"""
+        end = int(self.count[0])
+        start = max(self.read_count, end - self.slots)
+        rows = self.rows[np.arange(start, end) % self.slots].copy()
+        # Rows the writer lapped while we copied them are unreliable
+        overwritten = int(self.count[0]) - self.slots
+        if overwritten > start:
+            rows = rows[overwritten - start:]
+        self.read_count = end
+        return rows
+
+    def close(self, unlink=False):
+        # Drop the numpy views before closing the mapping
+        self.count = self.rows = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+### Device process ###
+def device_main(ring_name, conn, port, simulate):
+    """Entry point of the device I/O process"""
+    try:
+        server = DeviceServer(ring_name, conn, port, simulate)
+    except Exception as e:
+        # Tell the GUI straight away rather than leaving it to time out
+        conn.send({"type": "error", "message": str(e)})
+        return
+    server.serve()
+
+
+class DeviceServer:
+    """Owns the port inside the device process and answers the GUI's pipe messages"""
+    def __init__(self, ring_name, conn, port, simulate):
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.ring = SampleRing(ring_name, create=True)
+        self.stop = threading.Event()
+        self.recipe_stop = threading.Event()
+        self.recipe_continue = threading.Event()
+        self.recipe_thread = None
+        self.step = 0
+        self.phase = "idle"
+        try:
+            if simulate:
+                self.ser = hotplate_simulator.SimulatedHotplate()
+            else:
+                self.ser = hotplate_link.SupervisedSerial(lambda: hotplate_wrapper.open_comm(port),
+                                                          on_event=lambda event: self.send(event))
+        except BaseException:
+            self.ring.close(unlink=True)
+            raise
+        self.arbiter = hotplate_arbiter.SerialArbiter()
+        self.arbiter.attach(self.ser)
+        self.watchdog = hotplate_watchdog.Watchdog(self.ser, self.arbiter.lane(hotplate_arbiter.SAFETY),
+                                                   stop_event=self.recipe_stop, on_trip=self.send)
+
+    def send(self, message):
+        with self.send_lock:
+            try:
+                self.conn.send(message)
+            except (OSError, EOFError):
+                self.stop.set()
+
+    def serve(self):
+        self.watchdog.start()
+        threading.Thread(target=self.poll, daemon=True).start()
+        self.send({"type": "ready"})
+        try:
+            while not self.stop.is_set():
+                try:
+                    message = self.conn.recv()
+                except (EOFError, OSError):
+                    break
+                self.handle(message)
+        finally:
+            self.recipe_stop.set()
+            self.watchdog.stop()
+            if self.recipe_thread:
+                self.recipe_thread.join(timeout=5)
+            hotplate_arbiter.print_report(self.arbiter)
+            hotplate_wrapper.close_comm(self.ser)
+            self.ring.close(unlink=True)
+
+    def handle(self, message):
+        kind = message.get("type")
+        if kind == "call":
+            threading.Thread(target=self.call, args=(message,), daemon=True).start()
+        elif kind == "run_recipe":
+            self.run_recipe(message)
+        elif kind == "stop_recipe":
+            self.recipe_stop.set()
+        elif kind == "continue_recipe":
+            self.recipe_continue.set()
+        elif kind == "shutdown":
+            self.stop.set()
+
+    def call(self, message):
+        name = message["name"]
+        reply = {"type": "reply", "id": message["id"]}
+        try:
+            if name not in REMOTE_CALLS:
+                raise ValueError(f"unknown command {name}")
+            with self.arbiter.lane(REMOTE_CALLS[name]):
+                reply["result"] = getattr(hotplate_wrapper, name)(self.ser, *message.get("args", ()))
+        except Exception as e:
+            reply["error"] = str(e)
+        self.send(reply)
+
+    def poll(self):
+        lane = self.arbiter.lane(hotplate_arbiter.TELEMETRY)
+        getters = (hotplate_wrapper.get_temp, hotplate_wrapper.get_target_temp,
+                   hotplate_wrapper.get_ramp, hotplate_wrapper.get_stir)
+        next_poll = time.monotonic()
+        while not self.stop.is_set():
+            values, stamps = [], []
+            for getter in getters:
+                with lane:
+                    requested = time.monotonic()
+                    try:
+                        values.append(getter(self.ser))
+                    except Exception:
+                        values.append(np.nan)
+                    stamps.append((requested, time.monotonic()))
+            # The sample is stamped when the temperature was read
+            requested, received = stamps[0]
+            if np.isfinite(values[0]):
+                self.ring.write([(requested + received) / 2, received - requested, *values, self.step,
+                                 hotplate_telemetry.PHASES.index(self.phase)])
+            next_poll = max(next_poll + hotplate_telemetry.POLL_PERIOD, time.monotonic())
+            self.stop.wait(next_poll - time.monotonic())
+
+    def progress(self, update):
+        kind = update.get("type")
+        if kind == "step_start":
+            self.step = update.get("step", 0)
+        if kind in hotplate_telemetry.PHASE_EVENTS:
+            self.phase = hotplate_telemetry.PHASE_EVENTS[kind]
+        elif kind in ("done", "cancelled", "error"):
+            self.step, self.phase = 0, "idle"
+        self.send({"type": "recipe", "update": update})
+
+    def run_recipe(self, message):
+        if self.recipe_thread and self.recipe_thread.is_alive():
+            self.send({"type": "recipe", "update": {"type": "error", "message": "A recipe is already running"}})
+            return
+        self.recipe_stop.clear()
+        self.recipe_continue.clear()
+
+        def run():
+            try:
+                hotplate_runscript.run_recipe(
+                    self.ser, message["recipe"], progress_callback=self.progress,
+                    stop_event=self.recipe_stop, continue_event=self.recipe_continue,
+                    serial_lock=self.arbiter.lane(hotplate_arbiter.RECIPE),
+                    control_mode=message.get("control_mode"),
+                    checkpoint_path=hotplate_checkpoint.CHECKPOINT_FILE, resume=message.get("resume"))
+            except Exception as e:
+                self.progress({"type": "error", "message": str(e)})
+
+        self.recipe_thread = threading.Thread(target=run, daemon=True)
+        self.recipe_thread.start()
+
+
+### GUI side ###
+class DeviceClient:
+    """Starts the device process and talks to it; stands in for the port object in the GUI.
+
+    on_message(message) is called from a reader thread for every message that
+    is not a command reply (recipe updates, watchdog trips, link events).
+    """
+    def __init__(self, port="COM3", simulate=False, on_message=None):
+        self.port = port
+        self.name = "SIM" if simulate else port
+        self.on_message = on_message
+        self.ring_name = f"hotplate_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.send_lock = threading.Lock()
+        self.replies = {}
+        self.ring = None
+        self.start_error = None
+        self.ready = threading.Event()
+        self.process = multiprocessing.Process(target=device_main, args=(self.ring_name, child_conn, port, simulate),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+        if not self.ready.wait(CALL_TIMEOUT) or self.ring is None:
+            self.close()
+            raise ConnectionError(self.start_error or "Device process did not start")
+
+    def _send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def _read(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind = message.get("type")
+            if kind == "ready":
+                self.ring = SampleRing(self.ring_name)
+                self.ready.set()
+            elif kind == "error" and not self.ready.is_set():
+                self.start_error = message["message"]
+                self.ready.set()
+            elif kind == "reply":
+                waiter = self.replies.pop(message["id"], None)
+                if waiter:
+                    waiter[1].update(message)
+                    waiter[0].set()
+            elif self.on_message:
+                self.on_message(message)
+        self.ready.set()
+        for event, _ in list(self.replies.values()):
+            event.set()
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def call(self, name, *args, timeout=CALL_TIMEOUT):
+        """Runs a hotplate_wrapper set command in the device process and returns its result"""
+        call_id = uuid.uuid4().hex
+        done, reply = threading.Event(), {}
+        self.replies[call_id] = (done, reply)
+        self._send({"type": "call", "id": call_id, "name": name, "args": args})
+        if not done.wait(timeout) or not reply:
+            self.replies.pop(call_id, None)
+            raise TimeoutError(f"No reply from the device process to {name}")
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def run_recipe(self, recipe, control_mode=None, resume=None):
+        self._send({"type": "run_recipe", "recipe": recipe, "control_mode": control_mode, "resume": resume})
+
+    def stop_recipe(self):
+        self._send({"type": "stop_recipe"})
+
+    def continue_recipe(self):
+        self._send({"type": "continue_recipe"})
+
+    def read_samples(self):
+        """New samples as polling-queue dicts (as background polling produces, less elapsed)"""
+        if self.ring is None:
+            return []
+        samples = []
+        for row in self.ring.read_new():
+            values = dict(zip(RING_FIELDS, (None if np.isnan(v) else float(v) for v in row)))
+            samples.append({
+                "acquired": values["time"],
+                "latency": values["latency"],
+                "current_temp": values["temp"],
+                "setpoint_temp": values["setpoint"],
+                "ramp_rate": None if values["ramp"] is None else int(values["ramp"]),
+                "stir_speed": None if values["stir"] is None else int(values["stir"]),
+                "step": int(values["step"] or 0),
+                "phase": hotplate_telemetry.PHASES[int(values["phase"] or 0)]
+            })
+        return samples
+
+    def close(self):
+        try:
+            self._send({"type": "shutdown"})
+        except (OSError, EOFError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        self.conn.close()
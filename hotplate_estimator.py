@@ -0,0 +1,374 @@
+######## Hotplate Recipe Estimator - Offline Dry Run #######
+# Simulates a compiled recipe against a first-order thermal model so the run
+# time of a recipe is known before any wafers are loaded.
+# Note: The phase logic mirrors run_recipe in hotplate_runscript.py.
+
+import numpy as np
+
+import hotplate_ramps
+import hotplate_recipe
+
+HEATER_OFF_TEMP = 25          # run_recipe turns the heater off at or below this target
+FINAL_COOLING_THRESHOLD = 30  # run_recipe waits for the plate to cool below this on the last step
+SAMPLE_PERIOD = 1.0           # s between stabilization samples (5 polls x 0.2 s)
+STABILIZE_SAMPLES = 5         # samples within +/-1 C needed when stabilize == 1
+STEP_OVERHEAD = 0.2           # s spent on set temp/ramp/stir + get temp (replies end at their CR)
+TRACE_POINTS = 20000          # the predicted trace is thinned to at most this many points
+CONVERGED = 0.05              # °C, a repeat cycle ending this close to its start state repeats exactly
+MAX_SIMULATED_CYCLES = 20     # cycles of a repeat simulated before the rest are taken to match the last
+
+
+class ThermalModel:
+    """First-order plate model: gain, time constants, dead time and heater limit"""
+    def __init__(self, ambient=22.0, gain=1.0, tau_heat=180.0, tau_cool=900.0,
+                 dead_time=10.0, max_heat_rate=600.0):
+        self.ambient = ambient              # °C
+        self.gain = gain                    # steady-state plate rise per setpoint rise
+        self.tau_heat = tau_heat            # s, time constant while heating
+        self.tau_cool = tau_cool            # s, time constant while cooling
+        self.dead_time = dead_time          # s
+        self.max_heat_rate = max_heat_rate  # °C/hr, fastest ramp the heater can follow
+
+    def steady_state(self, setpoint):
+        """Plate temperature the model settles at for a given setpoint"""
+        if setpoint <= HEATER_OFF_TEMP:
+            return self.ambient
+        return self.ambient + self.gain * (setpoint - self.ambient)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(**{k: v for k, v in values.items() if k in cls().__dict__})
+
+
+def step_response(t, start_temp, setpoint, ramp_rate, model):
+    """Plate temperature at times t (s, array) after a setpoint change"""
+    t = np.asarray(t, dtype=float)
+    final = model.steady_state(setpoint)
+    heating = final > start_temp
+    tau = model.tau_heat if heating else model.tau_cool
+    direction = 1.0 if heating else -1.0
+    if setpoint <= HEATER_OFF_TEMP or not heating:
+        # Cooling is limited by the plate, not by the programmed ramp
+        rate = np.inf
+    else:
+        rate = min(ramp_rate if ramp_rate > 0 else np.inf, model.max_heat_rate) / 3600.0
+
+    tt = np.maximum(t - model.dead_time, 0.0)
+    if np.isinf(rate):
+        return final + (start_temp - final) * np.exp(-tt / tau)
+
+    # Response of a first-order lag to a rate-limited ramp that ends at ramp_time
+    ramp_time = abs(final - start_temp) / rate
+    lag = direction * rate * tau
+    in_ramp = start_temp + direction * rate * tt - lag * (1.0 - np.exp(-tt / tau))
+    ramp_error = lag * (1.0 - np.exp(-ramp_time / tau))
+    after_ramp = final - ramp_error * np.exp(-np.maximum(tt - ramp_time, 0.0) / tau)
+    return np.where(tt <= ramp_time, in_ramp, after_ramp)
+
+
+def _settle_horizon(start_temp, setpoint, ramp_rate, model):
+    """Time span long enough for the step response to settle"""
+    final = model.steady_state(setpoint)
+    rate = min(ramp_rate if ramp_rate > 0 else np.inf, model.max_heat_rate) / 3600.0
+    ramp_time = abs(final - start_temp) / rate if rate > 0 else 0.0
+    tau = max(model.tau_heat, model.tau_cool)
+    return model.dead_time + ramp_time + 12.0 * tau
+
+
+def _first_index(mask):
+    """Index of the first True in mask, or None"""
+    if not mask.any():
+        return None
+    return int(np.argmax(mask))
+
+
+def _stabilize_time(t, temps, target, stabilize):
+    """Time at which run_recipe's stabilization loop would exit, or None"""
+    if stabilize == 1:
+        if len(temps) < STABILIZE_SAMPLES:
+            return None
+        windows = np.lib.stride_tricks.sliding_window_view(temps, STABILIZE_SAMPLES)
+        first = windows[:, :1]
+        stable = (np.abs(windows - first) <= 1).all(axis=1) & (np.abs(first[:, 0] - target) <= 1)
+        index = _first_index(stable)
+        return None if index is None else t[index + STABILIZE_SAMPLES - 1]
+    index = _first_index(np.abs(temps - target) <= 2)
+    return None if index is None else t[index]
+
+
+class _Trace:
+    """Predicted temperature trace, thinned by halves to stay under max_points"""
+    def __init__(self, max_points=TRACE_POINTS, stride=1):
+        self.max_points = max_points
+        self.stride = stride
+        self.parts = []
+        self.size = 0
+
+    def add(self, t, temps, steps, thinned=False):
+        if not thinned:
+            t, temps, steps = t[::self.stride], temps[::self.stride], steps[::self.stride]
+        self.parts.append((t, temps, steps))
+        self.size += len(t)
+        while self.size > self.max_points:
+            self.parts = [tuple(column[::2] for column in self.columns())]
+            self.size = len(self.parts[0][0])
+            self.stride *= 2
+
+    def tile(self, cycle, cycles, period, size):
+        """Adds the trace of one repeat cycle cycles times, shifted by period s and size steps per cycle"""
+        t, temps, steps = cycle.columns()
+        if not len(t) or cycles <= 0:
+            return
+        # Only the points that survive thinning are generated
+        stride = max(self.stride, int(np.ceil(len(t) * cycles / self.max_points)))
+        repeat, offset = np.divmod(np.arange(0, len(t) * cycles, stride), len(t))
+        self.add(t[offset] + repeat * period, temps[offset], steps[offset] + repeat * size, thinned=True)
+
+    def columns(self):
+        if not self.parts:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=np.int32)
+        return tuple(np.concatenate([part[i] for part in self.parts]) for i in range(3))
+
+
+class _Estimator:
+    """Walks a recipe tree, simulating each repeat only until its cycles repeat exactly"""
+    def __init__(self, model, start_temp, total_steps, step_overhead):
+        self.model = model
+        self.temp = self.setpoint = start_temp
+        self.total_steps = total_steps
+        self.step_overhead = step_overhead
+        self.clock = 0.0
+        self.number = 0
+        self.trace = _Trace()
+
+    def run(self, nodes):
+        """Estimate items for a list of recipe nodes: step results and repeat blocks"""
+        items = []
+        for node in nodes:
+            if isinstance(node, hotplate_recipe._Repeat):
+                items += self.repeat(node)
+            else:
+                self.number += 1
+                items.append(self.step(node, self.number))
+        return items
+
+    def repeat(self, node):
+        items = []
+        parent = self.trace
+        # The recipe's final step (and its cooling) is never extrapolated
+        holds_last = self.number + node.size == self.total_steps
+        for cycle in range(node.count):
+            first, started, start_state = self.number + 1, self.clock, (self.temp, self.setpoint)
+            remaining = node.count - cycle - holds_last
+            self.trace = _Trace(stride=parent.stride)
+            body = self.run(node.body)
+            cycle_trace, self.trace = self.trace, parent
+            settled = (abs(self.temp - start_state[0]) <= CONVERGED
+                       and abs(self.setpoint - start_state[1]) <= CONVERGED)
+            if remaining > 1 and (settled or cycle + 1 >= MAX_SIMULATED_CYCLES):
+                # Every remaining cycle starts where this one did, so it repeats this one exactly
+                period = self.clock - started
+                self.trace.tile(cycle_trace, remaining, period, node.cycle)
+                items.append({"first": first, "size": node.cycle, "cycles": remaining, "body": body,
+                              "cycle_duration": _items_duration(body),
+                              "duration": _items_duration(body) * remaining})
+                self.clock = started + period * remaining
+                self.number = first - 1 + node.cycle * remaining
+                for _ in range(node.count - cycle - remaining):
+                    items += self.run(node.body)
+                return items
+            self.trace.add(*cycle_trace.columns(), thinned=True)
+            items += body
+        return items
+
+    def step(self, step, number):
+        """Simulates one step from the current plate state and returns its result"""
+        model = self.model
+        temp = self.temp
+        if step.get("kind") == "profile":
+            # Streamed profiles take exactly their programmed time; the plate is
+            # assumed to track the slowly moving setpoint
+            times, points = hotplate_ramps.resolve_points(step, self.setpoint)
+            span = np.arange(0.0, times[-1] + SAMPLE_PERIOD, SAMPLE_PERIOD)
+            span_temps = hotplate_ramps.profile_setpoints(times, points, span, step["interp"])
+            self.trace.add(self.clock + span, span_temps, np.full(len(span), number, dtype=np.int32))
+            self.clock += times[-1]
+            self.temp = self.setpoint = float(span_temps[-1])
+            return {
+                "step": number,
+                "target_temp": float(points[-1]),
+                "start_temp": temp,
+                "end_temp": self.temp,
+                "stabilize_seconds": 0.0,
+                "dwell_seconds": float(times[-1]),
+                "cooling_seconds": 0.0,
+                "duration": float(times[-1]),
+                "reachable": True
+            }
+
+        target = step["target_temp"]
+        self.setpoint = target
+        ramp = step["ramp_rate"]
+        dwell = step["dwell_seconds"]
+        step_start = self.clock
+        stabilize_seconds = 0.0
+        cooling_seconds = 0.0
+        reachable = True
+        self.clock += self.step_overhead
+
+        horizon = _settle_horizon(temp, target, ramp, model)
+        t = np.arange(0.0, horizon + SAMPLE_PERIOD, SAMPLE_PERIOD)
+        response = step_response(t, temp, target, ramp, model)
+
+        already_at_temp = abs(temp - target) <= 2
+        if not already_at_temp and dwell >= 0:
+            exit_time = _stabilize_time(t, response, target, step["stabilize"])
+            if exit_time is None:
+                reachable = False
+                exit_time = t[-1]
+            stabilize_seconds = exit_time if reachable else float("inf")
+        else:
+            exit_time = 0.0
+        dwell_seconds = max(dwell, 0) if reachable else 0.0
+
+        # Dwell continues along the same response curve
+        elapsed = exit_time + dwell_seconds
+        is_last = number == self.total_steps
+        if reachable and is_last and target < FINAL_COOLING_THRESHOLD and not (
+                step["stir_speed"] == 0 and dwell == 0):
+            cooling_t = np.arange(elapsed, max(elapsed, t[-1]) + SAMPLE_PERIOD, SAMPLE_PERIOD)
+            cooled = _first_index(step_response(cooling_t, temp, target, ramp, model)
+                                  <= FINAL_COOLING_THRESHOLD)
+            if cooled is None:
+                reachable = False
+                cooling_seconds = float("inf")
+                end = cooling_t[-1]
+            else:
+                cooling_seconds = cooling_t[cooled] - elapsed
+                end = cooling_t[cooled]
+        else:
+            end = elapsed
+
+        span = np.arange(0.0, end + SAMPLE_PERIOD, SAMPLE_PERIOD)
+        span_temps = step_response(span, temp, target, ramp, model)
+        self.trace.add(self.clock + span, span_temps, np.full(len(span), number, dtype=np.int32))
+        self.temp = float(span_temps[-1])
+        self.clock += span[-1]
+
+        return {
+            "step": number,
+            "target_temp": target,
+            "start_temp": temp,
+            "end_temp": self.temp,
+            "stabilize_seconds": stabilize_seconds,
+            "dwell_seconds": dwell_seconds,
+            "cooling_seconds": cooling_seconds,
+            "duration": self.clock - step_start if reachable else float("inf"),
+            "reachable": reachable
+        }
+
+
+def _items_duration(items):
+    return float(sum(item["duration"] for item in items))
+
+
+def estimate_recipe(steps, model=None, start_temp=None, step_overhead=STEP_OVERHEAD):
+    """Simulates a compiled recipe and returns per-step and total ETA plus a temperature trace.
+
+    steps is the Recipe returned by hotplate_runscript.compile_recipe (or a
+    list of step dicts). "steps" in the result lists a result per step, except
+    that a repeat whose cycles have become identical is one block (first step,
+    size, cycles, body) holding a single cycle's results; use step_result()
+    and seconds_after() rather than indexing it. The trace is thinned to at
+    most TRACE_POINTS points, so cost does not grow with the cycle count.
+    Durations are float('inf') when the model never meets a step's exit condition.
+    """
+    model = model or ThermalModel()
+    temp = model.ambient if start_temp is None else float(start_temp)
+    estimator = _Estimator(model, temp, len(steps), step_overhead)
+    items = estimator.run(getattr(steps, "body", steps))
+    times, temps, step_index = estimator.trace.columns()
+    return {
+        "steps": items,
+        "total_seconds": _items_duration(items),
+        "times": times,
+        "temps": temps,
+        "step_index": step_index
+    }
+
+
+def _block_end(item):
+    return item["first"] + item["size"] * item["cycles"]
+
+
+def _find(items, step):
+    for item in items:
+        if "cycles" in item:
+            if item["first"] <= step < _block_end(item):
+                return _find(item["body"], item["first"] + (step - item["first"]) % item["size"])
+        elif item["step"] == step:
+            return item
+    return None
+
+
+def _after(items, step):
+    total = 0.0
+    for item in items:
+        if "cycles" not in item:
+            total += item["duration"] if item["step"] > step else 0.0
+        elif step < item["first"]:
+            total += item["duration"]
+        elif step < _block_end(item):
+            cycle, offset = divmod(step - item["first"], item["size"])
+            total += _after(item["body"], item["first"] + offset)
+            if item["cycles"] - cycle - 1 > 0:
+                total += item["cycle_duration"] * (item["cycles"] - cycle - 1)
+    return total
+
+
+def step_result(estimate, step):
+    """The estimated result of step number step (1-based), or None"""
+    return _find(estimate["steps"], step)
+
+
+def seconds_after(estimate, step):
+    """Estimated time of the steps after step number step"""
+    return _after(estimate["steps"], step)
+
+
+def remaining_seconds(estimate, step, step_elapsed=0.0):
+    """Estimated time left in a recipe that is step_elapsed s into a step"""
+    result = step_result(estimate, step)
+    if result is None:
+        return 0.0
+    return max(result["duration"] - step_elapsed, 0.0) + seconds_after(estimate, step)
+
+
+def format_duration(seconds):
+    """hh:mm:ss, or -- when the estimate is unbounded"""
+    if seconds is None or not np.isfinite(seconds):
+        return "--"
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def _print_items(items, indent=""):
+    for r in items:
+        if "cycles" in r:
+            print(f"{indent}Steps {r['first']}-{_block_end(r) - 1}: {r['cycles']} identical cycles of "
+                  f"{format_duration(r['cycle_duration'])}, each:")
+            _print_items(r["body"], indent + "    ")
+            continue
+        print(f"{indent}{r['step']:>4}  {r['target_temp']:>9}  {format_duration(r['stabilize_seconds']):<10}  "
+              f"{format_duration(r['dwell_seconds']):<10}  {format_duration(r['cooling_seconds']):<10}  "
+              f"{format_duration(r['duration'])}")
+
+
+def print_estimate(estimate):
+    """Prints a per-step ETA table"""
+    print("Step  Target(C)  Stabilize   Dwell       Cooling     Step total")
+    _print_items(estimate["steps"])
+    print(f"Total estimated time: {format_duration(estimate['total_seconds'])}")
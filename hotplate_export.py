@@ -0,0 +1,131 @@
+######## Hotplate Telemetry Export #######
+# Streams the in-memory temperature history to a file in fixed-size chunks, so
+# a day-long history is exported in the background with progress and cancel
+# while acquisition carries on, without ever holding a second copy of it.
+# Formats: the telemetry CSV replay, analytics and the catalog read, or a
+# compact columnar .npz (one compressed float32 / float64 array per column).
+# Note: The history is exported up to the newest sample at the moment the
+# export starts. The file is written under a .part name and only renamed into
+# place once complete, so a cancelled or failed export leaves nothing behind.
+
+import csv
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from hotplate_telemetry import CSV_HEADER, PHASES, SERIES_COLUMNS, csv_rows
+
+CHUNK_ROWS = 5000            # rows read from the history per chunk
+COPY_BLOCK = 1 << 20         # bytes copied at a time into the .npz
+
+NPZ_TYPES = {name: np.float64 if name == "time" else np.float32 for name in SERIES_COLUMNS}
+
+FORMATS = {".csv": "CSV", ".npz": "Columnar (NumPy .npz)"}
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_HEADER)
+
+    def write(self, series):
+        self.writer.writerows(csv_rows(series))
+
+    def finish(self):
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+
+
+class _NpzWriter:
+    """Spools each column to a temporary file, then streams them into the archive.
+
+    The row count (part of each .npy header) is only known at the end, since
+    the history may change shape while it is read.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.spools = {name: tempfile.TemporaryFile() for name in SERIES_COLUMNS}
+        self.rows = 0
+
+    def write(self, series):
+        for name, spool in self.spools.items():
+            spool.write(np.ascontiguousarray(series[name], dtype=NPZ_TYPES[name]).tobytes())
+        self.rows += len(series["time"])
+
+    def finish(self):
+        with zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, spool in self.spools.items():
+                spool.seek(0)
+                header = {"descr": np.lib.format.dtype_to_descr(np.dtype(NPZ_TYPES[name])),
+                          "fortran_order": False, "shape": (self.rows,)}
+                with archive.open(name + ".npy", 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, header)
+                    while block := spool.read(COPY_BLOCK):
+                        member.write(block)
+            # Phase indices refer to these names
+            with archive.open("phase_names.npy", 'w') as member:
+                np.save(member, np.array(PHASES))
+        self.abort()
+
+    def abort(self):
+        for spool in self.spools.values():
+            spool.close()
+
+
+WRITERS = {".csv": _CsvWriter, ".npz": _NpzWriter}
+
+
+def export_history(temp_data, path, progress=None, stop_event=None, chunk_rows=CHUNK_ROWS):
+    """Writes a TemperatureData history to path (.csv or .npz) chunk by chunk.
+
+    progress(rows written, rows expected) is called after every chunk;
+    setting stop_event cancels the export (ExportCancelled is raised and no
+    file is written). Safe to call from a worker thread while samples are
+    being added. Returns the number of rows written.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported export format {extension or path} (use .csv or .npz)")
+    until = temp_data.last_time
+    if until is None:
+        until = np.inf
+    expected = temp_data.count(until)
+
+    partial = path + ".part"
+    writer = WRITERS[extension](partial)
+    written, after = 0, -np.inf
+    try:
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                raise ExportCancelled(path)
+            series = temp_data.chunk(after, until, chunk_rows)
+            if not len(series["time"]):
+                break
+            writer.write(series)
+            written += len(series["time"])
+            after = series["time"][-1]
+            if progress:
+                progress(written, max(expected, written))
+        writer.finish()
+    except BaseException:
+        writer.abort()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return written
+
+
+def load_npz(path):
+    """Loads a columnar export into a dict of numpy columns keyed like get_series()"""
+    with np.load(path) as archive:
+        return {name: archive[name].astype(float) for name in SERIES_COLUMNS if name in archive.files}
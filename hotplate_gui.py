@@ -3,52 +3,65 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import threading
 import time
-import csv
 import os
-from queue import Queue
-from collections import deque
+from queue import Queue, Empty
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
-import matplotlib.dates as mdates
-from matplotlib.ticker import FuncFormatter
-from datetime import datetime, timedelta
 import hotplate_wrapper as hw
 import hotplate_runscript as runscript
-
-class TemperatureData:
-    """Manages temperature history"""
-    def __init__(self, max_points=86400):  # 24 hours at 1 second intervals
-        self.timestamps = deque(maxlen=max_points)
-        self.temperatures = deque(maxlen=max_points)
-        self.start_time = time.time()
-    
-    def add_point(self, temp):
-        elapsed = time.time() - self.start_time
-        self.timestamps.append(elapsed)  # Time in seconds
-        self.temperatures.append(temp)
-    
-    def get_data(self):
-        return list(self.timestamps), list(self.temperatures)
-    
-    def clear(self):
-        self.timestamps.clear()
-        self.temperatures.clear()
-        self.start_time = time.time()
+import hotplate_estimator as estimator
+import hotplate_identify as identify
+import hotplate_checkpoint as checkpoints
+import hotplate_jobqueue as jobqueue
+import hotplate_simulator as simulator
+import hotplate_replay as replay
+import hotplate_link as link
+import hotplate_watchdog as watchdog
+import hotplate_arbiter as arbiter
+import hotplate_render as render
+import hotplate_device as device
+import hotplate_catalog as catalog
+import hotplate_export as export
+import hotplate_profiler as profiler
+import hotplate_telemetry as telemetry
+from hotplate_telemetry import TemperatureData
+import argparse
 
 class HotplateGUI:
-    def __init__(self, root):
+    # Recipe stabilization control modes, see hotplate_control
+    CONTROL_MODES = {"Plate only": None, "Model predictive": "mpc", "PID feed-forward": "pid"}
+
+    def __init__(self, root, simulate=False, render_worker=True, device_process=False):
         self.root = root
+        self.simulate = simulate
+        self.device_process = device_process
+        self.render_worker = render_worker
+        self.renderer = None
+        self.plot_photo = None
         self.root.title("Hotplate Control Interface")
         self.root.state('zoomed')  # Maximize window on startup
         
-        # Backend connection
+        # Backend connection (with device_process, self.ser is the DeviceClient of the I/O process)
         self.ser = None
+        self.device = None
         self.connected = False
         self.temp_data = TemperatureData()
+        self.sampling_stats = telemetry.SamplingStats()
         
-        # Serial communication lock
-        self.serial_lock = threading.Lock()
+        # Serial port access, arbitrated by priority: safety > operator > recipe > telemetry
+        self.serial_arbiter = arbiter.SerialArbiter()
+        self.safety_lane = self.serial_arbiter.lane(arbiter.SAFETY)
+        self.operator_lane = self.serial_arbiter.lane(arbiter.OPERATOR)
+        self.recipe_lane = self.serial_arbiter.lane(arbiter.RECIPE)
+        self.telemetry_lane = self.serial_arbiter.lane(arbiter.TELEMETRY)
+
+        # Over-temperature / stale-data watchdog (started on connect)
+        self.watchdog = None
         
+        # Telemetry replay
+        self.replayer = None
+        self.replay_seeking = False
+
         # Background polling thread
         self.polling_queue = Queue()
         self.polling_stop = threading.Event()
@@ -59,15 +72,47 @@ class HotplateGUI:
         self.recipe_stop = threading.Event()
         self.recipe_continue = threading.Event()
         self.recipe_thread = None
+        self.device_recipe_outcome = Queue()
         self.recipe_window = None
         self.recipe_labels = {}
         self.recipe_continue_button = None
+        self.recipe_estimate = None
+        self.recipe_estimate_token = None
+        self.recipe_eta_step = 0
+        self.recipe_eta_step_started = 0
+        # Recipe step and phase recorded with each telemetry sample
+        self.recipe_step = 0
+        self.recipe_phase = "idle"
+
+        # Index of recorded runs; each finished recipe run is saved and added to it
+        self.run_catalog = catalog.RunCatalog()
+        self.catalog_window = None
+        self.catalog_tree = None
+        self.catalog_steps_tree = None
+        self.catalog_filters = {}
+
+        # Recipe job queue (opened per plate on connect)
+        self.job_queue = None
+        self.job_queue_running = False
+        self.job_queue_window = None
+        self.job_queue_tree = None
+        self.job_queue_reorder = tk.BooleanVar(value=True)
+        self.current_job = None
+        self.last_job_temp = None
         
         # Command worker for async button operations
         self.command_queue = Queue()
         self.command_stop = threading.Event()
         self.command_thread = None
-        self.operation_in_progress = False
+
+        # Background export of the temperature history
+        self.export_thread = None
+        self.export_stop = threading.Event()
+
+        # Manual plate commands: pending settings keyed by what they change, sent by their own worker
+        self.manual_pending = {}
+        self.manual_ready = threading.Condition()
+        self.manual_thread = None
         
         # Create GUI
         self.create_widgets()
@@ -80,6 +125,8 @@ class HotplateGUI:
         self.command_stop.clear()
         self.command_thread = threading.Thread(target=self.command_worker, daemon=True)
         self.command_thread.start()
+        self.manual_thread = threading.Thread(target=self.manual_worker, daemon=True)
+        self.manual_thread.start()
         
         # Handle window close
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -157,6 +204,11 @@ class HotplateGUI:
         self.stir_speed_value = ttk.Label(self.display_frame, text="-- RPM", 
                                           font=("Arial", 11), foreground="darkorange")
         self.stir_speed_value.grid(row=3, column=1, sticky=tk.E, pady=3)
+
+        # Sample timing: interval, jitter, gaps and read latency
+        ttk.Label(self.display_frame, text="Sampling:").grid(row=4, column=0, sticky=tk.W, pady=3)
+        self.sampling_value = ttk.Label(self.display_frame, text="--", font=("Arial", 9))
+        self.sampling_value.grid(row=4, column=1, sticky=tk.E, pady=3)
         
         self.display_frame.columnconfigure(1, weight=1)
         
@@ -190,6 +242,11 @@ class HotplateGUI:
         self.set_stir_button = ttk.Button(self.control_frame, text="Set Stir Speed", 
                                           command=self.set_stir_speed)
         self.set_stir_button.pack(fill=tk.X, pady=(0, 8))
+
+        # Temperature, ramp and stir in one transaction
+        self.apply_all_button = ttk.Button(self.control_frame, text="Apply All",
+                                           command=self.apply_all)
+        self.apply_all_button.pack(fill=tk.X, pady=(0, 8))
         
         # Off buttons
         self.heater_off_button = ttk.Button(self.control_frame, text="Turn Off Heater", 
@@ -200,49 +257,120 @@ class HotplateGUI:
                                           command=self.turn_off_stirrer)
         self.stir_off_button.pack(fill=tk.X, pady=(0, 5))
 
+        # Outcome and latency of the last manual commands (non-modal)
+        self.command_status_label = ttk.Label(self.control_frame, text="", foreground="gray", wraplength=220)
+        self.command_status_label.pack(anchor=tk.W, fill=tk.X, pady=(0, 5))
+
         # Recipe button
         self.recipe_button = ttk.Button(self.control_frame, text="Run Recipe", 
                         command=self.run_recipe_prompt)
         self.recipe_button.pack(fill=tk.X, pady=(0, 5))
+
+        # Job queue button
+        self.job_queue_button = ttk.Button(self.control_frame, text="Job Queue...",
+                                           command=self.open_job_queue_window)
+        self.job_queue_button.pack(fill=tk.X, pady=(0, 5))
+
+        # Recipe control mode
+        ttk.Label(self.control_frame, text="Recipe Stabilization Control:").pack(anchor=tk.W, pady=(5, 2))
+        self.control_mode_input = ttk.Combobox(self.control_frame, state="readonly",
+                                               values=list(self.CONTROL_MODES.keys()))
+        self.control_mode_input.set("Plate only")
+        self.control_mode_input.pack(fill=tk.X, pady=(0, 5))
         
         # Store control widgets for enable/disable
         self.control_widgets = [
             self.set_temp_input, self.set_temp_button,
             self.set_ramp_input, self.set_ramp_button,
-            self.set_stir_input, self.set_stir_button,
+            self.set_stir_input, self.set_stir_button, self.apply_all_button,
             self.heater_off_button, self.stir_off_button,
-            self.recipe_button
+            self.recipe_button, self.job_queue_button
         ]
         
         # ===== RIGHT PANEL: PLOT =====
         self.plot_frame = ttk.LabelFrame(self.main_frame, text="Temperature Plot", padding=8)
         self.plot_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         
-        # Create matplotlib figure
-        self.figure = Figure(figsize=(6, 5), dpi=100)
-        self.ax = self.figure.add_subplot(111)
-        self.ax.set_xlabel("Time (hh:mm:ss)")
-        self.ax.set_ylabel("Temperature (°C)")
-        self.ax.set_title("Temperature vs Time")
-        self.ax.grid(True, alpha=0.3)
-        
-        # Embed in tkinter
-        self.canvas = FigureCanvasTkAgg(self.figure, master=self.plot_frame)
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        if self.render_worker:
+            # The render worker rasterizes off the Tk thread; Tk only shows the finished image
+            self.renderer = render.PlotRenderer(dpi=100)
+            self.plot_canvas = tk.Canvas(self.plot_frame, width=600, height=500, bg="white", highlightthickness=0)
+            self.plot_canvas.pack(fill=tk.BOTH, expand=True)
+            self.plot_image_item = self.plot_canvas.create_image(0, 0, anchor=tk.NW)
+            self.plot_canvas.bind("<Configure>", lambda event: self.update_plot())
+        else:
+            # Create matplotlib figure
+            self.figure = Figure(figsize=(6, 5), dpi=100)
+            self.ax = self.figure.add_subplot(111)
+            self.ax.set_xlabel("Time (hh:mm:ss)")
+            self.ax.set_ylabel("Temperature (°C)")
+            self.ax.set_title("Temperature vs Time")
+            self.ax.grid(True, alpha=0.3)
+            
+            # Embed in tkinter
+            self.canvas = FigureCanvasTkAgg(self.figure, master=self.plot_frame)
+            self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
         # Plot control buttons frame
         self.plot_buttons_frame = ttk.Frame(self.plot_frame)
         self.plot_buttons_frame.pack(fill=tk.X, pady=(5, 0))
         
-        # Save CSV button
-        self.save_csv_button = ttk.Button(self.plot_buttons_frame, text="Save Plot as CSV", 
-                                          command=self.save_csv)
-        self.save_csv_button.pack(side=tk.LEFT, padx=(0, 5))
+        # Export button
+        self.export_button = ttk.Button(self.plot_buttons_frame, text="Export Data...",
+                                        command=self.export_data)
+        self.export_button.pack(side=tk.LEFT, padx=(0, 5))
         
         # Clear button
         self.clear_button = ttk.Button(self.plot_buttons_frame, text="Clear Plot Data", 
                                        command=self.clear_plot_data)
         self.clear_button.pack(side=tk.LEFT)
+
+        # Whole-run view instead of the last 12 hours
+        self.full_history = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.plot_buttons_frame, text="Full history", variable=self.full_history,
+                        command=self.update_plot).pack(side=tk.LEFT, padx=(5, 0))
+
+        # Replay button
+        self.replay_button = ttk.Button(self.plot_buttons_frame, text="Replay Log...",
+                                        command=self.open_replay)
+        self.replay_button.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Run catalog button
+        self.catalog_button = ttk.Button(self.plot_buttons_frame, text="Run Catalog...",
+                                         command=self.open_catalog_window)
+        self.catalog_button.pack(side=tk.LEFT, padx=(5, 0))
+
+        # Export progress (shown while an export runs)
+        self.export_frame = ttk.Frame(self.plot_frame)
+        self.export_progress = ttk.Progressbar(self.export_frame, orient=tk.HORIZONTAL, mode="determinate")
+        self.export_progress.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.export_label = ttk.Label(self.export_frame, text="")
+        self.export_label.pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.export_frame, text="Cancel", command=self.cancel_export).pack(side=tk.LEFT)
+
+        # Replay controls (shown while a log is replaying)
+        self.replay_frame = ttk.Frame(self.plot_frame)
+        self.replay_play_button = ttk.Button(self.replay_frame, text="Pause", width=7,
+                                             command=self.toggle_replay_pause)
+        self.replay_play_button.pack(side=tk.LEFT)
+        self.replay_speed_input = ttk.Combobox(self.replay_frame, state="readonly", width=6,
+                                               values=["1x", "10x", "100x"])
+        self.replay_speed_input.set("1x")
+        self.replay_speed_input.bind("<<ComboboxSelected>>", self.change_replay_speed)
+        self.replay_speed_input.pack(side=tk.LEFT, padx=(5, 0))
+        self.replay_position = tk.DoubleVar(value=0)
+        self.replay_scale = ttk.Scale(self.replay_frame, orient=tk.HORIZONTAL, variable=self.replay_position)
+        self.replay_scale.bind("<ButtonPress-1>", self.start_replay_seek)
+        self.replay_scale.bind("<ButtonRelease-1>", self.finish_replay_seek)
+        self.replay_scale.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.replay_time_label = ttk.Label(self.replay_frame, text="00:00:00")
+        self.replay_time_label.pack(side=tk.LEFT)
+        ttk.Button(self.replay_frame, text="Stop Replay", command=self.stop_replay).pack(side=tk.LEFT, padx=(5, 0))
+
+        # Fit thermal model button
+        self.fit_model_button = ttk.Button(self.plot_buttons_frame, text="Fit Thermal Model",
+                                           command=self.fit_thermal_model)
+        self.fit_model_button.pack(side=tk.LEFT, padx=(5, 0))
     
     def create_layout(self):
         """Layout is created in create_widgets for tkinter"""
@@ -259,17 +387,33 @@ class HotplateGUI:
         """Establish connection to hotplate (runs in worker thread)"""
         try:
             self.update_connection_status(False, "Connecting...")
-            self.ser = hw.open_comm()
+            if self.device_process:
+                # Port, polling, watchdog and recipes live in the device I/O process
+                self.device = device.DeviceClient(simulate=self.simulate, on_message=self.on_device_message)
+                self.ser = self.device
+            elif self.simulate:
+                self.ser = simulator.SimulatedHotplate()
+            else:
+                self.ser = link.SupervisedSerial(hw.open_comm, on_event=self.on_link_event)
             self.connected = True
+            self.job_queue = jobqueue.JobQueue(identify.device_name(self.ser))
+            if not self.device:
+                self.serial_arbiter.attach(self.ser)
+                self.watchdog = watchdog.Watchdog(self.ser, self.safety_lane, stop_event=self.recipe_stop,
+                                                  on_trip=self.on_watchdog_trip)
+                self.watchdog.start()
             self.temp_data.clear()
+            self.sampling_stats.clear()
             
             # Start background polling thread
             self.polling_stop.clear()
-            self.polling_thread = threading.Thread(target=self.background_polling, daemon=True)
+            self.polling_thread = threading.Thread(
+                target=self.device_polling if self.device else self.background_polling, daemon=True)
             self.polling_thread.start()
             
             self.root.after(0, lambda: self.update_connection_status(True, "Connected"))
             self.root.after(0, lambda: self.connect_button.config(text="Disconnect from Hotplate"))
+            self.root.after(0, self.offer_resume)
         except Exception as e:
             self.root.after(0, lambda: messagebox.showerror("Connection Error", f"Failed to connect: {str(e)}"))
             self.root.after(0, lambda: self.update_connection_status(False, "Connection Failed"))
@@ -283,8 +427,16 @@ class HotplateGUI:
             self.polling_stop.set()
             if self.polling_thread and self.polling_thread.is_alive():
                 self.polling_thread.join(timeout=2)
+            if self.watchdog:
+                self.watchdog.stop()
+                self.watchdog = None
+            print(f"Sampling: {self.sampling_stats.summary()}")
             
-            if self.ser:
+            if self.device:
+                self.device.close()
+                self.device = None
+            elif self.ser:
+                arbiter.print_report(self.serial_arbiter)
                 hw.close_comm(self.ser)
             self.connected = False
             
@@ -293,6 +445,37 @@ class HotplateGUI:
         except Exception as e:
             self.root.after(0, lambda: messagebox.showerror("Disconnection Error", f"Error during disconnect: {str(e)}"))
     
+    def on_link_event(self, event):
+        """Link supervisor events (called from whichever thread hit the outage)"""
+        if event["type"] == "link_lost":
+            status, color = "Link lost, reconnecting...", "darkorange"
+        elif event["type"] == "link_restored":
+            status, color = f"Connected (recovered in {event['seconds']:.1f} s)", "green"
+        else:
+            status, color = f"Link down after {event['seconds']:.0f} s, retrying", "red"
+        self.root.after(0, lambda: self.status_label.config(text=status, foreground=color))
+
+    def on_watchdog_trip(self, event):
+        """Watchdog cut the plate's power (called from the watchdog thread)"""
+        message = (f"{event['reason']}.\n\nHeater and stirrer were turned off in {event['latency']:.2f} s "
+                   f"(guaranteed within {event['latency_bound']:.2f} s).")
+        if not event["plate_off"]:
+            message += "\n\nThe off commands were NOT confirmed - check the hotplate!"
+        self.root.after(0, lambda: self.status_label.config(text="Watchdog tripped", foreground="red"))
+        self.root.after(0, lambda: messagebox.showerror("Safety Watchdog", message))
+
+    def on_device_message(self, message):
+        """Recipe, watchdog and link events from the device process (called from its reader thread)"""
+        if message["type"] == "recipe":
+            update = message["update"]
+            if update.get("type") in ("done", "cancelled", "error"):
+                self.device_recipe_outcome.put(update["type"])
+            self.recipe_queue.put(update)
+        elif message["type"] == "watchdog_trip":
+            self.on_watchdog_trip(message)
+        elif message["type"].startswith("link_"):
+            self.on_link_event(message)
+
     def update_connection_status(self, connected, status):
         """Update connection status display"""
         self.status_label.config(text=status, foreground="green" if connected else "red")
@@ -304,151 +487,177 @@ class HotplateGUI:
     
     def background_polling(self):
         """Background thread that polls the hotplate without blocking GUI"""
+        next_poll = time.monotonic()
         while not self.polling_stop.is_set():
             if self.connected and self.ser:
                 try:
-                    with self.serial_lock:
-                        current_temp = hw.get_temp(self.ser)
-                        setpoint_temp = hw.get_target_temp(self.ser)
-                        ramp_rate = hw.get_ramp(self.ser)
-                        stir_speed = hw.get_stir(self.ser)
+                    # A reading the plate did not answer is None rather than a fake 0.
+                    # The lock is taken per read so the watchdog never waits behind a whole poll.
+                    current_temp, requested, received = self._poll_stamped(hw.get_temp)
+                    setpoint_temp = self._poll(hw.get_target_temp)
+                    ramp_rate = self._poll(hw.get_ramp)
+                    stir_speed = self._poll(hw.get_stir)
                     
-                    # Put data in queue for main thread to consume
+                    # Put data in queue for main thread to consume, stamped when the
+                    # temperature was read rather than when the Tk thread gets to it
+                    acquired = (requested + received) / 2
                     self.polling_queue.put({
                         'current_temp': current_temp,
                         'setpoint_temp': setpoint_temp,
                         'ramp_rate': ramp_rate,
-                        'stir_speed': stir_speed
+                        'stir_speed': stir_speed,
+                        'requested': requested,
+                        'received': received,
+                        'acquired': acquired,
+                        'latency': received - requested,
+                        'elapsed': self.temp_data.elapsed(acquired)
                     })
                 except Exception as e:
                     print(f"Error in background polling: {e}")
                     # Keep polling even if there's an error, but wait a bit
                     time.sleep(0.5)
             
-            # Sleep for a bit before next poll
-            time.sleep(1)
+            # Poll on a fixed schedule, so the time each poll takes does not add to the period
+            next_poll = max(next_poll + telemetry.POLL_PERIOD, time.monotonic())
+            self.polling_stop.wait(next_poll - time.monotonic())
+
+    def device_polling(self):
+        """Background thread that moves samples from the device process's shared-memory ring to the GUI"""
+        while not self.polling_stop.is_set():
+            for sample in self.device.read_samples():
+                sample['elapsed'] = self.temp_data.elapsed(sample['acquired'])
+                self.polling_queue.put(sample)
+            if not self.device.alive:
+                self.root.after(0, lambda: self.update_connection_status(False, "Device process stopped"))
+                return
+            time.sleep(0.25)
+
+    def _poll(self, getter):
+        return self._poll_stamped(getter)[0]
+
+    def _poll_stamped(self, getter):
+        """(reading or None, monotonic time the request went out, time the reply came back)"""
+        with self.telemetry_lane:
+            requested = time.monotonic()
+            try:
+                value = getter(self.ser)
+            except hw.HotplateResponseError:
+                value = None
+            return value, requested, time.monotonic()
     
+    @profiler.timed("gui periodic_update")
     def periodic_update(self):
         """Update GUI from queue without blocking on I/O"""
         # Check if there's data in the queue
+        received = False
         try:
             while True:
                 data = self.polling_queue.get_nowait()
+                received = True
                 
-                # Add temperature to plot data
-                self.temp_data.add_point(data['current_temp'])
+                # Live samples carry their acquisition stamp, replayed samples their recorded time
+                if 'acquired' in data:
+                    self.sampling_stats.add(data['acquired'], data.get('latency'))
+                if data['current_temp'] is not None:
+                    self.temp_data.add_point(data['current_temp'], data.get('elapsed'),
+                                             setpoint=data.get('setpoint_temp'), ramp=data.get('ramp_rate'),
+                                             stir=data.get('stir_speed'), step=data.get('step', self.recipe_step),
+                                             phase=data.get('phase', self.recipe_phase))
                 
                 # Update display
-                self.current_temp_value.config(text=f"{data['current_temp']} °C")
-                self.setpoint_temp_value.config(text=f"{data['setpoint_temp']} °C")
-                self.ramp_rate_value.config(text=f"{data['ramp_rate']} °C/hr")
+                self.current_temp_value.config(text=f"{self._reading(data['current_temp'])} °C")
+                self.setpoint_temp_value.config(text=f"{self._reading(data.get('setpoint_temp'))} °C")
+                self.ramp_rate_value.config(text=f"{self._reading(data.get('ramp_rate'))} °C/hr")
                 
                 # Display stir speed or warning if no data
-                if data['stir_speed'] <= 0:
+                stir_speed = data.get('stir_speed')
+                if stir_speed is None or stir_speed <= 0:
                     self.stir_speed_value.config(text="No data")
                 else:
-                    self.stir_speed_value.config(text=f"{data['stir_speed']} RPM")
-                
-                # Update plot
-                self.update_plot()
+                    self.stir_speed_value.config(text=f"{stir_speed} RPM")
         except:
             # Queue is empty, which is fine
             pass
+
+        # Redraw once per drain, however many samples arrived
+        if received:
+            self.update_plot()
+            self.sampling_value.config(text=self.sampling_stats.summary())
+        self.update_replay_controls()
+        self.show_rendered_plot()
         
         # Schedule next check
         self.root.after(100, self.periodic_update)
     
+    @staticmethod
+    def _reading(value):
+        return "--" if value is None else value
+
+    @profiler.timed("gui update_plot")
     def update_plot(self):
         """Update the temperature vs time plot"""
-        times, temps = self.temp_data.get_data()
-        
-        self.ax.clear()
-        if times and temps:
-            self.ax.plot(times, temps, 'b-', linewidth=2, label='Temperature')
-            
-            # Set x-axis to show last 12 hours, with right side at current time
-            current_time = times[-1] if times else 0
-            left_limit = max(0, current_time - 43200)  # 12 hours = 43200 seconds
-            self.ax.set_xlim([left_limit, current_time])
-            
-            # Format x-axis as time labels
-            def format_seconds(seconds, pos):
-                hours = int(seconds // 3600)
-                minutes = int((seconds % 3600) // 60)
-                return f"{hours:02d}:{minutes:02d}"
-            
-            self.ax.xaxis.set_major_formatter(FuncFormatter(format_seconds))
-            self.figure.autofmt_xdate()  # Rotate and align the tick labels
-            
-            # Get setpoint temperature and draw horizontal line
-            setpoint_text = self.setpoint_temp_value.cget("text")
-            if setpoint_text != "-- °C":
-                try:
-                    setpoint = float(setpoint_text.split()[0])
-                    if setpoint >= 20:  # Only show setpoint if 20°C or higher
-                        self.ax.axhline(y=setpoint, color='g', linestyle='--', alpha=0.7, label='Setpoint')
-                except:
-                    pass
-        
-        self.ax.set_xlabel("Elapsed Time (hh:mm)")
-        self.ax.set_ylabel("Temperature (°C)")
-        self.ax.set_title("Temperature vs Time")
-        self.ax.grid(True, alpha=0.3)
-        if times and temps:
-            self.ax.legend(loc='upper left')
-        
+        series = self.temp_data.get_series()
+        if self.renderer:
+            self.renderer.request(series, self.plot_canvas.winfo_width(), self.plot_canvas.winfo_height(),
+                                  self.full_history.get())
+            return
+        render.draw_temperature_plot(self.figure, self.ax, series, self.full_history.get())
         self.canvas.draw()
+
+    @profiler.timed("gui show_rendered_plot")
+    def show_rendered_plot(self):
+        """Blit the render worker's newest image, if any"""
+        image = self.renderer.take_image() if self.renderer else None
+        if image:
+            self.plot_photo = tk.PhotoImage(data=image, format="PPM")
+            self.plot_canvas.itemconfig(self.plot_image_item, image=self.plot_photo)
     
     def set_temperature(self):
         """Queue temperature setting command"""
-        if not self.connected:
-            messagebox.showwarning("Not Connected", "Please connect to hotplate first")
-            return
-        
-        try:
-            temp = int(self.set_temp_input.get())
-            self.queue_command('set_temperature', temp)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid temperature value")
+        value = self._read_input(self.set_temp_input, "temperature")
+        if value is not None:
+            self.send_manual(("set_heater_temp", value, f"Temperature {value} °C"))
     
     def set_ramp_rate(self):
         """Queue ramp rate setting command"""
-        if not self.connected:
-            messagebox.showwarning("Not Connected", "Please connect to hotplate first")
-            return
-        
-        try:
-            ramp = int(self.set_ramp_input.get())
-            self.queue_command('set_ramp_rate', ramp)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid ramp rate value")
+        value = self._read_input(self.set_ramp_input, "ramp rate")
+        if value is not None:
+            self.send_manual(("set_heater_ramp", value, f"Ramp rate {value} °C/hr"))
     
     def set_stir_speed(self):
         """Queue stir speed setting command"""
-        if not self.connected:
-            messagebox.showwarning("Not Connected", "Please connect to hotplate first")
+        value = self._read_input(self.set_stir_input, "stir speed")
+        if value is not None:
+            self.send_manual(("set_stir", value, f"Stir speed {value} RPM" if value > 1 else "Stirrer off"))
+    
+    def apply_all(self):
+        """Queue temperature, ramp rate and stir speed; they go out as one transaction"""
+        values = [self._read_input(field, name) for field, name in ((self.set_temp_input, "temperature"),
+                                                                    (self.set_ramp_input, "ramp rate"),
+                                                                    (self.set_stir_input, "stir speed"))]
+        if None in values:
             return
-        
-        try:
-            speed = int(self.set_stir_input.get())
-            self.queue_command('set_stir_speed', speed)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid stir speed value")
+        temp, ramp, speed = values
+        self.send_manual(("set_heater_temp", temp, f"Temperature {temp} °C"),
+                         ("set_heater_ramp", ramp, f"Ramp rate {ramp} °C/hr"),
+                         ("set_stir", speed, f"Stir speed {speed} RPM" if speed > 1 else "Stirrer off"))
     
     def turn_off_heater(self):
         """Queue heater off command"""
-        if not self.connected:
-            messagebox.showwarning("Not Connected", "Please connect to hotplate first")
-            return
-        self.queue_command('turn_off_heater', None)
+        self.send_manual(("set_heater_off", None, "Heater off"))
     
     def turn_off_stirrer(self):
         """Queue stirrer off command"""
-        if not self.connected:
-            messagebox.showwarning("Not Connected", "Please connect to hotplate first")
-            return
-        self.queue_command('turn_off_stirrer', None)
-    
+        self.send_manual(("set_stir_off", None, "Stirrer off"))
+
+    def _read_input(self, field, name):
+        """Integer value of an input field, or None (reported in the status strip) if it is not one"""
+        try:
+            return int(field.get())
+        except ValueError:
+            self.show_command_status(f"Invalid {name} value", "red")
+            return None
+
     def clear_plot_data(self):
         """Clear temperature plot data"""
         self.temp_data.clear()
@@ -478,23 +687,70 @@ class HotplateGUI:
         if not file_path:
             return
 
-        self.start_recipe(file_path)
+        resume = checkpoints.resumable_checkpoint(recipe=file_path)
+        if resume and not messagebox.askyesno(
+                "Resume Recipe", f"This recipe was interrupted:\n{checkpoints.describe(resume)}\n\n"
+                                 "Resume where it stopped? (No starts from step 1)"):
+            resume = None
+        self.start_recipe(file_path, resume)
+
+    def offer_resume(self):
+        """Offer to resume a recipe interrupted by a crash or disconnect"""
+        if self.recipe_thread and self.recipe_thread.is_alive():
+            return
+        checkpoint = checkpoints.resumable_checkpoint()
+        if not checkpoint:
+            return
+        if messagebox.askyesno("Resume Recipe", f"A recipe was interrupted:\n{checkpoints.describe(checkpoint)}"
+                                                "\n\nResume it now?"):
+            self.start_recipe(checkpoint["recipe"], checkpoint)
+        else:
+            checkpoints.clear_checkpoint()
 
-    def start_recipe(self, file_path):
+    def start_recipe(self, file_path, resume=None, job=None):
         """Start recipe execution in a background thread"""
         self.recipe_stop.clear()
         self.recipe_continue.clear()
+        self.recipe_estimate = None
+        self.recipe_eta_step = 0
+        self.estimate_recipe(file_path)
         self.temp_data.clear()
         self.open_recipe_window(file_path)
 
         self.recipe_thread = threading.Thread(
             target=self.run_recipe_thread,
-            args=(file_path,),
+            args=(file_path, job["control_mode"] if job else self.CONTROL_MODES.get(self.control_mode_input.get()),
+                  resume, job),
             daemon=True
         )
         self.recipe_thread.start()
         self.process_recipe_queue()
 
+    def estimate_recipe(self, file_path):
+        """Dry-run the recipe against the thermal model in the background for the live ETA"""
+        self.recipe_estimate_token = token = object()
+        device, start_temp = identify.device_name(self.ser), self.temp_data.last_temp
+
+        def run():
+            try:
+                steps = runscript.compile_recipe(file_path)
+                estimate = estimator.estimate_recipe(steps, model=identify.load_model(device), start_temp=start_temp)
+            except Exception as e:
+                print(f"Error estimating recipe: {e}")
+                return
+            self.root.after(0, self.set_recipe_estimate, token, estimate)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def set_recipe_estimate(self, token, estimate):
+        """Use a finished estimate unless another recipe has been started since"""
+        if token is not self.recipe_estimate_token:
+            return
+        self.recipe_estimate = estimate
+        if (self.recipe_thread and self.recipe_thread.is_alive() and "eta" in self.recipe_labels
+                and self.recipe_window and self.recipe_window.winfo_exists()):
+            self.update_recipe_eta({})
+
     def open_recipe_window(self, file_path):
         """Open a new window to show recipe progress"""
         if self.recipe_window and self.recipe_window.winfo_exists():
@@ -527,6 +783,10 @@ class HotplateGUI:
         self.recipe_labels["dwell"] = ttk.Label(frame, text="Dwell: -- s")
         self.recipe_labels["dwell"].pack(anchor=tk.W)
 
+        total = self.recipe_estimate["total_seconds"] if self.recipe_estimate else None
+        self.recipe_labels["eta"] = ttk.Label(frame, text=f"ETA: {estimator.format_duration(total)}")
+        self.recipe_labels["eta"].pack(anchor=tk.W)
+
         self.recipe_labels["message"] = ttk.Label(frame, text="")
         self.recipe_labels["message"].pack(anchor=tk.W, pady=(5, 0))
 
@@ -564,29 +824,156 @@ class HotplateGUI:
         if self.recipe_continue_button:
             self.recipe_continue_button.config(state=tk.DISABLED)
 
-        try:
-            if self.connected and self.ser:
-                with self.serial_lock:
-                    hw.set_heater_off(self.ser)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error turning off heater: {str(e)}")
+        if self.connected and self.ser:
+            # The off command can wait seconds for the port or the device process, so not on the Tk thread
+            threading.Thread(target=self._abort_heater_off, daemon=True).start()
 
         self.close_recipe_window()
 
-    def run_recipe_thread(self, file_path):
+    def _abort_heater_off(self):
+        """Turn the heater off after an abort (runs in its own thread)"""
+        try:
+            self._serial_call("set_heater_off", lane=self.safety_lane)
+        except Exception as e:
+            msg = f"Error turning off heater: {e}"
+            self.root.after(0, lambda m=msg: messagebox.showerror("Error", m))
+
+    def run_recipe_thread(self, file_path, control_mode=None, resume=None, job=None):
         """Run recipe in a background thread"""
+        outcome = "failed"
+        started = time.time()
         try:
+            if self.device:
+                outcome = self._run_device_recipe(file_path, control_mode, resume)
+                return
             runscript.run_recipe(
                 self.ser,
                 file_path,
                 progress_callback=self.recipe_queue.put,
                 stop_event=self.recipe_stop,
                 continue_event=self.recipe_continue,
-                serial_lock=self.serial_lock
+                serial_lock=self.recipe_lane,
+                control_mode=control_mode,
+                checkpoint_path=checkpoints.CHECKPOINT_FILE,
+                resume=resume
             )
+            outcome = "cancelled" if self.recipe_stop.is_set() else "done"
         except Exception as e:
             self.recipe_queue.put({"type": "error", "message": str(e)})
+        finally:
+            self.root.after(0, lambda: self.record_run(file_path, started, outcome))
+            if job:
+                self.job_queue.finish(job["id"], outcome)
+                self.last_job_temp = job["last_temp"]
+                if outcome != "done":
+                    # Leave the rest of the queue for the operator to look at
+                    self.job_queue_running = False
+
+    def open_job_queue_window(self):
+        """Open the recipe job queue for this plate"""
+        if not self.job_queue:
+            messagebox.showwarning("Not Connected", "Please connect to hotplate first")
+            return
+        if self.job_queue_window and self.job_queue_window.winfo_exists():
+            self.job_queue_window.lift()
+            return
+
+        self.job_queue_window = tk.Toplevel(self.root)
+        self.job_queue_window.title(f"Job Queue - {self.job_queue.device}")
+        frame = ttk.Frame(self.job_queue_window, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("id", "state", "priority", "recipe")
+        self.job_queue_tree = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for column, width in zip(columns, (40, 80, 60, 260)):
+            self.job_queue_tree.heading(column, text=column.capitalize())
+            self.job_queue_tree.column(column, width=width)
+        self.job_queue_tree.pack(fill=tk.BOTH, expand=True)
+
+        button_frame = ttk.Frame(frame)
+        button_frame.pack(fill=tk.X, pady=(5, 0))
+        for text, command in (("Add...", self.add_queue_job), ("Hold", lambda: self.change_queue_job("hold")),
+                              ("Release", lambda: self.change_queue_job("release")),
+                              ("Priority +", lambda: self.change_queue_job("up")),
+                              ("Priority -", lambda: self.change_queue_job("down")),
+                              ("Remove", lambda: self.change_queue_job("remove")),
+                              ("Clear Finished", self.clear_finished_jobs)):
+            ttk.Button(button_frame, text=text, command=command).pack(side=tk.LEFT, padx=(0, 3))
+
+        run_frame = ttk.Frame(frame)
+        run_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Checkbutton(run_frame, text="Reorder to reduce heat-up / cool-down",
+                        variable=self.job_queue_reorder).pack(side=tk.LEFT)
+        self.job_queue_run_button = ttk.Button(run_frame, command=self.toggle_job_queue)
+        self.job_queue_run_button.pack(side=tk.RIGHT)
+        self.refresh_job_queue_window()
+
+    def refresh_job_queue_window(self):
+        """Redraw the job list"""
+        if not self.job_queue_window or not self.job_queue_window.winfo_exists():
+            return
+        self.job_queue_tree.delete(*self.job_queue_tree.get_children())
+        for job in self.job_queue.snapshot():
+            self.job_queue_tree.insert("", tk.END, iid=str(job["id"]), values=(
+                job["id"], job["state"], job["priority"], os.path.basename(job["recipe"])))
+        self.job_queue_run_button.config(text="Stop Queue" if self.job_queue_running else "Start Queue")
+
+    def add_queue_job(self):
+        """Add a recipe file to the queue"""
+        file_path = filedialog.askopenfilename(
+            title="Queue Recipe File",
+            initialdir=os.path.join(os.path.dirname(__file__), "hotplatescripts"),
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
+            parent=self.job_queue_window
+        )
+        if not file_path:
+            return
+        try:
+            self.job_queue.add(file_path, control_mode=self.CONTROL_MODES.get(self.control_mode_input.get()))
+        except Exception as e:
+            messagebox.showerror("Error", f"Cannot queue recipe: {str(e)}", parent=self.job_queue_window)
+        self.refresh_job_queue_window()
+
+    def change_queue_job(self, action):
+        """Apply a hold / release / priority / remove action to the selected jobs"""
+        for iid in self.job_queue_tree.selection():
+            job_id = int(iid)
+            try:
+                if action == "up" or action == "down":
+                    job = next(j for j in self.job_queue.snapshot() if j["id"] == job_id)
+                    self.job_queue.set_priority(job_id, job["priority"] + (1 if action == "up" else -1))
+                else:
+                    getattr(self.job_queue, action)(job_id)
+            except (KeyError, ValueError) as e:
+                messagebox.showwarning("Job Queue", str(e), parent=self.job_queue_window)
+        self.refresh_job_queue_window()
 
+    def clear_finished_jobs(self):
+        self.job_queue.clear_finished()
+        self.refresh_job_queue_window()
+
+    def toggle_job_queue(self):
+        """Start or stop running queued jobs back to back"""
+        self.job_queue_running = not self.job_queue_running
+        if self.job_queue_running:
+            self.check_job_queue()
+        self.refresh_job_queue_window()
+
+    def check_job_queue(self):
+        """Start the next queued job as soon as the plate is free"""
+        if not self.job_queue_running or not self.connected:
+            self.refresh_job_queue_window()
+            return
+        if not (self.recipe_thread and self.recipe_thread.is_alive()):
+            plate_temp = self.last_job_temp if self.last_job_temp is not None else self.temp_data.last_temp
+            job = self.job_queue.next_job(plate_temp, reorder=self.job_queue_reorder.get())
+            if job:
+                self.job_queue.start(job["id"])
+                self.start_recipe(job["recipe"], job=job)
+        self.refresh_job_queue_window()
+        self.root.after(1000, self.check_job_queue)
+
+    @profiler.timed("gui recipe queue drain")
     def process_recipe_queue(self):
         """Process recipe progress updates"""
         try:
@@ -600,12 +987,26 @@ class HotplateGUI:
             if (self.recipe_thread and self.recipe_thread.is_alive()) or not self.recipe_queue.empty():
                 self.root.after(200, self.process_recipe_queue)
 
+    # Recipe progress update -> phase recorded with telemetry samples
+    def track_recipe_phase(self, update):
+        update_type = update.get("type")
+        if update_type == "step_start":
+            self.recipe_step = update.get("step", 0)
+        if update_type in telemetry.PHASE_EVENTS:
+            self.recipe_phase = telemetry.PHASE_EVENTS[update_type]
+        elif update_type in ("done", "cancelled", "error"):
+            self.recipe_step = 0
+            self.recipe_phase = "idle"
+
     def handle_recipe_update(self, update):
         """Handle a single recipe progress update"""
+        profiler.recipe_event(update)
+        self.track_recipe_phase(update)
         if not self.recipe_window or not self.recipe_window.winfo_exists():
             return
 
         update_type = update.get("type")
+        self.update_recipe_eta(update)
 
         if update_type == "start":
             total_steps = update.get("total_steps", 0)
@@ -615,9 +1016,13 @@ class HotplateGUI:
             step = update.get("step", 0)
             total_steps = update.get("total_steps", 0)
             self.recipe_labels["step"].config(text=f"Step: {step}/{total_steps}")
-            self.recipe_labels["target"].config(text=f"Target Temp: {update.get('target_temp', '--')} °C")
-            self.recipe_labels["ramp"].config(text=f"Ramp Rate: {update.get('ramp_rate', '--')} °C/hr")
-            self.recipe_labels["stir"].config(text=f"Stir Speed: {update.get('stir_speed', '--')} RPM")
+            # Profile steps leave the fields they do not set as None
+            def field(key):
+                value = update.get(key)
+                return "--" if value is None else value
+            self.recipe_labels["target"].config(text=f"Target Temp: {field('target_temp')} °C")
+            self.recipe_labels["ramp"].config(text=f"Ramp Rate: {field('ramp_rate')} °C/hr")
+            self.recipe_labels["stir"].config(text=f"Stir Speed: {field('stir_speed')} RPM")
             dwell = update.get("dwell_seconds", "--")
             self.recipe_labels["dwell"].config(text=f"Dwell: {dwell} s")
             self.recipe_labels["message"].config(text="")
@@ -640,6 +1045,17 @@ class HotplateGUI:
             # Keep continue button enabled to skip stabilization
             if self.recipe_continue_button:
                 self.recipe_continue_button.config(state=tk.NORMAL)
+        elif update_type == "profile_tick":
+            self.recipe_labels["message"].config(
+                text=f"{update.get('setpoint', '--')} °C setpoint, profile remaining: {update.get('remaining', '--')} s")
+            if self.recipe_continue_button:
+                self.recipe_continue_button.config(state=tk.NORMAL)
+        elif update_type == "profile_done":
+            self.recipe_labels["message"].config(
+                text=f"Profile done: {update.get('writes', 0)} writes, "
+                     f"max lateness {update.get('max_lateness', 0) * 1000:.0f} ms")
+        elif update_type == "stabilized":
+            self.recipe_labels["message"].config(text=f"Stabilized in {update.get('seconds', 0):.0f} s")
         elif update_type == "dwell_start":
             dwell = update.get("dwell_seconds", "--")
             self.recipe_labels["dwell"].config(text=f"Dwell: {dwell} s")
@@ -688,21 +1104,349 @@ class HotplateGUI:
             if self.recipe_abort_button:
                 self.recipe_abort_button.config(state=tk.DISABLED)
     
-    def save_csv(self):
-        """Queue CSV save command"""
-        times, temps = self.temp_data.get_data()
-        
-        if not times or not temps:
+    def update_recipe_eta(self, update):
+        """Refresh the remaining-time estimate from a recipe progress update"""
+        update_type = update.get("type")
+        if update_type == "step_start":
+            self.recipe_eta_step = update.get("step", 0)
+            self.recipe_eta_step_started = time.time()
+        if not self.recipe_estimate or "eta" not in self.recipe_labels:
+            return
+        if update_type in ("done", "cancelled", "error"):
+            self.recipe_labels["eta"].config(text="ETA: --")
+            return
+        if not self.recipe_eta_step:
+            total = estimator.format_duration(self.recipe_estimate["total_seconds"])
+            self.recipe_labels["eta"].config(text=f"ETA: {total}")
+            return
+
+        step = self.recipe_eta_step
+        if update_type == "dwell_tick":
+            # Dwell time left is exact, only cooling and later steps are estimated
+            result = estimator.step_result(self.recipe_estimate, step)
+            remaining = (update.get("remaining", 0) + (result["cooling_seconds"] if result else 0.0)
+                         + estimator.seconds_after(self.recipe_estimate, step))
+        else:
+            elapsed = time.time() - self.recipe_eta_step_started
+            remaining = estimator.remaining_seconds(self.recipe_estimate, step, elapsed)
+        self.recipe_labels["eta"].config(text=f"ETA: {estimator.format_duration(remaining)} remaining")
+
+    def export_data(self):
+        """Pick a file and export the whole temperature history to it in the background"""
+        if not len(self.temp_data):
             messagebox.showwarning("No Data", "No temperature data to save")
             return
-        
-        self.queue_command('save_csv', {'times': times, 'temps': temps})
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[(label, "*" + extension) for extension, label in export.FORMATS.items()]
+                      + [("All files", "*.*")],
+            title="Export Temperature Data"
+        )
+        if not file_path:
+            return
+        self.export_stop.clear()
+        self.export_progress.config(value=0, maximum=1)
+        self.export_label.config(text=f"Exporting {os.path.basename(file_path)}...")
+        self.export_frame.pack(fill=tk.X, pady=(5, 0))
+        self.export_button.config(state=tk.DISABLED)
+        self.export_thread = threading.Thread(target=self._do_export, args=(file_path,), daemon=True)
+        self.export_thread.start()
+
+    def cancel_export(self):
+        self.export_stop.set()
+
+    def show_export_progress(self, written, expected):
+        self.export_progress.config(value=written, maximum=expected)
+        self.export_label.config(text=f"{written} / {expected} rows")
+
+    def finish_export(self, text, color):
+        self.export_frame.pack_forget()
+        self.export_button.config(state=tk.NORMAL)
+        self.show_command_status(text, color)
     
+    def open_replay(self, file_path=None):
+        """Replay a recorded telemetry log through the live data path"""
+        if self.connected:
+            messagebox.showwarning("Connected", "Disconnect from the hotplate before replaying a log")
+            return
+        if file_path is None:
+            file_path = filedialog.askopenfilename(
+                title="Select Telemetry Log",
+                filetypes=[("Telemetry logs", " ".join("*" + extension for extension in replay.LOG_EXTENSIONS)),
+                           ("CSV files", "*.csv"), ("Columnar exports", "*.npz"), ("All files", "*.*")]
+            )
+        if not file_path:
+            return
+        try:
+            log = replay.load_telemetry(file_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error loading log: {str(e)}")
+            return
+
+        self.stop_replay()
+        self.temp_data.clear()
+        self.replayer = replay.TelemetryReplayer(log, self.polling_queue,
+                                                 speed=float(self.replay_speed_input.get().rstrip("x")))
+        self.replay_scale.config(from_=self.replayer.start_time, to=self.replayer.end_time)
+        self.replay_play_button.config(text="Pause")
+        self.replay_frame.pack(fill=tk.X, pady=(5, 0))
+        self.replayer.start()
+
+    def stop_replay(self):
+        if self.replayer:
+            self.replayer.stop()
+            self.replayer = None
+        self.replay_frame.pack_forget()
+
+    def toggle_replay_pause(self):
+        if not self.replayer:
+            return
+        paused = not self.replayer.paused
+        self.replayer.set_paused(paused)
+        self.replay_play_button.config(text="Play" if paused else "Pause")
+
+    def change_replay_speed(self, event=None):
+        if self.replayer:
+            self.replayer.set_speed(float(self.replay_speed_input.get().rstrip("x")))
+
+    def start_replay_seek(self, event=None):
+        self.replay_seeking = True
+
+    def finish_replay_seek(self, event=None):
+        """Jump to the seek bar position and bulk-load the history before it"""
+        self.replay_seeking = False
+        if not self.replayer:
+            return
+        index = self.replayer.seek(self.replay_position.get())
+        history = self.replayer.history(index)
+        self.temp_data.clear()
+        self.temp_data.extend(history["elapsed"], history["current_temp"], setpoint=history.get("setpoint_temp"),
+                              ramp=history.get("ramp_rate"), stir=history.get("stir_speed"),
+                              step=history.get("step"), phase=history.get("phase"))
+        self.update_plot()
+
+    def update_replay_controls(self):
+        """Move the seek bar with the replay"""
+        if not self.replayer or self.replay_seeking:
+            return
+        position = min(self.replayer.position(), self.replayer.end_time)
+        self.replay_position.set(position)
+        self.replay_time_label.config(text=estimator.format_duration(position))
+        if self.replayer.finished and not self.replayer.paused:
+            self.replayer.set_paused(True)
+            self.replay_play_button.config(text="Play")
+
+    def fit_thermal_model(self):
+        """Queue a thermal model fit of the plotted data"""
+        if not self.connected:
+            messagebox.showwarning("Not Connected", "Connect to the hotplate the data was recorded on first")
+            return
+        series = self.temp_data.get_series()
+        if not len(series["time"]):
+            messagebox.showwarning("No Data", "No temperature data to fit")
+            return
+        # The recorded setpoints mark where each transient starts, so dead time can be fitted too
+        self.queue_command('fit_model', {'times': series["time"], 'temps': series["temp"],
+                                         'setpoints': series["setpoint"]})
+
+    def _run_device_recipe(self, file_path, control_mode, resume):
+        """Runs the recipe in the device process, forwarding abort / next-step; returns the outcome"""
+        while not self.device_recipe_outcome.empty():
+            self.device_recipe_outcome.get_nowait()
+        self.device.run_recipe(file_path, control_mode=control_mode, resume=resume)
+        stop_sent = False
+        while True:
+            try:
+                outcome = self.device_recipe_outcome.get(timeout=0.2)
+                return "failed" if outcome == "error" else outcome
+            except Empty:
+                pass
+            if not self.device or not self.device.alive:
+                self.recipe_queue.put({"type": "error", "message": "Device process stopped"})
+                return "failed"
+            if self.recipe_stop.is_set() and not stop_sent:
+                self.device.stop_recipe()
+                stop_sent = True
+            if self.recipe_continue.is_set():
+                self.recipe_continue.clear()
+                self.device.continue_recipe()
+
+    def _serial_call(self, name, *args, lane):
+        """Runs a hotplate_wrapper set command here under lane, or in the device process"""
+        if self.device:
+            return self.device.call(name, *args)
+        with lane:
+            return getattr(hw, name)(self.ser, *args)
+
+    def record_run(self, recipe, started, outcome):
+        """Save the finished run's telemetry and add it to the run catalog"""
+        # Snapshot now: the next queued job clears the history when it starts
+        series = self.temp_data.get_series()
+        if not len(series["time"]):
+            return
+        threading.Thread(target=self._do_record_run, daemon=True,
+                         args=(series, identify.device_name(self.ser), recipe, started, time.time(), outcome)).start()
+
+    def _do_record_run(self, series, device, recipe, started, ended, outcome):
+        """Write and index a run (runs in its own thread)"""
+        try:
+            os.makedirs(catalog.RUNS_DIR, exist_ok=True)
+            path = catalog.run_file(device, recipe, started)
+            telemetry.write_csv(path, series)
+            self.run_catalog.add_run(path, device=device, recipe=recipe, started=started, ended=ended,
+                                     outcome=outcome)
+            self.root.after(0, self.refresh_catalog_window)
+        except Exception as e:
+            print(f"Error recording run: {e}")
+
+    def open_catalog_window(self):
+        """Search recorded runs; double-click one to replay it"""
+        if self.catalog_window and self.catalog_window.winfo_exists():
+            self.catalog_window.lift()
+            return
+
+        self.catalog_window = tk.Toplevel(self.root)
+        self.catalog_window.title("Run Catalog")
+        frame = ttk.Frame(self.catalog_window, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        filter_frame = ttk.Frame(frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        for label, key, width in (("Device", "device", 8), ("Recipe", "recipe", 16), ("Last days", "days", 5),
+                                  ("Overshoot >", "min_overshoot", 5)):
+            ttk.Label(filter_frame, text=label).pack(side=tk.LEFT, padx=(0, 2))
+            self.catalog_filters[key] = ttk.Entry(filter_frame, width=width)
+            self.catalog_filters[key].pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(filter_frame, text="Search", command=self.refresh_catalog_window).pack(side=tk.LEFT)
+
+        columns = ("id", "started", "device", "recipe", "outcome", "duration", "overshoot")
+        self.catalog_tree = ttk.Treeview(frame, columns=columns, show="headings", height=12)
+        for column, width in zip(columns, (40, 120, 60, 200, 70, 70, 70)):
+            self.catalog_tree.heading(column, text=column.capitalize())
+            self.catalog_tree.column(column, width=width)
+        self.catalog_tree.pack(fill=tk.BOTH, expand=True)
+        self.catalog_tree.bind("<<TreeviewSelect>>", self.show_catalog_steps)
+        self.catalog_tree.bind("<Double-1>", self.open_catalog_run)
+
+        columns = ("step", "target", "rise", "overshoot", "settle", "dwell error")
+        self.catalog_steps_tree = ttk.Treeview(frame, columns=columns, show="headings", height=6)
+        for column in columns:
+            self.catalog_steps_tree.heading(column, text=column.capitalize())
+            self.catalog_steps_tree.column(column, width=80)
+        self.catalog_steps_tree.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
+        self.refresh_catalog_window()
+
+    def refresh_catalog_window(self):
+        """Re-run the catalog query with the current filters"""
+        if not self.catalog_window or not self.catalog_window.winfo_exists():
+            return
+        values = {key: entry.get().strip() or None for key, entry in self.catalog_filters.items()}
+        try:
+            days = float(values["days"]) if values["days"] else None
+            runs = self.run_catalog.query(device=values["device"], recipe=values["recipe"],
+                                          since=time.time() - days * 86400 if days else None,
+                                          min_overshoot=float(values["min_overshoot"]) if values["min_overshoot"]
+                                          else None)
+        except ValueError:
+            messagebox.showerror("Error", "Last days and overshoot must be numbers", parent=self.catalog_window)
+            return
+        self.catalog_tree.delete(*self.catalog_tree.get_children())
+        self.catalog_steps_tree.delete(*self.catalog_steps_tree.get_children())
+        for run in runs:
+            self.catalog_tree.insert("", tk.END, iid=str(run["id"]), values=(
+                run["id"], time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started"])), run["device"],
+                os.path.basename(run["recipe"] or run["path"]), run["outcome"],
+                estimator.format_duration(run["ended"] - run["started"]),
+                "--" if run["max_overshoot"] is None else f"{run['max_overshoot']:.1f}"))
+
+    def show_catalog_steps(self, event=None):
+        """List the selected run's per-step statistics"""
+        self.catalog_steps_tree.delete(*self.catalog_steps_tree.get_children())
+        selection = self.catalog_tree.selection()
+        if not selection:
+            return
+        cell = lambda value, digits=1: "--" if value is None else f"{value:.{digits}f}"
+        for step in self.run_catalog.steps(int(selection[0])):
+            self.catalog_steps_tree.insert("", tk.END, values=(
+                step["step"], cell(step["target"]), estimator.format_duration(step["rise_time"]),
+                cell(step["overshoot"]), estimator.format_duration(step["settle_time"]),
+                cell(step["dwell_error"], 0)))
+
+    def open_catalog_run(self, event=None):
+        """Replay the double-clicked run"""
+        selection = self.catalog_tree.selection()
+        if not selection:
+            return
+        run = self.run_catalog.run(int(selection[0]))
+        if run:
+            self.open_replay(run["path"])
+
+    ### Manual plate commands ###
+    # Setting each command changes; a newer request replaces a pending one for the same setting
+    MANUAL_SETTINGS = {"set_heater_temp": "heater", "set_heater_off": "heater", "set_heater_ramp": "ramp",
+                       "set_stir": "stir", "set_stir_off": "stir"}
+    SAFETY_COMMANDS = ("set_heater_off", "set_stir_off")
+
+    def send_manual(self, *commands):
+        """Queue (command, value, label) settings for the manual worker and return immediately"""
+        if not self.connected:
+            self.show_command_status("Not connected to the hotplate", "red")
+            return
+        with self.manual_ready:
+            replaced = 0
+            for name, value, label in commands:
+                setting = self.MANUAL_SETTINGS[name]
+                replaced += setting in self.manual_pending
+                self.manual_pending[setting] = (name, value, label, time.monotonic())
+            self.manual_ready.notify()
+        note = f" (replaces {replaced} pending)" if replaced else ""
+        self.show_command_status("Sending " + ", ".join(label for _, _, label in commands) + note, "gray")
+
+    def manual_worker(self):
+        """Worker thread sending whatever manual settings are pending as one batch"""
+        while not self.command_stop.is_set():
+            with self.manual_ready:
+                if not self.manual_pending:
+                    self.manual_ready.wait(0.5)
+                batch = list(self.manual_pending.values())
+                self.manual_pending.clear()
+            if batch:
+                results = self._send_manual_batch(batch)
+                self.root.after(0, lambda results=results: self.show_command_results(results))
+
+    def _send_manual_batch(self, batch):
+        """Off commands first on the safety lane, the rest in one transaction. Returns (label, ok, latency s)."""
+        results = []
+        safety = [command for command in batch if command[0] in self.SAFETY_COMMANDS]
+        settings = [command for command in batch if command[0] not in self.SAFETY_COMMANDS]
+        try:
+            if not (self.connected and self.ser):
+                raise ConnectionError("not connected")
+            for name, _, label, queued in safety:
+                ok = self._serial_call(name, lane=self.safety_lane)
+                results.append((label, ok, time.monotonic() - queued))
+            if settings:
+                oks = self._serial_call("set_many", [(name, value) for name, value, _, _ in settings],
+                                        lane=self.operator_lane)
+                done = time.monotonic()
+                results += [(label, ok, done - queued) for (_, _, label, queued), ok in zip(settings, oks)]
+        except Exception as e:
+            done = time.monotonic()
+            results += [(f"{label}: {e}", False, done - queued)
+                    for _, _, label, queued in (safety + settings)[len(results):]]
+        return results
+
+    def show_command_status(self, text, color):
+        self.command_status_label.config(text=text, foreground=color)
+
+    def show_command_results(self, results):
+        """Non-modal outcome of a manual batch, with each command's latency from click to reply"""
+        text = "   ".join(f"{'OK' if ok else 'FAILED'} {label} ({latency * 1000:.0f} ms)"
+                         for label, ok, latency in results)
+        self.show_command_status(text, "green" if all(ok for _, ok, _ in results) else "red")
+
     def queue_command(self, command, data):
         """Queue a command for the worker thread"""
-        if self.operation_in_progress and command != 'connect' and command != 'disconnect':
-            messagebox.showwarning("Operation in Progress", "Another operation is currently running")
-            return
         self.command_queue.put((command, data))
     
     def command_worker(self):
@@ -710,122 +1454,50 @@ class HotplateGUI:
         while not self.command_stop.is_set():
             try:
                 command, data = self.command_queue.get(timeout=0.5)
-                self.operation_in_progress = True
-                
-                try:
-                    if command == 'connect':
-                        self.connect()
-                    elif command == 'disconnect':
-                        self.disconnect()
-                    elif command == 'set_temperature' and self.connected and self.ser:
-                        self._do_set_temperature(data)
-                    elif command == 'set_ramp_rate' and self.connected and self.ser:
-                        self._do_set_ramp_rate(data)
-                    elif command == 'set_stir_speed' and self.connected and self.ser:
-                        self._do_set_stir_speed(data)
-                    elif command == 'turn_off_heater' and self.connected and self.ser:
-                        self._do_turn_off_heater()
-                    elif command == 'turn_off_stirrer' and self.connected and self.ser:
-                        self._do_turn_off_stirrer()
-                    elif command == 'save_csv':
-                        self._do_save_csv(data)
-                finally:
-                    self.operation_in_progress = False
+                if command == 'connect':
+                    self.connect()
+                elif command == 'disconnect':
+                    self.disconnect()
+                elif command == 'fit_model':
+                    self._do_fit_model(data)
             except:
                 pass
     
-    def _do_set_temperature(self, temp):
-        """Actually set the temperature (runs in worker thread)"""
+    def _do_export(self, file_path):
+        """Stream the history to file_path chunk by chunk (runs in the export thread)"""
+        progress = lambda written, expected: self.root.after(0, self.show_export_progress, written, expected)
         try:
-            with self.serial_lock:
-                result = hw.set_heater_temp(self.ser, temp)
-            if result:
-                self.root.after(0, lambda: messagebox.showinfo("Success", f"Temperature set to {temp} °C"))
-            else:
-                self.root.after(0, lambda: messagebox.showwarning("Failed", "Failed to set temperature"))
+            rows = export.export_history(self.temp_data, file_path, progress=progress, stop_event=self.export_stop)
+            self.root.after(0, self.finish_export, f"Exported {rows} rows to {file_path}", "green")
+        except export.ExportCancelled:
+            self.root.after(0, self.finish_export, "Export cancelled", "gray")
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Error setting temperature: {str(e)}"))
+            self.root.after(0, self.finish_export, f"Export failed: {e}", "red")
+            message = f"Error exporting data: {str(e)}"
+            self.root.after(0, lambda: messagebox.showerror("Error", message))
     
-    def _do_set_ramp_rate(self, ramp):
-        """Actually set the ramp rate (runs in worker thread)"""
+    def _do_fit_model(self, data):
+        """Fit and store the plate's thermal model (runs in worker thread)"""
+        device = identify.device_name(self.ser)
         try:
-            with self.serial_lock:
-                result = hw.set_heater_ramp(self.ser, ramp)
-            if result:
-                self.root.after(0, lambda: messagebox.showinfo("Success", f"Ramp rate set to {ramp} °C/hr"))
-            else:
-                self.root.after(0, lambda: messagebox.showwarning("Failed", "Failed to set ramp rate"))
+            model, report = identify.fit_trace(data['times'], data['temps'], data.get('setpoints'))
+            identify.save_model(device, model)
+            summary = (f"Time constant heating/cooling: {model.tau_heat:.0f} / {model.tau_cool:.0f} s\n"
+                       f"Dead time: {model.dead_time:.0f} s, ambient: {model.ambient:.1f} °C\n"
+                       f"Fit error: {report['rms']:.2f} °C RMS")
+            self.root.after(0, lambda: messagebox.showinfo("Thermal Model", f"Saved model for {device}\n{summary}"))
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Error setting ramp rate: {str(e)}"))
-    
-    def _do_set_stir_speed(self, speed):
-        """Actually set the stir speed (runs in worker thread)"""
-        try:
-            with self.serial_lock:
-                if speed == 0:
-                    result = hw.set_stir_off(self.ser)
-                else:
-                    result = hw.set_stir(self.ser, speed)
-            
-            if speed == 0:
-                self.root.after(0, lambda: messagebox.showinfo("Success", "Stirrer turned off"))
-            elif result:
-                self.root.after(0, lambda: messagebox.showinfo("Success", f"Stir speed set to {speed} RPM"))
-            else:
-                self.root.after(0, lambda: messagebox.showwarning("Failed", "Failed to set stir speed"))
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Error setting stir speed: {str(e)}"))
-    
-    def _do_turn_off_heater(self):
-        """Actually turn off the heater (runs in worker thread)"""
-        try:
-            with self.serial_lock:
-                result = hw.set_heater_off(self.ser)
-            if result:
-                self.root.after(0, lambda: messagebox.showinfo("Success", "Heater turned off"))
-            else:
-                self.root.after(0, lambda: messagebox.showwarning("Failed", "Failed to turn off heater"))
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Error turning off heater: {str(e)}"))
-    
-    def _do_turn_off_stirrer(self):
-        """Actually turn off the stirrer (runs in worker thread)"""
-        try:
-            with self.serial_lock:
-                result = hw.set_stir_off(self.ser)
-            if result:
-                self.root.after(0, lambda: messagebox.showinfo("Success", "Stirrer turned off"))
-            else:
-                self.root.after(0, lambda: messagebox.showwarning("Failed", "Failed to turn off stirrer"))
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Error turning off stirrer: {str(e)}"))
-    
-    def _do_save_csv(self, data):
-        """Actually save the CSV file (runs in worker thread)"""
-        times = data['times']
-        temps = data['temps']
-        
-        try:
-            # Open file dialog to choose save location
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".csv",
-                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-                title="Save Temperature Data"
-            )
-            
-            if file_path:
-                with open(file_path, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow(["Time (seconds)", "Temperature (°C)"])
-                    for t, temp in zip(times, temps):
-                        writer.writerow([t, temp])
-                
-                self.root.after(0, lambda: messagebox.showinfo("Success", f"Data saved to {file_path}"))
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Error saving CSV: {str(e)}"))
-    
+            msg = f"Error fitting thermal model: {str(e)}"
+            self.root.after(0, lambda m=msg: messagebox.showerror("Error", m))
+
     def on_closing(self):
         """Handle window close event"""
+        self.stop_replay()
+        if self.renderer:
+            self.renderer.stop()
+
+        self.export_stop.set()
+
         # Stop command worker
         self.command_stop.set()
         if self.command_thread and self.command_thread.is_alive():
@@ -844,16 +1516,36 @@ class HotplateGUI:
                 self.polling_stop.set()
                 if self.polling_thread and self.polling_thread.is_alive():
                     self.polling_thread.join(timeout=2)
-                if self.ser:
+                if self.device:
+                    self.device.close()
+                elif self.ser:
                     hw.close_comm(self.ser)
             except:
                 pass
         self.root.destroy()
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hotplate control GUI")
+    parser.add_argument("--simulate", action="store_true",
+                        help="connect to a simulated hotplate instead of the serial port")
+    parser.add_argument("--no-render-worker", action="store_true",
+                        help="draw the plot on the Tk main loop instead of a background render thread")
+    parser.add_argument("--device-process", action="store_true",
+                        help="run serial I/O, polling and recipes in a separate process")
+    parser.add_argument("--profile", nargs="?", const="hotplate_profile", default=None, metavar="PREFIX",
+                        help="sample stacks and allocations until the window closes, written to PREFIX.folded / "
+                             "PREFIX_report.txt")
+    args = parser.parse_args(argv)
+
     root = tk.Tk()
-    app = HotplateGUI(root)
-    root.mainloop()
+    session_profiler = profiler.Profiler(args.profile).start() if args.profile else None
+    app = HotplateGUI(root, simulate=args.simulate, render_worker=not args.no_render_worker,
+                      device_process=args.device_process)
+    try:
+        root.mainloop()
+    finally:
+        if session_profiler:
+            session_profiler.stop()
 
 if __name__ == '__main__':
     main()
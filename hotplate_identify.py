@@ -0,0 +1,276 @@
+######## Hotplate Thermal Model Identification #######
+# Fits per-plate ThermalModel parameters (gain, time constants, dead time,
+# heating vs cooling asymmetry) from recorded temperature logs.
+# Fitted models are stored per device in thermal_models.json and loaded by the
+# estimator, the simulator and the setpoint controller.
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hotplate_estimator import ThermalModel, HEATER_OFF_TEMP
+from hotplate_replay import LOG_EXTENSIONS, load_telemetry
+
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thermal_models.json")
+
+RESAMPLE_PERIOD = 1.0                      # s, logs are resampled onto a uniform grid
+MIN_SEGMENT_SECONDS = 60                   # shorter transients are not fitted
+MIN_SEGMENT_SWING = 3.0                    # °C, smaller transients are not fitted
+DEAD_TIMES = np.arange(0.0, 61.0, 2.0)     # s, candidate dead times
+TIME_CONSTANTS = np.geomspace(10.0, 5000.0, 120)  # s, candidate time constants
+
+
+### Log loading ###
+def load_log(path):
+    """Loads a telemetry log (CSV or .npz export) into (times, temps, setpoints or None)"""
+    telemetry = load_telemetry(path)
+    times, temps = telemetry["elapsed"], telemetry["current_temp"]
+    setpoints = telemetry.get("setpoint_temp")
+    keep = np.isfinite(times) & np.isfinite(temps)
+    return times[keep], temps[keep], None if setpoints is None else setpoints[keep]
+
+
+def _resample(times, values, grid):
+    return np.interp(grid, times, values)
+
+
+### Segment detection ###
+def _segments_from_setpoints(setpoints):
+    """Start/end indices of the spans between setpoint changes"""
+    changes = np.flatnonzero(np.diff(setpoints) != 0) + 1
+    bounds = np.concatenate(([0], changes, [len(setpoints)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _segments_from_slope(temps, window=15, threshold=0.01):
+    """Start/end indices of heating and cooling runs when no setpoint was logged"""
+    if len(temps) < window:
+        return []
+    smooth = np.convolve(temps, np.ones(window) / window, mode="same")
+    slope = np.gradient(smooth)
+    direction = np.where(slope > threshold, 1, np.where(slope < -threshold, -1, 0))
+    # A transient starts where the direction changes to heating or cooling
+    moving = np.flatnonzero(direction != 0)
+    if len(moving) == 0:
+        return []
+    starts = moving[np.concatenate(([True], direction[moving][1:] != direction[moving][:-1]))]
+    bounds = np.concatenate((starts, [len(temps)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+### Least squares fitting ###
+def fit_exponential(t, y, dead_times=DEAD_TIMES, taus=TIME_CONSTANTS):
+    """Least-squares fit of y = final + amplitude*exp(-(t - dead_time)/tau).
+
+    Linear in (final, amplitude) for each candidate (dead_time, tau), so all
+    candidate time constants are solved at once and the best is refined with lstsq.
+    Returns dict(final, amplitude, tau, dead_time, rms) or None.
+    """
+    best = None
+    y_mean = y.mean()
+    for dead_time in dead_times:
+        tt = np.maximum(t - dead_time, 0.0)
+        basis = np.exp(-tt[None, :] / taus[:, None])
+        centered = basis - basis.mean(axis=1, keepdims=True)
+        variance = (centered ** 2).sum(axis=1)
+        valid = variance > 1e-12
+        amplitude = np.where(valid, (centered * (y - y_mean)).sum(axis=1) / np.where(valid, variance, 1.0), 0.0)
+        residual = ((y - y_mean)[None, :] - amplitude[:, None] * centered) ** 2
+        sse = np.where(valid, residual.sum(axis=1), np.inf)
+        i = int(np.argmin(sse))
+        if best is None or sse[i] < best[0]:
+            best = (sse[i], dead_time, taus[i])
+
+    if best is None or not np.isfinite(best[0]):
+        return None
+    _, dead_time, tau = best
+    design = np.column_stack((np.ones_like(t), np.exp(-np.maximum(t - dead_time, 0.0) / tau)))
+    (final, amplitude), residuals, _, _ = np.linalg.lstsq(design, y, rcond=None)
+    sse = residuals[0] if len(residuals) else float(((design @ (final, amplitude) - y) ** 2).sum())
+    return {
+        "final": float(final),
+        "amplitude": float(amplitude),
+        "tau": float(tau),
+        "dead_time": float(dead_time),
+        "rms": float(np.sqrt(sse / len(y)))
+    }
+
+
+def fit_trace(times, temps, setpoints=None):
+    """Fits a ThermalModel to one temperature trace. Returns (model, report)."""
+    times = np.asarray(times, dtype=float)
+    temps = np.asarray(temps, dtype=float)
+    if len(times) < 2:
+        raise ValueError("Not enough samples to fit")
+    order = np.argsort(times)
+    times, temps = times[order], temps[order]
+    grid = np.arange(times[0], times[-1], RESAMPLE_PERIOD)
+    temps = _resample(times, temps, grid)
+
+    if setpoints is not None and np.isfinite(setpoints).any():
+        setpoints = np.asarray(setpoints, dtype=float)[order]
+        valid = np.isfinite(setpoints)
+        # Setpoints are step signals, so hold the previous value instead of interpolating
+        index = np.searchsorted(times[valid], grid, side="right") - 1
+        setpoints = setpoints[valid][np.clip(index, 0, None)]
+        segments = _segments_from_setpoints(setpoints)
+        dead_times = DEAD_TIMES
+    else:
+        setpoints = None
+        segments = _segments_from_slope(temps)
+        # Without the setpoint the start of a transient is unknown, so dead time is not fitted
+        dead_times = np.array([0.0])
+
+    heating, cooling, gains, ambients, rates = [], [], [], [], []
+    for start, end in segments:
+        if (end - start) * RESAMPLE_PERIOD < MIN_SEGMENT_SECONDS:
+            continue
+        y = temps[start:end]
+        if np.ptp(y) < MIN_SEGMENT_SWING:
+            continue
+        t = np.arange(len(y)) * RESAMPLE_PERIOD
+        fit = fit_exponential(t, y, dead_times)
+        if fit is None:
+            continue
+        rising = fit["final"] > y[0]
+        (heating if rising else cooling).append(fit)
+
+        if rising:
+            rates.append(np.percentile(np.gradient(y), 95) * 3600.0 / RESAMPLE_PERIOD)
+        if setpoints is not None:
+            setpoint = setpoints[start]
+            if setpoint <= HEATER_OFF_TEMP:
+                ambients.append(fit["final"])
+            elif rising:
+                gains.append((fit, setpoint))
+        elif not rising and fit["final"] < 35:
+            ambients.append(fit["final"])
+
+    if not heating and not cooling:
+        raise ValueError("No usable heating or cooling transients found")
+
+    model = ThermalModel()
+    if ambients:
+        model.ambient = float(np.median(ambients))
+    if gains:
+        model.gain = float(np.clip(np.median([(fit["final"] - model.ambient) / (setpoint - model.ambient)
+                                              for fit, setpoint in gains]), 0.5, 1.5))
+    if heating:
+        model.tau_heat = float(np.median([fit["tau"] for fit in heating]))
+        model.dead_time = float(np.median([fit["dead_time"] for fit in heating]))
+    if cooling:
+        model.tau_cool = float(np.median([fit["tau"] for fit in cooling]))
+        if not heating:
+            model.dead_time = float(np.median([fit["dead_time"] for fit in cooling]))
+    if rates:
+        model.max_heat_rate = float(max(np.median(rates), 1.0))
+
+    report = {
+        "heating_segments": len(heating),
+        "cooling_segments": len(cooling),
+        "asymmetry": model.tau_cool / model.tau_heat,
+        "rms": float(np.mean([fit["rms"] for fit in heating + cooling]))
+    }
+    return model, report
+
+
+def fit_temperature_data(temp_data, setpoints=None):
+    """Fits a ThermalModel to the GUI's TemperatureData history"""
+    times, temps = temp_data.get_data()
+    return fit_trace(times, temps, setpoints)
+
+
+def fit_log_file(path):
+    """Fits one log file. Returns (path, model dict, report) or (path, None, error)."""
+    try:
+        model, report = fit_trace(*load_log(path))
+        return path, model.to_dict(), report
+    except Exception as e:
+        return path, None, str(e)
+
+
+def fit_directory(directory, workers=None):
+    """Fits every telemetry log (.csv or .npz) in a directory with a process pool and combines the results.
+
+    Returns (combined ThermalModel or None, list of per-file results).
+    """
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(LOG_EXTENSIONS))
+    if not paths:
+        return None, []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(fit_log_file, paths))
+
+    fitted = [values for _, values, _ in results if values]
+    if not fitted:
+        return None, results
+    # Median across runs keeps one bad log from skewing the plate's model
+    combined = {key: float(np.median([values[key] for values in fitted])) for key in fitted[0]}
+    return ThermalModel.from_dict(combined), results
+
+
+### Per-device model storage ###
+def _read_models(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_model(device, path=MODEL_FILE):
+    """Returns the stored ThermalModel for a device, or the default model"""
+    if device is None:
+        return ThermalModel()
+    try:
+        stored = _read_models(path).get(device)
+    except (OSError, ValueError) as e:
+        print(f"Error reading thermal models: {e}")
+        stored = None
+    return ThermalModel.from_dict(stored) if stored else ThermalModel()
+
+
+def save_model(device, model, path=MODEL_FILE):
+    """Stores a fitted ThermalModel for a device"""
+    models = _read_models(path)
+    models[device] = model.to_dict()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(models, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def device_name(ser):
+    """Key used to store a plate's model: the serial port it is connected to"""
+    return getattr(ser, "name", None) or getattr(ser, "port", None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit a hotplate thermal model from logged telemetry")
+    parser.add_argument("logs", help="a telemetry .csv / .npz file or a directory of them")
+    parser.add_argument("--device", help="store the fitted model for this device, e.g. COM3")
+    parser.add_argument("--workers", type=int, default=None, help="processes used for a directory")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.logs):
+        model, results = fit_directory(args.logs, workers=args.workers)
+        for path, values, info in results:
+            print(f"{os.path.basename(path)}: {'ok' if values else 'skipped - ' + info}")
+    else:
+        model, report = fit_trace(*load_log(args.logs))
+        print(report)
+
+    if model is None:
+        print("No model could be fitted")
+        return
+    for key, value in model.to_dict().items():
+        print(f"{key}: {value:.3f}")
+    if args.device:
+        save_model(args.device, model)
+        print(f"Saved thermal model for {args.device}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+######## Hotplate Recipe Job Queue #######
+# Persistent per-plate queue of recipe runs, executed back to back so the
+# plate does not sit idle (and cool down) between jobs.
+# Note: Higher priority runs first. Within a priority, jobs run in the order
+# they were added unless reordering is enabled, which picks the job whose start
+# temperature is cheapest to reach from where the last job left the plate.
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+
+import hotplate_arbiter
+import hotplate_identify
+import hotplate_link
+import hotplate_runscript
+import hotplate_watchdog
+import hotplate_wrapper
+
+QUEUE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOB_STATES = ("pending", "held", "running", "done", "failed", "cancelled")
+
+
+def queue_file(device):
+    """Queue file for a plate, e.g. job_queue_COM3.json"""
+    return os.path.join(QUEUE_DIR, f"job_queue_{re.sub(r'[^A-Za-z0-9_.-]', '_', device or 'default')}.json")
+
+
+def recipe_temps(recipe):
+    """(first target, last target) of a recipe, or None where it has no fixed target"""
+    first_temp = last_temp = None
+    for step in hotplate_runscript.compile_recipe(recipe):
+        if step["target_temp"] is not None:
+            if first_temp is None:
+                first_temp = step["target_temp"]
+            last_temp = step["target_temp"]
+    return first_temp, last_temp
+
+
+def transition_cost(from_temp, to_temp, model):
+    """Relative time to move the plate between two temperatures; cooling is slower than heating"""
+    if from_temp is None or to_temp is None:
+        return 0.0
+    delta = to_temp - max(from_temp, model.ambient)
+    if delta >= 0:
+        return delta * model.tau_heat
+    return -delta * model.tau_cool
+
+
+class JobQueue:
+    """Persistent recipe queue for one plate"""
+    def __init__(self, device, path=None):
+        self.device = device
+        self.path = path or queue_file(device)
+        self.lock = threading.Lock()
+        self.jobs = []
+        self.next_id = 1
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        self.jobs = data.get("jobs", [])
+        self.next_id = data.get("next_id", len(self.jobs) + 1)
+        # A job that was running when the program stopped goes back in line
+        for job in self.jobs:
+            if job["state"] == "running":
+                job["state"] = "pending"
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"device": self.device, "next_id": self.next_id, "jobs": self.jobs}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def add(self, recipe, priority=0, hold=False, control_mode=None):
+        """Queues a recipe (validated now so a bad file fails here, not mid-queue)"""
+        first_temp, last_temp = recipe_temps(recipe)
+        with self.lock:
+            job = {
+                "id": self.next_id,
+                "recipe": os.path.abspath(recipe),
+                "priority": priority,
+                "state": "held" if hold else "pending",
+                "control_mode": control_mode,
+                "first_temp": first_temp,
+                "last_temp": last_temp,
+                "added_at": time.time(),
+                "started_at": None,
+                "finished_at": None
+            }
+            self.next_id += 1
+            self.jobs.append(job)
+            self.save()
+        return job
+
+    def _find(self, job_id):
+        for job in self.jobs:
+            if job["id"] == job_id:
+                return job
+        raise KeyError(f"No job {job_id}")
+
+    def _set_state(self, job_id, state, allowed_from):
+        with self.lock:
+            job = self._find(job_id)
+            if job["state"] not in allowed_from:
+                raise ValueError(f"Job {job_id} is {job['state']}")
+            job["state"] = state
+            if state == "running":
+                job["started_at"] = time.time()
+            elif state in ("done", "failed", "cancelled"):
+                job["finished_at"] = time.time()
+            self.save()
+            return job
+
+    def hold(self, job_id):
+        return self._set_state(job_id, "held", ("pending",))
+
+    def release(self, job_id):
+        return self._set_state(job_id, "pending", ("held",))
+
+    def start(self, job_id):
+        return self._set_state(job_id, "running", ("pending",))
+
+    def finish(self, job_id, state):
+        return self._set_state(job_id, state, ("running",))
+
+    def remove(self, job_id):
+        with self.lock:
+            job = self._find(job_id)
+            if job["state"] == "running":
+                raise ValueError(f"Job {job_id} is running")
+            self.jobs.remove(job)
+            self.save()
+
+    def set_priority(self, job_id, priority):
+        with self.lock:
+            self._find(job_id)["priority"] = priority
+            self.save()
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job["state"] not in ("done", "failed", "cancelled")]
+            self.save()
+
+    def snapshot(self):
+        with self.lock:
+            return [dict(job) for job in self.jobs]
+
+    def next_job(self, plate_temp=None, reorder=False, model=None):
+        """The job to run next, or None. plate_temp is where the plate is (or will be) now."""
+        with self.lock:
+            pending = [job for job in self.jobs if job["state"] == "pending"]
+            if not pending:
+                return None
+            top = max(job["priority"] for job in pending)
+            candidates = [job for job in pending if job["priority"] == top]
+            if not reorder or plate_temp is None:
+                return dict(candidates[0])
+            model = model or hotplate_identify.load_model(self.device)
+            # Cheapest transition first, oldest job breaks ties
+            best = min(candidates, key=lambda job: (transition_cost(plate_temp, job["first_temp"], model),
+                                                    job["added_at"]))
+            return dict(best)
+
+
+def run_queue(ser, queue, reorder=False, stop_event=None, progress_callback=None, serial_lock=None):
+    """Runs pending jobs back to back until the queue is empty or stop_event is set"""
+    try:
+        with serial_lock or nullcontext():
+            plate_temp = hotplate_wrapper.get_temp(ser)
+    except hotplate_wrapper.HotplateResponseError:
+        plate_temp = None
+    while not (stop_event and stop_event.is_set()):
+        job = queue.next_job(plate_temp, reorder)
+        if job is None:
+            return
+        queue.start(job["id"])
+        print(f"Starting job {job['id']}: {os.path.basename(job['recipe'])}")
+        try:
+            hotplate_runscript.run_recipe(ser, job["recipe"], progress_callback=progress_callback,
+                                          stop_event=stop_event, serial_lock=serial_lock,
+                                          control_mode=job.get("control_mode"))
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e}")
+            queue.finish(job["id"], "failed")
+            return
+        state = "cancelled" if stop_event and stop_event.is_set() else "done"
+        queue.finish(job["id"], state)
+        plate_temp = job["last_temp"]
+
+
+def print_queue(queue):
+    print(f"Queue for {queue.device}:")
+    for job in queue.snapshot():
+        print(f"{job['id']:>4}  {job['state']:<9}  priority {job['priority']:>3}  {os.path.basename(job['recipe'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hotplate recipe job queue")
+    parser.add_argument("--device", default="COM3", help="plate the queue belongs to")
+    sub = parser.add_subparsers(dest="action", required=True)
+    add = sub.add_parser("add", help="queue a recipe")
+    add.add_argument("recipe")
+    add.add_argument("--priority", type=int, default=0, help="higher runs first")
+    add.add_argument("--hold", action="store_true", help="queue without releasing it to run")
+    sub.add_parser("list", help="show the queue")
+    for action in ("hold", "release", "remove"):
+        sub.add_parser(action, help=f"{action} a job").add_argument("job_id", type=int)
+    sub.add_parser("clear", help="remove finished jobs")
+    run = sub.add_parser("run", help="run pending jobs back to back")
+    run.add_argument("--reorder", action="store_true",
+                     help="pick the job with the cheapest heat-up/cool-down next")
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(args.device)
+    if args.action == "add":
+        job = queue.add(args.recipe, args.priority, args.hold)
+        print(f"Queued job {job['id']}")
+    elif args.action in ("hold", "release", "remove"):
+        getattr(queue, args.action)(args.job_id)
+    elif args.action == "clear":
+        queue.clear_finished()
+    elif args.action == "run":
+        ser = hotplate_link.SupervisedSerial(lambda: hotplate_wrapper.open_comm(args.device))
+        serial_arbiter = hotplate_arbiter.SerialArbiter()
+        serial_arbiter.attach(ser)
+        # Unattended back-to-back runs need the over-temperature / stale-data cut-off most of all
+        stop_event = threading.Event()
+        watchdog = hotplate_watchdog.Watchdog(ser, serial_arbiter.lane(hotplate_arbiter.SAFETY),
+                                              stop_event=stop_event)
+        watchdog.start()
+        try:
+            run_queue(ser, queue, reorder=args.reorder, stop_event=stop_event,
+                      serial_lock=serial_arbiter.lane(hotplate_arbiter.RECIPE))
+        finally:
+            watchdog.stop()
+            hotplate_wrapper.close_comm(ser)
+            hotplate_arbiter.print_report(serial_arbiter)
+    print_queue(queue)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+######## Hotplate Link Supervisor - Auto-Reconnect #######
+# Serial-port proxy used in place of the pyserial object. When the USB-serial
+# adapter drops out (an I/O error, or the plate stops answering) it reopens the
+# port with backoff, sends the plate back the setpoints it last accepted, and
+# carries on, so a recipe in progress continues after a short outage.
+# Note: Recovery runs in whichever thread hit the failure, while it holds the
+# serial lock, so other threads simply wait for the link instead of failing too.
+
+import hotplate_clock
+import hotplate_wrapper
+
+STALE_READS = 5          # consecutive reads with no reply before the link counts as dead
+BACKOFF_START = 0.25     # s before the first reopen attempt, doubled after each failure
+BACKOFF_MAX = 4.0        # s, longest wait between attempts
+MAX_OUTAGE = 60.0        # s, give up (LinkDownError) if the port cannot be reopened within this
+
+
+class LinkDownError(OSError):
+    """Raised when the port could not be reopened within max_outage"""
+
+
+class SupervisedSerial:
+    """Reconnecting stand-in for a serial port.
+
+    opener() returns a freshly opened port (e.g. hotplate_wrapper.open_comm);
+    on_event gets link_lost / link_restored / link_down dicts.
+    """
+    def __init__(self, opener, on_event=None, max_outage=MAX_OUTAGE, clock=None):
+        self.opener = opener
+        self.on_event = on_event
+        self.max_outage = max_outage
+        self.clock = clock or hotplate_clock.SYSTEM_CLOCK
+        self.raw = opener()
+        self.closed = False
+        self.empty_reads = 0
+        self.recoveries = []     # seconds each past outage took to recover
+        # Last setpoints the plate was sent, restored after a reconnect
+        self.state = {"setpoint": None, "ramp": None, "stir": None}
+        self.off_pending = False     # a cut_off that must reach the plate before anything is restored
+
+    @property
+    def name(self):
+        return getattr(self.raw, "name", None)
+
+    @property
+    def port(self):
+        return getattr(self.raw, "port", None)
+
+    @property
+    def timeout(self):
+        return self.raw.timeout
+
+    @property
+    def is_open(self):
+        return not self.closed
+
+    ### pyserial API ###
+    def write(self, data):
+        self._remember(data)
+        try:
+            return self.raw.write(data)
+        except OSError as e:
+            self._recover(e)
+            return self.raw.write(data)
+
+    @property
+    def in_waiting(self):
+        try:
+            return self.raw.in_waiting
+        except OSError as e:
+            self._recover(e)
+            return 0
+
+    def read(self, size=1):
+        try:
+            data = self.raw.read(size)
+        except OSError as e:
+            # The reply is lost; the caller sees no data for this command
+            self._recover(e)
+            return b''
+        if data:
+            self.empty_reads = 0
+        else:
+            self.empty_reads += 1
+            if self.empty_reads >= STALE_READS:
+                self._recover("no reply to the last %d commands" % self.empty_reads)
+        return data
+
+    def reset_input_buffer(self):
+        try:
+            self.raw.reset_input_buffer()
+        except OSError as e:
+            self._recover(e)
+
+    def close(self):
+        self.closed = True
+        self.raw.close()
+
+    def cut_off(self):
+        """Heater and stirrer off from a thread that cannot get the serial lock (e.g. the watchdog).
+
+        Written straight to the port without reading replies. The setpoints are
+        forgotten, and if a reconnect is in progress the off commands are sent
+        first thing on the reopened port instead of the old setpoints.
+        """
+        frames = hotplate_wrapper.encode_command("set_heater_off") + hotplate_wrapper.encode_command("set_stir_off")
+        self._remember(frames)
+        self.off_pending = True
+        try:
+            self.raw.write(frames)
+            self.off_pending = False
+        except Exception:
+            pass
+
+    ### Supervision ###
+    def _remember(self, data):
+        """Tracks the plate's setpoints from outgoing command frames"""
+        for frame in bytes(data).split(b'\r'):
+            frame = frame.decode('utf-8', errors='ignore').strip()
+            code, argument = frame[:1], frame[1:]
+            try:
+                self._remember_command(code, argument)
+            except ValueError:
+                pass
+
+    def _remember_command(self, code, argument):
+        if code == hotplate_wrapper.COMMANDS["set_heater_temp"].code:
+            self.state["setpoint"] = float(argument)
+        elif code == hotplate_wrapper.COMMANDS["set_heater_off"].code:
+            self.state["setpoint"] = None
+        elif code == hotplate_wrapper.COMMANDS["set_heater_ramp"].code:
+            self.state["ramp"] = float(argument)
+        elif code == hotplate_wrapper.COMMANDS["set_stir"].code:
+            self.state["stir"] = int(float(argument))
+        elif code == hotplate_wrapper.COMMANDS["set_stir_off"].code:
+            self.state["stir"] = None
+
+    def _notify(self, event):
+        if self.on_event:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                print(f"Link event handler failed: {e}")
+
+    def _recover(self, reason):
+        """Reopens the port with backoff and restores the setpoints. Returns the outage in seconds."""
+        if self.closed:
+            raise LinkDownError("port was closed")
+        print(f"Hotplate link lost ({reason}), reconnecting...")
+        self._notify({"type": "link_lost", "reason": str(reason)})
+        started = self.clock.time()
+        delay = BACKOFF_START
+        attempts = 0
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+        while True:
+            attempts += 1
+            try:
+                raw = self.opener()
+                self._restore(raw)
+                break
+            except (OSError, hotplate_wrapper.HotplateResponseError) as e:
+                waited = self.clock.time() - started
+                if waited + delay > self.max_outage:
+                    self._notify({"type": "link_down", "seconds": waited, "attempts": attempts})
+                    raise LinkDownError(f"Could not reopen the hotplate port within {self.max_outage:.0f} s: {e}")
+                self.clock.sleep(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+        self.raw = raw
+        self.empty_reads = 0
+        seconds = self.clock.time() - started
+        self.recoveries.append(seconds)
+        print(f"Hotplate link restored after {seconds:.1f} s ({attempts} attempt(s))")
+        self._notify({"type": "link_restored", "seconds": seconds, "attempts": attempts,
+                      "state": dict(self.state)})
+        return seconds
+
+    def _restore(self, raw):
+        """Checks a freshly opened port answers, then sends it the cached setpoints"""
+        try:
+            hotplate_wrapper.get_temp(raw)
+            if self.off_pending:
+                hotplate_wrapper.set_heater_off(raw)
+                hotplate_wrapper.set_stir_off(raw)
+                self.off_pending = False
+            state = self.state
+            if state["setpoint"] is not None:
+                hotplate_wrapper.set_heater_temp(raw, state["setpoint"])
+            if state["ramp"] is not None:
+                hotplate_wrapper.set_heater_ramp(raw, state["ramp"])
+            if state["stir"] is not None:
+                hotplate_wrapper.set_stir(raw, state["stir"])
+        except BaseException:
+            # A port left open here would make every later reopen fail (access denied on Windows)
+            raw.close()
+            raise
@@ -0,0 +1,194 @@
+######## Hotplate Profiling Mode #######
+# Low-overhead profiling of a real run on the lab PC: a sampling thread records
+# every thread's Python stack at a fixed interval, named sections (wrapper
+# calls, GUI updates, queue drains) are timed, recipe phases are timed from the
+# progress events, and tracemalloc snapshots show where memory went.
+# Note: Results are written when the profiler stops: PREFIX.folded holds the
+# stacks in the folded format flamegraph.pl / speedscope read, PREFIX_report.txt
+# the section, phase and allocation tables. With no profiler running, section()
+# costs one global lookup.
+
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import hotplate_telemetry
+
+SAMPLE_INTERVAL = 0.01     # s between stack samples
+TRACE_FRAMES = 10          # frames kept per allocation traceback
+TOP_ALLOCATIONS = 25       # lines listed in the allocation report
+
+_active = None
+_NO_SECTION = contextlib.nullcontext()
+
+
+def section(name):
+    """Context manager timing a named hot path while a profiler is running"""
+    profiler = _active
+    return profiler.section(name) if profiler else _NO_SECTION
+
+
+def timed(name):
+    """Decorator: times every call of the function as section name"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with section(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def recipe_event(update):
+    """Feeds a run_recipe progress event to the running profiler, if any, to time recipe phases"""
+    profiler = _active
+    if profiler:
+        profiler.recipe_event(update)
+
+
+class _Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.profiler.sections, self.name, time.perf_counter() - self.started)
+
+
+class Profiler:
+    """Stack sampler plus section / phase timers and tracemalloc snapshots"""
+    def __init__(self, prefix="hotplate_profile", interval=SAMPLE_INTERVAL, allocations=True):
+        self.prefix = prefix
+        self.interval = interval
+        self.allocations = allocations
+        self.stacks = Counter()
+        self.sections = {}       # name -> [count, total s, max s]
+        self.phases = {}
+        self.phase = None
+        self.phase_started = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self.started = None
+        self.first_snapshot = None
+
+    def start(self):
+        global _active
+        if self.allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self.first_snapshot = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self.thread.start()
+        _active = self
+        return self
+
+    def stop(self):
+        """Stops sampling, writes the folded stacks and the report, and returns the report text"""
+        global _active
+        if _active is self:
+            _active = None
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+        self._end_phase()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if snapshot:
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                               tracemalloc.Filter(False, __file__)])
+        peak = tracemalloc.get_traced_memory()[1] if snapshot else None
+        if self.first_snapshot:
+            tracemalloc.stop()
+
+        with open(self.prefix + ".folded", 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        report = self.report(snapshot, peak)
+        with open(self.prefix + "_report.txt", 'w') as f:
+            f.write(report)
+        print(f"Profile written to {self.prefix}.folded and {self.prefix}_report.txt")
+        return report
+
+    ### Timing ###
+    def section(self, name):
+        return _Section(self, name)
+
+    def add_time(self, table, name, seconds):
+        with self.lock:
+            entry = table.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def recipe_event(self, update):
+        kind = update.get("type")
+        if kind in hotplate_telemetry.PHASE_EVENTS:
+            self._end_phase()
+            self.phase, self.phase_started = hotplate_telemetry.PHASE_EVENTS[kind], time.perf_counter()
+        elif kind in ("done", "cancelled", "error"):
+            self._end_phase()
+
+    def _end_phase(self):
+        if self.phase:
+            self.add_time(self.phases, self.phase, time.perf_counter() - self.phase_started)
+        self.phase = None
+
+    ### Sampling ###
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            started = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[self._fold(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+            self.sample_seconds += time.perf_counter() - started
+
+    @staticmethod
+    def _fold(thread_name, frame):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ";".join(reversed(frames))
+
+    ### Report ###
+    @staticmethod
+    def _timing_table(title, table):
+        lines = [f"{title:<28} {'count':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+        for name, (count, total, longest) in sorted(table.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<28} {count:>8} {total:>10.2f} {total / count * 1000:>10.2f} {longest * 1000:>10.2f}")
+        return lines
+
+    def report(self, snapshot=None, peak=None):
+        elapsed = time.perf_counter() - self.started
+        overhead = self.sample_seconds / elapsed * 100 if elapsed else 0.0
+        lines = [f"Profiled {elapsed:.1f} s, {self.samples} stack samples every {self.interval * 1000:.0f} ms "
+                 f"(sampler overhead {overhead:.1f}%)", ""]
+        lines += self._timing_table("Section", self.sections) + [""]
+        lines += self._timing_table("Recipe phase", self.phases) + [""]
+        if snapshot is not None:
+            lines.append(f"Traced memory peak: {peak / 1e6:.1f} MB")
+            lines.append(f"Top {TOP_ALLOCATIONS} allocation sites still held at the end:")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                lines.append(f"  {stat.size / 1024:>10.1f} KiB {stat.count:>8} blocks  {stat.traceback[0]}")
+            if self.first_snapshot:
+                lines.append(f"Top {TOP_ALLOCATIONS} growth since the start:")
+                for stat in snapshot.compare_to(self.first_snapshot, "lineno")[:TOP_ALLOCATIONS]:
+                    lines.append(f"  {stat.size_diff / 1024:>+10.1f} KiB {stat.count_diff:>+8} blocks  "
+                                 f"{stat.traceback[0]}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,193 @@
+######## Hotplate Ramp Profiles - Streamed Setpoints #######
+# Executes RAMP, SOAK and PROFILE recipe steps by streaming interpolated
+# setpoints to the plate on a monotonic schedule.
+# Note: A setpoint is only written when its rounded value changes, so a slow
+# ramp costs one serial write per degree rather than one per tick.
+
+import math
+import time
+
+import numpy as np
+
+DEFAULT_RATE_HZ = 1.0      # setpoint ticks per second
+PROFILE_RAMP_RATE = 600    # °C/hr, the plate's fastest ramp; set while streaming so the profile does the ramping
+INTERPOLATIONS = ("linear", "spline")
+PROFILE_KEYWORDS = ("RAMP", "SOAK", "PROFILE")
+
+
+def is_profile_line(line):
+    """True for RAMP / SOAK / PROFILE recipe lines"""
+    words = line.split()
+    return bool(words) and words[0].upper() in PROFILE_KEYWORDS
+
+
+def compile_profile_line(line):
+    """Compiles a RAMP, SOAK or PROFILE recipe line into a profile step.
+
+    RAMP <temp> <seconds>             linear ramp from the current setpoint
+    SOAK <seconds>                    hold the current setpoint
+    PROFILE <linear|spline> t:T ...   setpoint T at t seconds into the step, t starts at 0
+    A temp of None in the compiled step means "the setpoint when the step starts".
+    """
+    words = line.split()
+    keyword = words[0].upper()
+    times, temps, interp = None, None, "linear"
+    try:
+        if keyword == "RAMP" and len(words) == 3:
+            times, temps = [0.0, float(words[2])], [None, float(words[1])]
+        elif keyword == "SOAK" and len(words) == 2:
+            times, temps = [0.0, float(words[1])], [None, None]
+        elif keyword == "PROFILE" and len(words) >= 4 and words[1].lower() in INTERPOLATIONS:
+            interp = words[1].lower()
+            points = [word.split(":") for word in words[2:]]
+            times = [float(t) for t, _ in points]
+            temps = [float(temp) for _, temp in points]
+    except ValueError:
+        times = None
+    if not times or times[0] != 0 or any(b <= a for a, b in zip(times, times[1:])):
+        raise Exception(f"File invalid - bad profile line: {line}")
+
+    return {
+        "kind": "profile",
+        "profile": keyword.lower(),
+        "times": times,
+        "temps": temps,
+        "interp": interp,
+        "target_temp": temps[-1],
+        "ramp_rate": None,
+        "stir_speed": None,
+        "dwell_seconds": times[-1],
+        "stabilize": 0
+    }
+
+
+def _pchip(x, y, xi):
+    """Monotone piecewise cubic interpolation, so a spline never overshoots its points"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    h = np.diff(x)
+    delta = np.diff(y) / h
+
+    slopes = np.zeros_like(y)
+    if len(x) > 2:
+        w1 = 2 * h[1:] + h[:-1]
+        w2 = h[1:] + 2 * h[:-1]
+        same_sign = delta[:-1] * delta[1:] > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            harmonic = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        slopes[1:-1] = np.where(same_sign, harmonic, 0.0)
+    slopes[0] = delta[0]
+    slopes[-1] = delta[-1]
+
+    xi = np.clip(np.asarray(xi, dtype=float), x[0], x[-1])
+    k = np.clip(np.searchsorted(x, xi, side="right") - 1, 0, len(h) - 1)
+    s = (xi - x[k]) / h[k]
+    h00 = (1 + 2 * s) * (1 - s) ** 2
+    h10 = s * (1 - s) ** 2
+    h01 = s ** 2 * (3 - 2 * s)
+    h11 = s ** 2 * (s - 1)
+    return h00 * y[k] + h10 * h[k] * slopes[k] + h01 * y[k + 1] + h11 * h[k] * slopes[k + 1]
+
+
+def resolve_points(step, start_temp):
+    """Profile (times, temps) with the leading 'current setpoint' point filled in"""
+    temps = [start_temp if temp is None else temp for temp in step["temps"]]
+    # A SOAK holds whatever the previous step left behind
+    temps = [temps[i - 1] if temp is None else temp for i, temp in enumerate(temps)]
+    return np.asarray(step["times"], dtype=float), np.asarray(temps, dtype=float)
+
+
+def profile_setpoints(times, temps, t, interp="linear"):
+    """Interpolated setpoints at times t (s from profile start)"""
+    if len(times) < 2 or interp == "linear":
+        return np.interp(t, times, temps)
+    return _pchip(times, temps, t)
+
+
+class TimingStats:
+    """Running lateness statistics of a streamed profile"""
+    def __init__(self):
+        self.ticks = 0
+        self.writes = 0
+        self.skipped = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.max = 0.0
+
+    def add(self, lateness):
+        # Welford's running mean / variance
+        self.ticks += 1
+        delta = lateness - self.mean
+        self.mean += delta / self.ticks
+        self._m2 += delta * (lateness - self.mean)
+        self.max = max(self.max, lateness)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.ticks) if self.ticks > 1 else 0.0
+
+    def to_dict(self):
+        return {
+            "ticks": self.ticks,
+            "writes": self.writes,
+            "skipped_ticks": self.skipped,
+            "mean_lateness": self.mean,
+            "std_lateness": self.std,
+            "max_lateness": self.max
+        }
+
+
+def stream_profile(write_setpoint, times, temps, interp="linear", rate_hz=DEFAULT_RATE_HZ,
+                   stop_event=None, continue_event=None, on_tick=None, current_setpoint=None,
+                   start_offset=0.0, clock=time.monotonic, sleep=time.sleep):
+    """Streams a setpoint profile, writing only when the rounded setpoint changes.
+
+    Ticks are scheduled against absolute monotonic deadlines, so timing errors do
+    not accumulate; ticks missed by more than a period are skipped, not bursted.
+    start_offset (s) resumes a profile part way through.
+    Returns (completed, TimingStats).
+    """
+    period = 1.0 / rate_hz
+    duration = float(times[-1])
+    tick_count = int(math.floor(duration / period)) + 1
+    grid = np.arange(tick_count) * period
+    if grid[-1] < duration:
+        grid = np.append(grid, duration)
+    grid = np.concatenate(([start_offset], grid[grid > start_offset])) if start_offset > 0 else grid
+    setpoints = np.rint(profile_setpoints(times, temps, grid, interp)).astype(int)
+
+    stats = TimingStats()
+    written = current_setpoint
+    start = clock() - grid[0]
+    i = 0
+    while i < len(grid):
+        if stop_event and stop_event.is_set():
+            return False, stats
+        if continue_event and continue_event.is_set():
+            continue_event.clear()
+            break
+
+        deadline = start + float(grid[i])
+        now = clock()
+        if now < deadline:
+            sleep(deadline - now)
+            now = clock()
+        lateness = now - deadline
+        stats.add(lateness)
+
+        # Jump to the newest tick that is due instead of replaying missed ones
+        due = int(np.searchsorted(grid, now - start, side="right")) - 1
+        if due > i:
+            stats.skipped += due - i
+            i = due
+
+        setpoint = int(setpoints[i])
+        if setpoint != written:
+            write_setpoint(setpoint)
+            stats.writes += 1
+            written = setpoint
+        if on_tick:
+            on_tick(setpoint, duration - grid[i])
+        i += 1
+
+    return True, stats
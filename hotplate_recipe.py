@@ -0,0 +1,154 @@
+######## Hotplate Recipe Language #######
+# Parses recipe files into a compact tree that is expanded into steps lazily,
+# so a 10,000-cycle thermal test costs the same memory and parse time as one cycle.
+# Note: Plain recipes (one "temp ramp stir dwell stabilize" line per step, plus
+# RAMP / SOAK / PROFILE lines) are valid as they are. Version 2 adds:
+#   let NAME = VALUE          constant, used as $NAME in later lines
+#   repeat COUNT {  ...  }    repeat the enclosed lines COUNT times (may nest)
+#   include other.txt         insert another recipe file (path relative to this one)
+
+import os
+import re
+
+import hotplate_ramps
+
+LET = re.compile(r"^let\s+([A-Za-z_]\w*)\s*=\s*(\S+)$", re.IGNORECASE)
+REPEAT = re.compile(r"^repeat\s+(\S+)\s*\{$", re.IGNORECASE)
+INCLUDE = re.compile(r"^include\s+(.+)$", re.IGNORECASE)
+VARIABLE = re.compile(r"\$([A-Za-z_]\w*)")
+
+
+class RecipeError(Exception):
+    """Invalid recipe, with the file and line it was found on"""
+
+
+class _Repeat:
+    """repeat block: body runs count times"""
+    def __init__(self, count, body):
+        self.count = count
+        self.body = body
+        self.cycle = _size(body)
+        self.size = self.cycle * count
+
+
+def _size(nodes):
+    return sum(node.size if isinstance(node, _Repeat) else 1 for node in nodes)
+
+
+def compile_step_line(line):
+    """Compiles one step line (after variable substitution) into a step dict"""
+    if hotplate_ramps.is_profile_line(line):
+        return hotplate_ramps.compile_profile_line(line)
+    onecmd_values = list(map(int, re.findall(r"-?\d+", line)))
+    if len(onecmd_values) != 5:
+        raise Exception("File invalid - not all commands have 5 inputs!")
+    return {
+        "kind": "setpoint",
+        "target_temp": onecmd_values[0],
+        "ramp_rate": onecmd_values[1],
+        "stir_speed": onecmd_values[2],
+        "dwell_seconds": onecmd_values[3],
+        "stabilize": onecmd_values[4]
+    }
+
+
+class Recipe:
+    """A parsed recipe: len() is the step count, iterating yields step dicts.
+
+    Steps inside a repeat are the same dict objects on every cycle, so
+    callers must not modify the steps they are given.
+    """
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.files = []           # the recipe and every file it includes
+        self.variables = {}
+        self.body = self._parse_file(self.path, ())
+        self.size = _size(self.body)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return self._expand(self.body, 0)
+
+    def enumerate(self, start=1):
+        """(step number, step) pairs from step number start on, skipping earlier steps without expanding them"""
+        return enumerate(self._expand(self.body, max(start, 1) - 1), start=max(start, 1))
+
+    def _expand(self, nodes, skip):
+        for node in nodes:
+            size = node.size if isinstance(node, _Repeat) else 1
+            if skip >= size:
+                skip -= size
+                continue
+            if isinstance(node, _Repeat):
+                for _ in range(skip // node.cycle, node.count):
+                    yield from self._expand(node.body, skip % node.cycle)
+                    skip = 0
+            else:
+                yield node
+            skip = 0
+
+    ### Parsing ###
+    def _parse_file(self, path, including):
+        if path in including:
+            raise RecipeError(f"File invalid - {os.path.basename(path)} includes itself")
+        if path not in self.files:
+            self.files.append(path)
+        with open(path, 'r') as file:
+            lines = [(number, line.strip()) for number, line in enumerate(file, start=1)]
+        lines = [(number, line) for number, line in lines if line and not line.startswith("#")]
+        body, end = self._parse_block(path, lines, 0, including + (path,))
+        if end < len(lines):
+            raise RecipeError(f"File invalid - {os.path.basename(path)} line {lines[end][0]}: unmatched }}")
+        return body
+
+    def _parse_block(self, path, lines, i, including):
+        """Parses lines[i:] up to a closing brace. Returns (nodes, index of the brace or len(lines))."""
+        nodes = []
+        while i < len(lines):
+            number, line = lines[i]
+            where = f"{os.path.basename(path)} line {number}"
+            if line == "}":
+                return nodes, i
+            try:
+                line = self._substitute(line)
+                let = LET.match(line)
+                repeat = REPEAT.match(line)
+                include = INCLUDE.match(line)
+                if let:
+                    self.variables[let.group(1)] = let.group(2)
+                elif repeat:
+                    count = int(repeat.group(1))
+                    if count < 0:
+                        raise ValueError(f"repeat count {count}")
+                    body, end = self._parse_block(path, lines, i + 1, including)
+                    if end >= len(lines):
+                        raise Exception("repeat block is missing its closing }")
+                    nodes.append(_Repeat(count, body))
+                    i = end
+                elif include:
+                    included = os.path.join(os.path.dirname(path), include.group(1).strip())
+                    nodes.extend(self._parse_file(os.path.abspath(included), including))
+                else:
+                    nodes.append(compile_step_line(line))
+            except RecipeError:
+                raise
+            except Exception as e:
+                message = str(e).replace("File invalid - ", "")
+                raise RecipeError(f"File invalid - {where}: {message}")
+            i += 1
+        return nodes, i
+
+    def _substitute(self, line):
+        def value(match):
+            name = match.group(1)
+            if name not in self.variables:
+                raise ValueError(f"undefined variable ${name}")
+            return self.variables[name]
+        return VARIABLE.sub(value, line)
+
+
+def load_recipe(path):
+    """Parses and validates a recipe file"""
+    return Recipe(path)
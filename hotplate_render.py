@@ -0,0 +1,129 @@
+######## Hotplate Plot Rendering #######
+# Draws the temperature plot, either on the Tk canvas or in a background
+# render worker that rasterizes it into an off-screen Agg buffer, so the Tk
+# main loop only has to blit the finished image.
+# Note: The worker owns its own Figure and never touches Tk; requests made
+# while it is busy replace each other, so it always draws the newest data.
+
+import threading
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+import hotplate_profiler
+
+PLOT_WINDOW = 43200    # s shown unless full history is selected (12 hours)
+
+
+def _format_seconds(seconds, pos):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def draw_temperature_plot(figure, ax, series, full_history=False):
+    """Draws a TemperatureData.get_series() dict onto ax"""
+    times, temps, lows, highs = series["time"], series["temp"], series["min"], series["max"]
+
+    ax.clear()
+    if len(times):
+        ax.plot(times, temps, 'b-', linewidth=2, label='Temperature')
+        # Min/max band where the history has been rolled up into buckets
+        if np.any(highs > lows):
+            ax.fill_between(times, lows, highs, color='b', alpha=0.15, linewidth=0)
+
+        # Set x-axis to show last 12 hours (or the whole run), with right side at current time
+        current_time = times[-1]
+        left_limit = times[0] if full_history else max(0, current_time - PLOT_WINDOW)
+        ax.set_xlim([left_limit, current_time])
+
+        # Format x-axis as time labels
+        ax.xaxis.set_major_formatter(FuncFormatter(_format_seconds))
+        figure.autofmt_xdate()  # Rotate and align the tick labels
+
+        # Setpoint history as a dashed step line (only where 20°C or higher)
+        setpoints = np.where(series["setpoint"] >= 20, series["setpoint"], np.nan)
+        if np.any(np.isfinite(setpoints)):
+            ax.plot(times, setpoints, 'g--', alpha=0.7, drawstyle='steps-post', label='Setpoint')
+
+        # Recipe step markers where the step number changes
+        steps = np.nan_to_num(series["step"])
+        for i in np.flatnonzero(np.diff(steps)) + 1:
+            if steps[i] > 0:
+                ax.axvline(times[i], color='gray', linestyle=':', alpha=0.6)
+                ax.annotate(f"{steps[i]:.0f}", (times[i], 1), xycoords=('data', 'axes fraction'),
+                            fontsize=7, color='gray', ha='left', va='top')
+
+    ax.set_xlabel("Elapsed Time (hh:mm)")
+    ax.set_ylabel("Temperature (°C)")
+    ax.set_title("Temperature vs Time")
+    ax.grid(True, alpha=0.3)
+    if len(times):
+        ax.legend(loc='upper left')
+
+
+class PlotRenderer:
+    """Background thread rendering the plot to PPM image bytes for a Tk PhotoImage"""
+    def __init__(self, dpi=100):
+        self.figure = Figure(dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot(111)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.image = None
+        self.stopped = False
+        self.renders = 0
+        self.max_render_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, series, width, height, full_history=False):
+        """Asks for a redraw at width x height pixels; replaces any request not yet started"""
+        with self.condition:
+            self.pending = (series, max(int(width), 50), max(int(height), 50), full_history)
+            self.condition.notify()
+
+    def take_image(self):
+        """The newest finished image as PPM bytes, or None if nothing new was drawn"""
+        with self.condition:
+            image, self.image = self.image, None
+            return image
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                series, width, height, full_history = self.pending
+                self.pending = None
+            started = time.perf_counter()
+            try:
+                with hotplate_profiler.section("plot render"):
+                    image = self._render(series, width, height, full_history)
+            except Exception as e:
+                print(f"Error rendering plot: {e}")
+                continue
+            self.renders += 1
+            self.max_render_seconds = max(self.max_render_seconds, time.perf_counter() - started)
+            with self.condition:
+                self.image = image
+
+    def _render(self, series, width, height, full_history):
+        dpi = self.figure.dpi
+        self.figure.set_size_inches(width / dpi, height / dpi)
+        draw_temperature_plot(self.figure, self.ax, series, full_history)
+        self.canvas.draw()
+        rgba = np.asarray(self.canvas.buffer_rgba())
+        header = b"P6 %d %d 255\n" % (rgba.shape[1], rgba.shape[0])
+        return header + np.ascontiguousarray(rgba[:, :, :3]).tobytes()
@@ -0,0 +1,154 @@
+######## Hotplate Telemetry Replay #######
+# Replays a recorded telemetry log into the GUI's polling queue at 1x, 10x,
+# 100x ... speed, so post-mortems and plot stress tests use the same data path
+# as live polling.
+# Note: Seeking only moves the replay index; the GUI reloads history up to the
+# seek point in one bulk call instead of re-streaming it.
+
+import csv
+import threading
+import time
+
+import numpy as np
+
+from hotplate_export import load_npz
+from hotplate_telemetry import PHASES
+
+TICK = 0.05    # s between pushes to the queue
+LOG_EXTENSIONS = (".csv", ".npz")   # telemetry logs load_telemetry reads
+
+# CSV header prefix -> polling sample key
+COLUMNS = {
+    "time": "elapsed",
+    "temp": "current_temp",
+    "setpoint": "setpoint_temp",
+    "ramp": "ramp_rate",
+    "stir": "stir_speed",
+    "step": "step"
+}
+
+
+def load_telemetry(path):
+    """Loads a telemetry CSV (or a columnar .npz export) into a dict of numpy columns keyed like polling samples"""
+    if path.lower().endswith(".npz"):
+        columns = load_npz(path)
+        telemetry = {key: columns[name] for name, key in COLUMNS.items() if name in columns}
+        if "phase" in columns:
+            telemetry["phase"] = columns["phase"]
+        order = np.argsort(telemetry["elapsed"], kind="stable")
+        return {key: values[order] for key, values in telemetry.items()}
+
+    with open(path, 'r', newline='', encoding='utf-8', errors='ignore') as csvfile:
+        reader = csv.reader(csvfile)
+        header = [h.strip().lower() for h in next(reader)]
+        rows = [row for row in reader if row]
+
+    telemetry = {}
+    for i, name in enumerate(header):
+        for prefix, key in COLUMNS.items():
+            if name.startswith(prefix) and key not in telemetry:
+                telemetry[key] = np.array([float(row[i]) if row[i] else np.nan for row in rows])
+        # Recipe phase is stored by name; keep it as its PHASES index like the live history does
+        if name == "phase" and "phase" not in telemetry:
+            telemetry["phase"] = np.array([PHASES.index(row[i]) if row[i] in PHASES else np.nan for row in rows])
+    if "elapsed" not in telemetry or "current_temp" not in telemetry:
+        raise ValueError(f"{path}: no time/temperature columns")
+    order = np.argsort(telemetry["elapsed"], kind="stable")
+    return {key: values[order] for key, values in telemetry.items()}
+
+
+class TelemetryReplayer:
+    """Background thread pushing recorded samples into a queue at a chosen speed"""
+    def __init__(self, telemetry, output_queue, speed=1.0):
+        self.telemetry = telemetry
+        self.times = telemetry["elapsed"]
+        self.output_queue = output_queue
+        self.speed = speed
+        self.paused = False
+        self.index = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self._anchor_position = self.start_time
+        self._anchor_real = time.monotonic()
+
+    @property
+    def start_time(self):
+        return float(self.times[0]) if len(self.times) else 0.0
+
+    @property
+    def end_time(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    @property
+    def finished(self):
+        return self.index >= len(self.times)
+
+    def position(self):
+        """Current replay time (s into the log)"""
+        with self.lock:
+            return self._position()
+
+    def _position(self):
+        if self.paused:
+            return self._anchor_position
+        return self._anchor_position + (time.monotonic() - self._anchor_real) * self.speed
+
+    def _rebase(self, position):
+        self._anchor_position = position
+        self._anchor_real = time.monotonic()
+
+    def sample(self, i):
+        """Sample i as a polling-queue dict"""
+        return {key: (None if np.isnan(values[i]) else float(values[i]))
+                for key, values in self.telemetry.items()}
+
+    def history(self, end_index):
+        """Columns up to end_index, for bulk-loading the plot after a seek"""
+        return {key: values[:end_index] for key, values in self.telemetry.items()}
+
+    def start(self):
+        self.stop_event.clear()
+        with self.lock:
+            self._rebase(self._anchor_position)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=1)
+
+    def set_speed(self, speed):
+        with self.lock:
+            self._rebase(self._position())
+            self.speed = speed
+
+    def set_paused(self, paused):
+        with self.lock:
+            self._rebase(self._position())
+            self.paused = paused
+
+    def seek(self, position):
+        """Jumps to a time in the log. Returns the index of the first sample not yet replayed."""
+        with self.lock:
+            position = min(max(position, self.start_time), self.end_time)
+            self.index = int(np.searchsorted(self.times, position, side="right"))
+            self._rebase(position)
+            # Drop samples queued from before the seek
+            while not self.output_queue.empty():
+                try:
+                    self.output_queue.get_nowait()
+                except Exception:
+                    break
+            return self.index
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                if not self.paused and not self.finished:
+                    end = int(np.searchsorted(self.times, self._position(), side="right"))
+                    for i in range(self.index, end):
+                        self.output_queue.put(self.sample(i))
+                    self.index = max(self.index, end)
+            self.stop_event.wait(TICK)
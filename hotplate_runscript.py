@@ -3,32 +3,128 @@
 # Date: Oct 26, 2025
 
 import hotplate_wrapper
-import sys
-import re
-import time
-from datetime import datetime
+import hotplate_estimator
+import hotplate_identify
+import hotplate_control
+import hotplate_ramps
+import hotplate_checkpoint
+import hotplate_recipe
+import hotplate_clock
+import hotplate_link
+import hotplate_watchdog
+import hotplate_arbiter
+import hotplate_profiler
+import argparse
+import threading
 from contextlib import nullcontext
 
 def parse_recipe_file(input_file):
-    with open(input_file, 'r') as file:
-        lines = file.readlines()
-        lines = [line.strip() for line in lines if line.strip()]
-    commands = [line for line in lines if not line.strip().startswith("#")]
+    """Parses and validates a recipe (plain or v2 syntax, see hotplate_recipe)"""
+    return hotplate_recipe.load_recipe(input_file)
 
-    for onecmd in commands:
-        numbers = re.findall(r"-?\d+", onecmd)
-        onecmd_values = list(map(int, numbers))
-        if len(onecmd_values) != 5:
-            raise Exception("File invalid - not all commands have 5 inputs!")
-
-    return commands
+def compile_recipe(input_file):
+    """Compiles a recipe file into a lazily expanded sequence of step dictionaries"""
+    return parse_recipe_file(input_file)
 
 def _lock_context(serial_lock):
     return serial_lock if serial_lock else nullcontext()
 
-def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continue_event=None, serial_lock=None):
-    commands = parse_recipe_file(input_file)
-    total_steps = len(commands)
+def _try_read(getter, ser):
+    """getter(ser), or None when the plate gave no usable reply (the sample is skipped, not read as 0)"""
+    try:
+        return getter(ser)
+    except hotplate_wrapper.HotplateResponseError:
+        return None
+
+def _apply_step_setpoints(ser, values, only_changed=False):
+    """Sends a step's temp, ramp and stir; with only_changed, just those the plate does not already have"""
+    target_temp, ramp_rate, stir_speed = values[0], values[1], values[2]
+    commands = []
+    if not only_changed or target_temp <= 25 or _try_read(hotplate_wrapper.get_target_temp, ser) != target_temp:
+        commands.append(("set_heater_temp", target_temp))
+    if not only_changed or _try_read(hotplate_wrapper.get_ramp, ser) != ramp_rate:
+        commands.append(("set_heater_ramp", ramp_rate))
+    if not only_changed or _try_read(hotplate_wrapper.get_stir, ser) != (stir_speed if stir_speed > 1 else 0):
+        commands.append(("set_stir", stir_speed))
+    # One burst, one round-trip, instead of a write-and-wait per setting
+    if commands:
+        hotplate_wrapper.set_many(ser, commands)
+
+def _run_profile_step(ser, step, step_index, start_setpoint, progress_callback, stop_event,
+                      continue_event, serial_lock, setpoint_rate_hz, start_offset=0.0, checkpoint=None,
+                      clock=hotplate_clock.SYSTEM_CLOCK):
+    """Streams a RAMP / SOAK / PROFILE step. Returns (completed, final setpoint)."""
+    times, temps = hotplate_ramps.resolve_points(step, start_setpoint)
+    last_saved = [start_offset]
+
+    # A ramp limit left on the plate by an earlier step would throttle the streamed setpoints
+    with _lock_context(serial_lock):
+        hotplate_wrapper.set_heater_ramp(ser, hotplate_ramps.PROFILE_RAMP_RATE)
+
+    def write_setpoint(setpoint):
+        with _lock_context(serial_lock):
+            hotplate_wrapper.set_heater_temp(ser, setpoint)
+
+    def on_tick(setpoint, remaining):
+        elapsed = times[-1] - remaining
+        if checkpoint and elapsed - last_saved[0] >= hotplate_checkpoint.DWELL_SAVE_INTERVAL:
+            checkpoint(step_index, "profile", elapsed)
+            last_saved[0] = elapsed
+        if progress_callback:
+            progress_callback({
+                "type": "profile_tick",
+                "step": step_index,
+                "setpoint": setpoint,
+                "remaining": int(remaining)
+            })
+
+    if progress_callback:
+        progress_callback({"type": "profile_start", "step": step_index, "duration": times[-1]})
+    completed, stats = hotplate_ramps.stream_profile(
+        write_setpoint, times, temps, step["interp"], setpoint_rate_hz,
+        stop_event=stop_event, continue_event=continue_event, on_tick=on_tick,
+        current_setpoint=None if start_offset else start_setpoint, start_offset=start_offset,
+        clock=clock.time, sleep=clock.sleep)
+    timing = stats.to_dict()
+    print(f"Profile timing: {timing['writes']} writes, lateness mean {timing['mean_lateness']*1000:.1f} ms, "
+          f"max {timing['max_lateness']*1000:.1f} ms, {timing['skipped_ticks']} ticks skipped")
+    if progress_callback:
+        progress_callback(dict(timing, type="profile_done", step=step_index))
+    return completed, int(round(temps[-1]))
+
+def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continue_event=None, serial_lock=None,
+               control_mode=None, thermal_model=None, setpoint_rate_hz=hotplate_ramps.DEFAULT_RATE_HZ,
+               checkpoint_path=None, resume=None, clock=None):
+    """Runs a recipe file on the hotplate.
+
+    control_mode "mpc" or "pid" streams shaped setpoints while a step stabilizes
+    (see hotplate_control), using thermal_model or the plate's fitted model.
+    RAMP / SOAK / PROFILE steps stream setpoints at setpoint_rate_hz.
+    With checkpoint_path a checkpoint is saved on every phase change; pass a loaded
+    checkpoint as resume to continue from its step and phase.
+    clock (see hotplate_clock) replaces real time, e.g. a VirtualClock with the
+    device simulator runs a recipe far faster than real time.
+    """
+    clock = clock or hotplate_clock.SYSTEM_CLOCK
+    if control_mode and thermal_model is None:
+        thermal_model = hotplate_identify.load_model(hotplate_identify.device_name(ser))
+    steps = compile_recipe(input_file)
+    total_steps = len(steps)
+    digest = hotplate_checkpoint.recipe_hash(input_file) if checkpoint_path else None
+    device_state = dict(resume["device"]) if resume else {}
+    resume_step = resume["step"] if resume else 0
+
+    def checkpoint(step_index, phase, elapsed=0.0):
+        if checkpoint_path:
+            hotplate_checkpoint.save_checkpoint(checkpoint_path, input_file, digest, step_index,
+                                                phase, elapsed, device_state)
+
+    def finish(update_type):
+        # Done or stopped on purpose: nothing left to resume
+        if checkpoint_path:
+            hotplate_checkpoint.clear_checkpoint(checkpoint_path)
+        if progress_callback:
+            progress_callback({"type": update_type})
 
     if progress_callback:
         progress_callback({
@@ -37,49 +133,76 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
             "total_steps": total_steps
         })
 
-    for step_index, onecmd in enumerate(commands, start=1):
+    last_setpoint = device_state.get("setpoint")
+    for step_index, step in steps.enumerate(start=resume_step):
+        resume_phase = resume["phase"] if resume and step_index == resume_step else None
+        resume_elapsed = resume.get("elapsed", 0.0) if resume_phase else 0.0
+
         if stop_event and stop_event.is_set():
+            return finish("cancelled")
+
+        if step["kind"] == "profile":
             if progress_callback:
-                progress_callback({"type": "cancelled"})
-            return
+                progress_callback(dict(step, type="step_start", step=step_index, total_steps=total_steps))
+            if resume_phase and "profile_start" in device_state:
+                last_setpoint = device_state["profile_start"]
+            while last_setpoint is None:
+                if stop_event and stop_event.is_set():
+                    return finish("cancelled")
+                with _lock_context(serial_lock):
+                    last_setpoint = _try_read(hotplate_wrapper.get_temp, ser)
+                if last_setpoint is None:
+                    clock.sleep(0.2)
+            device_state["profile_start"] = last_setpoint
+            device_state["ramp"] = hotplate_ramps.PROFILE_RAMP_RATE
+            checkpoint(step_index, "profile", resume_elapsed)
+            completed, last_setpoint = _run_profile_step(
+                ser, step, step_index, last_setpoint, progress_callback, stop_event,
+                continue_event, serial_lock, setpoint_rate_hz, resume_elapsed, checkpoint, clock)
+            device_state.pop("profile_start", None)
+            device_state["setpoint"] = last_setpoint
+            if not completed:
+                return finish("cancelled")
+            continue
 
-        numbers = re.findall(r"-?\d+", onecmd)
-        onecmd_values = list(map(int, numbers))
+        onecmd_values = [step["target_temp"], step["ramp_rate"], step["stir_speed"],
+                         step["dwell_seconds"], step["stabilize"]]
 
         if progress_callback:
-            progress_callback({
-                "type": "step_start",
-                "step": step_index,
-                "total_steps": total_steps,
-                "target_temp": onecmd_values[0],
-                "ramp_rate": onecmd_values[1],
-                "stir_speed": onecmd_values[2],
-                "dwell_seconds": onecmd_values[3],
-                "stabilize": onecmd_values[4]
-            })
+            progress_callback(dict(step, type="step_start", step=step_index, total_steps=total_steps))
 
+        device_state.update(setpoint=onecmd_values[0], ramp=onecmd_values[1], stir=onecmd_values[2])
+        if not resume_phase:
+            checkpoint(step_index, "setpoint")
         with _lock_context(serial_lock):
-            hotplate_wrapper.set_heater_temp(ser, onecmd_values[0])
-            hotplate_wrapper.set_heater_ramp(ser, onecmd_values[1])
-            hotplate_wrapper.set_stir(ser, onecmd_values[2])
+            # On resume only re-apply what the plate lost
+            _apply_step_setpoints(ser, onecmd_values, only_changed=bool(resume_phase))
             # Check current temperature to see if we're already at setpoint
-            current_temp = hotplate_wrapper.get_temp(ser)
+            current_temp = _try_read(hotplate_wrapper.get_temp, ser)
 
         # Determine if we're already at the target temperature
         target_temp = onecmd_values[0]
-        already_at_temp = (current_temp >= target_temp - 2 and current_temp <= target_temp + 2)
+        last_setpoint = target_temp
+        already_at_temp = (current_temp is not None
+                           and current_temp >= target_temp - 2 and current_temp <= target_temp + 2)
+        if resume_phase in ("dwell", "final_cooling"):
+            already_at_temp = True
 
         # Stabilization routine - Poll plate to check temp
         printtemp = 0
         last5temps = []
+        shaper = None
+        commanded = target_temp
+        stabilize_start = clock.time()
         if not already_at_temp:
+            if onecmd_values[3] >= 0:
+                shaper = hotplate_control.make_shaper(control_mode, target_temp, thermal_model)
+            checkpoint(step_index, "stabilizing")
             if progress_callback:
                 progress_callback({"type": "stabilizing_start", "step": step_index})
         while not already_at_temp:
             if stop_event and stop_event.is_set():
-                if progress_callback:
-                    progress_callback({"type": "cancelled"})
-                return
+                return finish("cancelled")
 
             if continue_event and continue_event.is_set():
                 continue_event.clear()
@@ -89,7 +212,10 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
                 break
 
             with _lock_context(serial_lock):
-                curtemp = hotplate_wrapper.get_temp(ser)
+                curtemp = _try_read(hotplate_wrapper.get_temp, ser)
+            if curtemp is None:
+                clock.sleep(0.2)
+                continue
 
             if printtemp == 5:
                 last5temps.append(curtemp)
@@ -113,29 +239,53 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
                 if onecmd_values[4] == 0 and curtemp >= onecmd_values[0]-2 and curtemp <= onecmd_values[0]+2:
                     break
 
+                # Shaped control: only write when the rounded setpoint changes
+                if shaper:
+                    setpoint = shaper.next_setpoint(curtemp, clock.time())
+                    if setpoint != commanded:
+                        with _lock_context(serial_lock):
+                            hotplate_wrapper.set_heater_temp(ser, setpoint)
+                        commanded = setpoint
+
             printtemp = printtemp + 1
-            time.sleep(0.2)
+            clock.sleep(0.2)
+
+        # Hand the plate back the recipe's own setpoint to hold during the dwell
+        if commanded != target_temp:
+            with _lock_context(serial_lock):
+                hotplate_wrapper.set_heater_temp(ser, target_temp)
+        if not already_at_temp and progress_callback:
+            progress_callback({
+                "type": "stabilized",
+                "step": step_index,
+                "seconds": clock.time() - stabilize_start,
+                "control_mode": control_mode
+            })
 
         # Start dwell timer when stabilized at temp
-        if onecmd_values[3] < 0:
+        if onecmd_values[3] < 0 or resume_phase == "final_cooling":
             # No dwell - advance to next step automatically
             pass
         else:
             dwell_seconds = onecmd_values[3]
-            start_time = time.time()
+            dwell_done = resume_elapsed if resume_phase == "dwell" else 0.0
+            start_time = clock.time() - dwell_done
+            last_saved = dwell_done
+            checkpoint(step_index, "dwell", dwell_done)
             if progress_callback:
                 progress_callback({"type": "dwell_start", "step": step_index, "dwell_seconds": dwell_seconds})
             while True:
                 if stop_event and stop_event.is_set():
-                    if progress_callback:
-                        progress_callback({"type": "cancelled"})
-                    return
+                    return finish("cancelled")
                 if continue_event and continue_event.is_set():
                     continue_event.clear()
                     break
-                elapsed = time.time() - start_time
+                elapsed = clock.time() - start_time
                 if elapsed >= dwell_seconds:
                     break
+                if elapsed - last_saved >= hotplate_checkpoint.DWELL_SAVE_INTERVAL:
+                    checkpoint(step_index, "dwell", elapsed)
+                    last_saved = elapsed
                 remaining = max(0, int(dwell_seconds - elapsed))
                 if progress_callback:
                     progress_callback({
@@ -143,7 +293,7 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
                         "step": step_index,
                         "remaining": remaining
                     })
-                time.sleep(1)
+                clock.sleep(1)
 
         # If this was the final step and target<30 with stir=0 and dwell=0,
         # turn the heater off and finish immediately.
@@ -155,13 +305,12 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
         ):
             with _lock_context(serial_lock):
                 hotplate_wrapper.set_heater_off(ser)
-            if progress_callback:
-                progress_callback({"type": "done"})
-            return
+            return finish("done")
 
         # If this was the final step and the target is below 30°C,
         # keep the recipe open until the hotplate cools to 30°C.
         if step_index == total_steps and onecmd_values[0] < 30:
+            checkpoint(step_index, "final_cooling")
             if progress_callback:
                 progress_callback({
                     "type": "final_cooling_start",
@@ -172,16 +321,17 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
 
             while True:
                 if stop_event and stop_event.is_set():
-                    if progress_callback:
-                        progress_callback({"type": "cancelled"})
-                    return
+                    return finish("cancelled")
 
                 if continue_event and continue_event.is_set():
                     continue_event.clear()
                     break
 
                 with _lock_context(serial_lock):
-                    curtemp = hotplate_wrapper.get_temp(ser)
+                    curtemp = _try_read(hotplate_wrapper.get_temp, ser)
+                if curtemp is None:
+                    clock.sleep(1)
+                    continue
 
                 if progress_callback:
                     progress_callback({
@@ -194,7 +344,64 @@ def run_recipe(ser, input_file, progress_callback=None, stop_event=None, continu
                 if curtemp <= 30:
                     break
 
-                time.sleep(1)
+                clock.sleep(1)
 
-    if progress_callback:
-        progress_callback({"type": "done"})
+    finish("done")
+
+def dry_run(input_file, start_temp=None, model=None):
+    """Estimates a recipe's per-step and total duration without a hotplate"""
+    estimate = hotplate_estimator.estimate_recipe(compile_recipe(input_file), model=model,
+                                                  start_temp=start_temp)
+    hotplate_estimator.print_estimate(estimate)
+    return estimate
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a hotplate recipe file")
+    parser.add_argument("recipe", help="recipe file, e.g. hotplatescripts\\PMMATransferBake.txt")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only estimate how long the recipe takes, do not connect")
+    parser.add_argument("--start-temp", type=float, default=None,
+                        help="plate temperature at the start of a dry run (default: ambient)")
+    parser.add_argument("--device", default=None,
+                        help="use the thermal model fitted for this device, e.g. COM3")
+    parser.add_argument("--port", default="COM3", help="serial port of the hotplate")
+    parser.add_argument("--setpoint-rate", type=float, default=hotplate_ramps.DEFAULT_RATE_HZ,
+                        help="setpoint updates per second for RAMP / SOAK / PROFILE steps")
+    parser.add_argument("--control", choices=hotplate_control.CONTROL_MODES, default=None,
+                        help="stream shaped setpoints while stabilizing (default: plate control only)")
+    parser.add_argument("--profile", nargs="?", const="hotplate_profile", default=None, metavar="PREFIX",
+                        help="sample stacks and allocations during the run, written to PREFIX.folded / "
+                             "PREFIX_report.txt")
+    args = parser.parse_args(argv)
+
+    if args.dry_run:
+        dry_run(args.recipe, start_temp=args.start_temp, model=hotplate_identify.load_model(args.device))
+        return
+
+    resume = hotplate_checkpoint.resumable_checkpoint(recipe=args.recipe)
+    if resume:
+        answer = input(f"Recipe was interrupted ({hotplate_checkpoint.describe(resume)}). Resume? [y/N] ")
+        resume = resume if answer.strip().lower().startswith("y") else None
+
+    ser = hotplate_link.SupervisedSerial(lambda: hotplate_wrapper.open_comm(args.port))
+    serial_arbiter = hotplate_arbiter.SerialArbiter()
+    serial_arbiter.attach(ser)
+    stop_event = threading.Event()
+    watchdog = hotplate_watchdog.Watchdog(ser, serial_arbiter.lane(hotplate_arbiter.SAFETY), stop_event=stop_event)
+    watchdog.start()
+    profiler = hotplate_profiler.Profiler(args.profile).start() if args.profile else None
+    try:
+        model = hotplate_identify.load_model(args.device) if args.device else None
+        run_recipe(ser, args.recipe, progress_callback=hotplate_profiler.recipe_event, stop_event=stop_event,
+                   serial_lock=serial_arbiter.lane(hotplate_arbiter.RECIPE),
+                   control_mode=args.control, thermal_model=model, setpoint_rate_hz=args.setpoint_rate,
+                   checkpoint_path=hotplate_checkpoint.CHECKPOINT_FILE, resume=resume)
+    finally:
+        watchdog.stop()
+        hotplate_wrapper.close_comm(ser)
+        hotplate_arbiter.print_report(serial_arbiter)
+        if profiler:
+            profiler.stop()
+
+if __name__ == '__main__':
+    main()
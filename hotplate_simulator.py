@@ -0,0 +1,208 @@
+######## Hotplate Device Simulator #######
+# Serial-port stand-in that answers the hotplate's RS-232 commands from a
+# ThermalModel, so recipes can be run and regression-tested without hardware.
+# Note: Paired with a VirtualClock, serial timeouts, polling sleeps and dwells
+# cost no real time, so a 2-hour recipe runs in well under a second.
+
+import argparse
+import contextlib
+import io
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import hotplate_clock
+import hotplate_identify
+import hotplate_runscript
+from hotplate_estimator import HEATER_OFF_TEMP, ThermalModel, format_duration
+
+INTEGRATION_STEP = 0.5     # s, physics step of the simulated plate
+BYTE_TIME = 10.0 / 2400    # s per byte at 2400 baud, 8N1
+
+
+class SimulatedHotplate:
+    """Simulated hotplate with the subset of the pyserial API the wrapper uses"""
+    def __init__(self, model=None, clock=None, start_temp=None, timeout=1.0, name="SIM"):
+        self.model = model or ThermalModel()
+        self.clock = clock or hotplate_clock.SYSTEM_CLOCK
+        self.timeout = timeout
+        self.name = name
+        self.port = name
+        self.is_open = True
+
+        self.temp = self.model.ambient if start_temp is None else float(start_temp)
+        self.target = 0              # setpoint sent with A (0 = heater off)
+        self.internal_setpoint = self.temp  # setpoint after the plate's own ramp limit
+        self.ramp_rate = 0           # °C/hr sent with D
+        self.stir = 0
+        self.heater_on = False
+
+        steps = max(int(round(self.model.dead_time / INTEGRATION_STEP)), 0)
+        self._drive_history = deque([self.temp] * (steps + 1), maxlen=steps + 1)
+        self._last_update = self.clock.time()
+        self._pending = 0.0
+        self._rx = bytearray()
+        self._tx = bytearray()
+
+    ### Physics ###
+    def _advance(self):
+        now = self.clock.time()
+        self._pending += now - self._last_update
+        self._last_update = now
+        model = self.model
+        while self._pending >= INTEGRATION_STEP:
+            self._pending -= INTEGRATION_STEP
+            if self.heater_on:
+                rate = self.ramp_rate if self.ramp_rate > 0 else math.inf
+                max_step = min(rate, model.max_heat_rate) / 3600.0 * INTEGRATION_STEP
+                delta = self.target - self.internal_setpoint
+                self.internal_setpoint += max(-max_step, min(max_step, delta))
+                drive = model.steady_state(self.internal_setpoint)
+            else:
+                self.internal_setpoint = self.temp
+                drive = model.ambient
+            self._drive_history.append(drive)
+            delayed = self._drive_history[0]
+            tau = model.tau_heat if delayed > self.temp else model.tau_cool
+            self.temp += (delayed - self.temp) * (1.0 - math.exp(-INTEGRATION_STEP / tau))
+
+    ### Protocol ###
+    def _respond(self, command):
+        code, argument = command[:1], command[1:]
+        if code == 'A':
+            self.target = float(argument)
+            self.heater_on = self.target > HEATER_OFF_TEMP
+            if self.heater_on and self.internal_setpoint < self.model.ambient:
+                self.internal_setpoint = self.temp
+            return "OK"
+        if code == 'D':
+            self.ramp_rate = float(argument)
+            return "OK"
+        if code == 'E':
+            self.stir = int(float(argument))
+            return "OK"
+        if code == 'F':
+            self.stir = 0
+            return "OK"
+        if code == 'G':
+            self.heater_on = False
+            return "OK"
+        if code == 'a':
+            return f"{self.temp:.1f}"
+        if code == 'e':
+            return f"{self.target:g}"
+        if code == 'd':
+            return f"{self.ramp_rate:g}"
+        if code == 'g':
+            return f"{self.stir}"
+        return "ERR"
+
+    ### pyserial API ###
+    def write(self, data):
+        self._advance()
+        self._rx.extend(data)
+        while b'\r' in self._rx:
+            end = self._rx.index(b'\r')
+            command = self._rx[:end].decode('utf-8', errors='ignore').strip()
+            del self._rx[:end + 1]
+            if command:
+                self._tx.extend((self._respond(command) + '\r').encode('utf-8'))
+        self.clock.sleep(len(data) * BYTE_TIME)
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self._tx)
+
+    def read(self, size=1):
+        """Returns up to size bytes; like pyserial, waits out the timeout when fewer are available"""
+        if len(self._tx) < size:
+            self.clock.sleep(self.timeout)
+        data = bytes(self._tx[:size])
+        del self._tx[:size]
+        self.clock.sleep(len(data) * BYTE_TIME)
+        self._advance()
+        return data
+
+    def reset_input_buffer(self):
+        self._tx.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def simulate_recipe(recipe, model=None, start_temp=None, speed=None, quiet=True, **run_options):
+    """Runs a recipe end to end against the simulator.
+
+    speed None uses a VirtualClock (as fast as possible, deterministic);
+    a number uses a ScaledClock running that many times faster than real time.
+    Returns dict(recipe, events, simulated_seconds, wall_seconds, final_temp).
+    """
+    clock = hotplate_clock.VirtualClock() if speed is None else hotplate_clock.ScaledClock(speed)
+    plate = SimulatedHotplate(model=model, clock=clock, start_temp=start_temp)
+    events = []
+    started = clock.time()
+    wall_start = time.perf_counter()
+    output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+    with output:
+        hotplate_runscript.run_recipe(plate, recipe, progress_callback=events.append, clock=clock, **run_options)
+    plate._advance()
+    return {
+        "recipe": recipe,
+        "events": events,
+        "simulated_seconds": clock.time() - started,
+        "wall_seconds": time.perf_counter() - wall_start,
+        "final_temp": plate.temp
+    }
+
+
+def _simulate_case(case):
+    recipe, device, control_mode = case
+    try:
+        model = hotplate_identify.load_model(device)
+        result = simulate_recipe(recipe, model=model, control_mode=control_mode, thermal_model=model)
+        result["ok"] = result["events"][-1]["type"] == "done"
+    except Exception as e:
+        result = {"recipe": recipe, "ok": False, "error": str(e)}
+    result.update(device=device, control_mode=control_mode)
+    result.pop("events", None)
+    return result
+
+
+def run_matrix(recipes, devices=(None,), control_modes=(None,), workers=None):
+    """Simulates every recipe x device model x control mode combination in a process pool"""
+    cases = [(recipe, device, mode) for recipe in recipes for device in devices for mode in control_modes]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_simulate_case, cases))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run recipes against the simulated hotplate")
+    parser.add_argument("recipes", nargs="+", help="recipe files or folders of recipes")
+    parser.add_argument("--device", action="append", default=None,
+                        help="simulate with this device's fitted model (repeatable)")
+    parser.add_argument("--control", action="append", default=None,
+                        help="control mode to test: plate, mpc or pid (repeatable)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    recipes = []
+    for path in args.recipes:
+        if os.path.isdir(path):
+            recipes += sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".txt"))
+        else:
+            recipes.append(path)
+    modes = [None if mode == "plate" else mode for mode in (args.control or ["plate"])]
+    started = time.perf_counter()
+    results = run_matrix(recipes, args.device or [None], modes, args.workers)
+    for r in results:
+        status = "ok" if r["ok"] else "FAILED " + r.get("error", "")
+        print(f"{os.path.basename(r['recipe']):<28} {str(r['device']):<8} {str(r['control_mode']):<6} "
+              f"{format_duration(r.get('simulated_seconds')):>9} simulated  {status}")
+    print(f"{len(results)} runs in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
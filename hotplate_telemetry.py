@@ -0,0 +1,378 @@
+######## Hotplate Telemetry Storage #######
+# Temperature history kept in three tiers with bounded memory: the last few
+# hours at full resolution, then per-minute and per-hour min/max/mean buckets,
+# so a week-long anneal can be plotted and exported end to end. Each sample
+# also records setpoint, ramp, stir and the recipe step and phase.
+# Note: Each tier is a fixed-size numpy ring; queries stitch the tiers
+# together so callers see one time series.
+
+import csv
+import threading
+import time
+
+import numpy as np
+
+import hotplate_checkpoint
+
+RAW_POINTS = 6 * 3600        # full-resolution samples kept (6 h at 1 Hz)
+MINUTE_BUCKETS = 7 * 24 * 60  # per-minute buckets kept (1 week)
+HOUR_BUCKETS = 365 * 24      # per-hour buckets kept (1 year)
+
+# Per-sample channels stored alongside temperature (None is stored as NaN)
+CHANNELS = ("setpoint", "ramp", "stir", "step", "phase")
+# Recipe phase of a sample, stored as its index here
+PHASES = ("idle",) + hotplate_checkpoint.PHASES
+# Recipe progress events that start each phase
+PHASE_EVENTS = {"step_start": "setpoint", "stabilizing_start": "stabilizing", "dwell_start": "dwell",
+                "final_cooling_start": "final_cooling", "profile_start": "profile"}
+
+POLL_PERIOD = 1.0            # s, nominal time between polled samples
+GAP_FACTOR = 2.0             # an interval this many periods long counts as a gap
+
+# Aggregate bucket columns: temperature min/max/sum/count, then the channels' last value
+BUCKET_FIELDS = ("time", "min", "max", "sum", "count") + CHANNELS
+# Columns of get_series() and of exported history, oldest history first
+SERIES_COLUMNS = ("time", "temp", "min", "max") + CHANNELS
+# Older history is exported as per-minute / per-hour means with their min and max
+CSV_HEADER = ["Time (seconds)", "Temperature (°C)", "Min (°C)", "Max (°C)", "Setpoint (°C)",
+              "Ramp (°C/hr)", "Stir (RPM)", "Step", "Phase"]
+
+
+class RingBuffer:
+    """Fixed-capacity table of float columns; the oldest rows are overwritten"""
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.fields = {name: i for i, name in enumerate(fields)}
+        self.rows = np.empty((capacity, len(fields)))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, row):
+        self.rows[(self.start + self.size) % self.capacity] = row
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def extend(self, rows):
+        rows = np.asarray(rows, dtype=float)[-self.capacity:]
+        n = len(rows)
+        if not n:
+            return
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.rows[end:end + first] = rows[:first]
+        self.rows[:n - first] = rows[first:]
+        overflow = max(self.size + n - self.capacity, 0)
+        self.size = min(self.size + n, self.capacity)
+        self.start = (self.start + overflow) % self.capacity
+
+    def table(self):
+        """Rows oldest first (a copy of the live rows only)"""
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.rows[self.start:end].copy()
+        return np.concatenate((self.rows[self.start:], self.rows[:end - self.capacity]))
+
+    def column(self, name):
+        return self.table()[:, self.fields[name]]
+
+    def rows_between(self, first, last):
+        """Rows first to last - 1, counted from the oldest, as a copy"""
+        return self.rows[(self.start + np.arange(first, min(last, self.size))) % self.capacity]
+
+    def search(self, name, value):
+        """Number of rows whose column name (ascending from the oldest row) is at or below value"""
+        column = self.fields[name]
+        head = self.rows[self.start:min(self.start + self.size, self.capacity), column]
+        tail = self.rows[:max(self.start + self.size - self.capacity, 0), column]
+        found = int(np.searchsorted(head, value, side='right'))
+        return found if found < len(head) else found + int(np.searchsorted(tail, value, side='right'))
+
+    def last(self, name):
+        return self.rows[(self.start + self.size - 1) % self.capacity, self.fields[name]]
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+
+
+class _Rollup:
+    """Accumulates samples into fixed-width min/max/mean buckets"""
+    def __init__(self, width, capacity, parent=None):
+        self.width = width
+        self.buckets = RingBuffer(capacity, BUCKET_FIELDS)
+        self.parent = parent
+        self.current = None      # [bucket start, min, max, sum, count, *channels]
+
+    def add(self, start, low, high, total, count, *channels):
+        """Merges a finer bucket (or a single sample) starting at time start"""
+        key = np.floor(start / self.width) * self.width
+        current = self.current
+        if current is not None and key == current[0]:
+            current[1] = min(current[1], low)
+            current[2] = max(current[2], high)
+            current[3] += total
+            current[4] += count
+            current[5:] = channels
+            return
+        self.close()
+        self.current = [key, low, high, total, count, *channels]
+
+    def close(self):
+        if self.current is None:
+            return
+        self.buckets.append(self.current)
+        if self.parent:
+            self.parent.add(*self.current)
+        self.current = None
+
+    def series(self, before=np.inf):
+        """Columns (see TemperatureData.get_series) of closed buckets that end before the given time"""
+        table = self.buckets.table()
+        table = table[table[:, 0] + self.width <= before]
+        series = {"time": table[:, 0] + self.width / 2, "temp": table[:, 3] / table[:, 4],
+                  "min": table[:, 1], "max": table[:, 2]}
+        for i, name in enumerate(CHANNELS, start=5):
+            series[name] = table[:, i]
+        return series
+
+    def chunk(self, after, before, limit):
+        """Like series(), but only up to limit buckets whose mid time is past after"""
+        half = self.width / 2
+        first = self.buckets.search("time", after - half)
+        last = min(self.buckets.search("time", before - self.width), first + limit)
+        table = self.buckets.rows_between(first, last)
+        series = {"time": table[:, 0] + half, "temp": table[:, 3] / table[:, 4],
+                  "min": table[:, 1], "max": table[:, 2]}
+        for i, name in enumerate(CHANNELS, start=5):
+            series[name] = table[:, i]
+        return series
+
+    def clear(self):
+        self.buckets.clear()
+        self.current = None
+
+
+class TemperatureData:
+    """Manages temperature history"""
+    def __init__(self, raw_points=RAW_POINTS, minute_buckets=MINUTE_BUCKETS, hour_buckets=HOUR_BUCKETS):
+        self.raw = RingBuffer(raw_points, ("time", "temp") + CHANNELS)
+        self.hours = _Rollup(3600, hour_buckets)
+        self.minutes = _Rollup(60, minute_buckets, parent=self.hours)
+        self.start_time = time.monotonic()
+        # Held while the tiers change or are read, so exports can read chunks from another thread
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.raw) + len(self.minutes.buckets) + len(self.hours.buckets)
+
+    @property
+    def last_temp(self):
+        return float(self.raw.last("temp")) if len(self.raw) else None
+
+    @property
+    def last_time(self):
+        with self.lock:
+            return float(self.raw.last("time")) if len(self.raw) else None
+
+    @staticmethod
+    def _channel_value(name, value):
+        if value is None:
+            return np.nan
+        return PHASES.index(value) if name == "phase" and isinstance(value, str) else value
+
+    def elapsed(self, stamp):
+        """Seconds into the history of a time.monotonic() acquisition stamp"""
+        return stamp - self.start_time
+
+    def add_point(self, temp, elapsed=None, **channels):
+        """Adds a sample; channels are setpoint, ramp, stir, step and phase (a PHASES name).
+
+        elapsed should come from the acquisition stamp (see elapsed()); it
+        defaults to now, which is late by however long the sample was queued.
+        """
+        if elapsed is None:
+            elapsed = time.monotonic() - self.start_time
+        values = [self._channel_value(name, channels.get(name)) for name in CHANNELS]
+        with self.lock:
+            self.raw.append((elapsed, temp, *values))  # Time in seconds
+            self.minutes.add(elapsed, temp, temp, temp, 1, *values)
+
+    def extend(self, times, temps, **channels):
+        """Bulk-load recorded samples (e.g. after seeking a replay); channels are arrays like times"""
+        times = np.asarray(times, dtype=float)
+        temps = np.asarray(temps, dtype=float)
+        columns = [np.full(len(times), np.nan) if channels.get(name) is None
+                   else np.asarray(channels[name], dtype=float) for name in CHANNELS]
+        keep = np.isfinite(temps)
+        times, temps = times[keep], temps[keep]
+        columns = [column[keep] for column in columns]
+        if not len(times):
+            return
+        # Fold each minute's samples in one go rather than sample by sample
+        minutes = np.floor(times / 60)
+        starts = np.r_[0, np.flatnonzero(np.diff(minutes)) + 1]
+        ends = np.r_[starts[1:], len(temps)]
+        lasts = [column[ends - 1] for column in columns]
+        with self.lock:
+            self.raw.extend(np.column_stack([times, temps] + columns))
+            for row in zip(times[starts], np.minimum.reduceat(temps, starts), np.maximum.reduceat(temps, starts),
+                           np.add.reduceat(temps, starts), ends - starts, *lasts):
+                self.minutes.add(*row)
+
+    def get_series(self):
+        """Dict of numpy columns across all tiers, oldest first.
+
+        Keys are time, temp, min, max and the CHANNELS. Raw samples are their
+        own min and max; older history comes from the minute buckets and,
+        beyond those, the hour buckets, which hold the mean temperature and
+        each channel's last value in the bucket.
+        """
+        with self.lock:
+            raw = self.raw.table()
+            raw_start = raw[0, 0] if len(raw) else np.inf
+            minutes = self.minutes.series(before=raw_start)
+            minute_start = minutes["time"][0] - 30 if len(minutes["time"]) else raw_start
+            hours = self.hours.series(before=minute_start)
+        recent = {name: raw[:, i] for name, i in self.raw.fields.items()}
+        recent["min"] = recent["max"] = recent["temp"]
+        return {name: np.concatenate((hours[name], minutes[name], recent[name])) for name in hours}
+
+    def _tier_starts(self):
+        """Times where the minute and the raw tiers take over (as get_series stitches them)"""
+        raw_start = self.raw.rows[self.raw.start, 0] if len(self.raw) else np.inf
+        buckets = self.minutes.buckets
+        oldest = buckets.rows[buckets.start, 0] if len(buckets) else np.inf
+        return (oldest if oldest + 60 <= raw_start else raw_start), raw_start
+
+    def chunk(self, after=-np.inf, until=np.inf, limit=10000):
+        """The next at most limit rows of get_series() with after < time <= until.
+
+        Lets a reader walk the whole history in bounded pieces while samples
+        keep arriving: pass the last time of each chunk as the next after.
+        """
+        with self.lock:
+            minute_start, raw_start = self._tier_starts()
+            parts = [self.hours.chunk(after, min(minute_start, until + 1800), limit)]
+            limit -= len(parts[0]["time"])
+            parts.append(self.minutes.chunk(after, min(raw_start, until + 30), limit))
+            limit -= len(parts[1]["time"])
+            first = self.raw.search("time", after)
+            raw = self.raw.rows_between(first, min(self.raw.search("time", until), first + limit))
+        recent = {name: raw[:, i] for name, i in self.raw.fields.items()}
+        recent["min"] = recent["max"] = recent["temp"]
+        parts.append(recent)
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def count(self, until=np.inf):
+        """Rows of get_series() up to time until, without building it"""
+        with self.lock:
+            minute_start, raw_start = self._tier_starts()
+            rows = 0
+            for rollup, before in ((self.hours, minute_start), (self.minutes, raw_start)):
+                rows += rollup.buckets.search("time", min(before, until + rollup.width / 2) - rollup.width)
+            return rows + self.raw.search("time", until)
+
+    def get_data(self):
+        series = self.get_series()
+        return series["time"].tolist(), series["temp"].tolist()
+
+    def recent(self, name):
+        """Full-resolution column of the raw tier, e.g. recent("setpoint")"""
+        return self.raw.column(name)
+
+    def step_samples(self, step):
+        """Full-resolution columns of the samples recorded during a recipe step"""
+        table = self.raw.table()
+        rows = table[table[:, self.raw.fields["step"]] == step]
+        return {name: rows[:, i] for name, i in self.raw.fields.items()}
+
+    def clear(self):
+        with self.lock:
+            self.raw.clear()
+            self.minutes.clear()
+            self.hours.clear()
+            self.start_time = time.monotonic()
+
+
+class SamplingStats:
+    """Running statistics of sample timing: interval mean and jitter, gaps and read latency.
+
+    Fed with each sample's time.monotonic() acquisition stamp and, if known,
+    how long the plate took to answer the read.
+    """
+    def __init__(self, period=POLL_PERIOD, gap_factor=GAP_FACTOR):
+        self.period = period
+        self.gap_factor = gap_factor
+        self.clear()
+
+    def clear(self):
+        self.samples = 0
+        self.last = None
+        self.intervals = 0
+        self.mean_interval = 0.0
+        self._m2 = 0.0           # Welford sum of squared interval deviations
+        self.max_interval = 0.0
+        self.gaps = 0
+        self.gap_seconds = 0.0
+        self.latencies = 0
+        self.mean_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, stamp, latency=None):
+        self.samples += 1
+        if self.last is not None and stamp > self.last:
+            interval = stamp - self.last
+            self.intervals += 1
+            delta = interval - self.mean_interval
+            self.mean_interval += delta / self.intervals
+            self._m2 += delta * (interval - self.mean_interval)
+            self.max_interval = max(self.max_interval, interval)
+            if interval >= self.gap_factor * self.period:
+                self.gaps += 1
+                self.gap_seconds += interval - self.period
+        self.last = stamp
+        if latency is not None:
+            self.latencies += 1
+            self.mean_latency += (latency - self.mean_latency) / self.latencies
+            self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def jitter(self):
+        """Standard deviation of the sample interval (s)"""
+        return (self._m2 / (self.intervals - 1)) ** 0.5 if self.intervals > 1 else 0.0
+
+    def report(self):
+        return {"samples": self.samples, "mean_interval": self.mean_interval, "jitter": self.jitter,
+                "max_interval": self.max_interval, "gaps": self.gaps, "gap_seconds": self.gap_seconds,
+                "mean_latency": self.mean_latency, "max_latency": self.max_latency}
+
+    def summary(self):
+        """One-line summary, e.g. 1.00 s ± 4 ms, max 1.21 s, 0 gaps, read 38 ms (max 95 ms)"""
+        if not self.intervals:
+            return "--"
+        text = (f"{self.mean_interval:.2f} s ± {self.jitter * 1000:.0f} ms, max {self.max_interval:.2f} s, "
+                f"{self.gaps} gaps")
+        if self.latencies:
+            text += f", read {self.mean_latency * 1000:.0f} ms (max {self.max_latency * 1000:.0f} ms)"
+        return text
+
+
+def csv_rows(series):
+    """Telemetry CSV rows of a get_series() dict: empty cells for missing values, phases by name"""
+    columns = [series[name] for name in SERIES_COLUMNS[:-1]]
+    for row, phase in zip(zip(*columns), series['phase']):
+        yield (["" if np.isnan(value) else value for value in row]
+               + ["" if np.isnan(phase) else PHASES[int(phase)]])
+
+
+def write_csv(path, series):
+    """Writes a TemperatureData.get_series() dict as a telemetry CSV (the format replay and analytics read)"""
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(csv_rows(series))
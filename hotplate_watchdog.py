@@ -0,0 +1,185 @@
+######## Hotplate Safety Watchdog #######
+# Independent thread that turns the heater and stirrer off when the plate
+# overheats, heats faster than it physically should, or stops reporting its
+# temperature, whatever the recipe or GUI is doing at the time.
+# Note: Samples arrive through hotplate_wrapper's temperature listeners, so
+# every get_temp from any thread feeds the watchdog. If nobody has read the
+# plate for PROBE_AFTER seconds the watchdog reads it itself. After a trip it
+# keeps monitoring and re-arms once the fault has cleared.
+
+import threading
+import time
+from collections import deque
+
+import hotplate_control
+import hotplate_wrapper
+
+CHECK_PERIOD = 0.1       # s between checks when no sample arrives
+MAX_TEMP = hotplate_control.SAFETY_MAX_TEMP + 10   # °C, heater off above this
+MAX_RISE_RATE = 1.0      # °C/s over RISE_WINDOW; the heater itself manages ~0.2 °C/s
+RISE_WINDOW = 5.0        # s of samples the rate of rise is measured over
+PROBE_AFTER = 2.0        # s without a sample before the watchdog reads the plate itself
+STALE_SECONDS = 15.0     # s without any sample before the data counts as stale
+LOCK_WAIT = 0.5          # s to wait for the serial lock before cutting in ahead of it
+RETRY_OFF = 5.0          # s between repeated off commands while a trip is not confirmed
+
+
+class Watchdog:
+    """Monitors plate temperature and cuts heater and stirrer power on a fault.
+
+    On a trip it sets stop_event (so a running recipe cancels) and calls
+    on_trip(event) with the reason and the measured reaction latency.
+    """
+    def __init__(self, ser, serial_lock=None, stop_event=None, on_trip=None, max_temp=MAX_TEMP,
+                 max_rise_rate=MAX_RISE_RATE, stale_seconds=STALE_SECONDS, period=CHECK_PERIOD):
+        self.ser = ser
+        self.serial_lock = serial_lock
+        self.stop_event = stop_event
+        self.on_trip = on_trip
+        self.max_temp = max_temp
+        self.max_rise_rate = max_rise_rate
+        self.stale_seconds = stale_seconds
+        self.period = period
+        self.samples = deque()       # (monotonic time, temp) within RISE_WINDOW
+        self.last_sample = None
+        self.last_probe = 0.0
+        self.wake = threading.Event()
+        self.halt = threading.Event()
+        self.thread = None
+        self.trips = []
+        self.tripped = False         # a fault was acted on and has not cleared yet
+        self.confirmed = False       # the plate acknowledged the last off commands
+        self.last_off = 0.0
+        self.max_check_interval = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def latency_bound(self):
+        """Guaranteed worst-case time from a bad sample to both off commands completing.
+
+        Excludes link recovery: while a SupervisedSerial is reconnecting the
+        off commands cannot reach the plate; they are sent as soon as the port
+        reopens, ahead of the restored setpoints.
+        """
+        timeout = getattr(self.ser, "timeout", None) or 1.0
+        return self.period + LOCK_WAIT + 2 * timeout
+
+    def start(self):
+        self.halt.clear()
+        hotplate_wrapper.add_temp_listener(self.on_sample)
+        self.last_sample = time.monotonic()   # staleness counts from now
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        hotplate_wrapper.remove_temp_listener(self.on_sample)
+        self.halt.set()
+        self.wake.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=2)
+
+    def on_sample(self, temp):
+        """Temperature listener; runs in the thread that read the plate"""
+        now = time.monotonic()
+        self.samples.append((now, temp))
+        self.last_sample = now
+        self.wake.set()
+
+    def report(self):
+        return {
+            "trips": list(self.trips),
+            "latency_bound": self.latency_bound,
+            "max_latency": self.max_latency,
+            "max_check_interval": self.max_check_interval
+        }
+
+    def _run(self):
+        last_check = time.monotonic()
+        while not self.halt.is_set():
+            self.wake.wait(self.period)
+            self.wake.clear()
+            now = time.monotonic()
+            self.max_check_interval = max(self.max_check_interval, now - last_check)
+            last_check = now
+            if now - max(self.last_sample, self.last_probe) >= PROBE_AFTER:
+                self.last_probe = now
+                self._probe()
+            reason, since = self._check(time.monotonic())
+            if reason and not self.tripped:
+                self._trip(reason, since)
+            elif reason and not self.confirmed and time.monotonic() - self.last_off >= RETRY_OFF:
+                print("WATCHDOG: plate not confirmed off, sending the off commands again")
+                self.confirmed = self._send_off()
+            elif not reason and self.tripped:
+                print("WATCHDOG: fault cleared, monitoring re-armed")
+                self.tripped = False
+
+    def _probe(self):
+        lock = self.serial_lock
+        if lock and not lock.acquire(timeout=LOCK_WAIT):
+            return
+        try:
+            hotplate_wrapper.get_temp(self.ser)   # lands in on_sample
+        except Exception:
+            pass
+        finally:
+            if lock:
+                lock.release()
+
+    def _check(self, now):
+        """(reason, time the fault was first visible) or (None, None)"""
+        while len(self.samples) > 1 and now - self.samples[0][0] > RISE_WINDOW:
+            self.samples.popleft()
+        if now - self.last_sample > self.stale_seconds:
+            return f"no temperature reading for {now - self.last_sample:.0f} s", self.last_sample + self.stale_seconds
+        if not self.samples:
+            return None, None
+        sample_time, temp = self.samples[-1]
+        if temp > self.max_temp:
+            return f"temperature {temp:.1f} °C above the {self.max_temp:.0f} °C limit", sample_time
+        first_time, first_temp = self.samples[0]
+        if sample_time - first_time >= RISE_WINDOW / 2:
+            rate = (temp - first_temp) / (sample_time - first_time)
+            if rate > self.max_rise_rate:
+                return f"temperature rising {rate:.2f} °C/s (limit {self.max_rise_rate:g} °C/s)", sample_time
+        return None, None
+
+    def _send_off(self):
+        """Heater and stirrer off. Returns whether the plate confirmed both."""
+        self.last_off = time.monotonic()
+        lock = self.serial_lock
+        locked = lock.acquire(timeout=LOCK_WAIT) if lock else False
+        try:
+            if locked or not lock:
+                heater_off = hotplate_wrapper.set_heater_off(self.ser)
+                return hotplate_wrapper.set_stir_off(self.ser) and heater_off
+            # The lock holder is stuck (e.g. a reconnect); cut in ahead of it. Nobody reads
+            # the replies, so the plate is not confirmed off.
+            cut_off = getattr(self.ser, "cut_off", None)
+            if cut_off:
+                cut_off()
+            else:
+                # Raw bytes could land inside the lock holder's frame; retry under the lock instead
+                print("WATCHDOG: serial lock busy and the port cannot cut in, off command skipped")
+            return False
+        except Exception as e:
+            print(f"WATCHDOG: could not turn the plate off: {e}")
+            return False
+        finally:
+            if locked:
+                lock.release()
+
+    def _trip(self, reason, since):
+        print(f"WATCHDOG: {reason}, turning heater and stirrer off")
+        self.tripped = True
+        if self.stop_event:
+            self.stop_event.set()
+        ok = self.confirmed = self._send_off()
+        latency = time.monotonic() - since
+        self.max_latency = max(self.max_latency, latency)
+        event = {"type": "watchdog_trip", "reason": reason, "latency": latency,
+                 "latency_bound": self.latency_bound, "plate_off": ok}
+        self.trips.append(event)
+        print(f"WATCHDOG: reacted in {latency:.2f} s (bound {self.latency_bound:.2f} s)")
+        if self.on_trip:
+            self.on_trip(event)
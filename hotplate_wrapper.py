@@ -6,22 +6,198 @@
 
 import serial
 import serial.tools.list_ports
-import sys
 import re
-import time
-import keyboard
-from datetime import datetime
+import weakref
+from collections import namedtuple
+
+import hotplate_profiler
+
+### Protocol codec ###
+class HotplateResponseError(Exception):
+    """Raised when a query gets no reply or a reply without a number"""
+
+# code: command letter, argument: takes a value, reply: "ok" or the type of the number returned
+Command = namedtuple("Command", "code argument reply label")
+
+COMMANDS = {
+    "set_heater_temp": Command('A', True, "ok", "Set Heater Temp"),
+    "set_heater_ramp": Command('D', True, "ok", "Set Heater Ramp"),
+    "set_heater_off": Command('G', False, "ok", "Heater Turn Off"),
+    "set_stir": Command('E', True, "ok", "Set Stir Speed"),
+    "set_stir_off": Command('F', False, "ok", "Stirrer Turn Off"),
+    "get_temp": Command('a', False, float, "temperature"),
+    "get_target_temp": Command('e', False, float, "target temperature"),
+    "get_ramp": Command('d', False, int, "ramp"),
+    "get_stir": Command('g', False, int, "stir speed"),
+}
+
+NUMBER = re.compile(rb"-?\d+(?:\.\d+)?")
+TERMINATORS = b"\r\n"
+
+class FrameParser:
+    """Incremental splitter for CR/LF-terminated reply frames.
+
+    Bytes are appended to one bytearray and consumed frames are deleted from
+    its front in place, so partial frames wait for the rest and merged frames
+    come out one at a time.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_frame(self):
+        """The next complete frame (without terminator), or None"""
+        buffer = self.buffer
+        while True:
+            ends = [i for i in (buffer.find(b'\r'), buffer.find(b'\n')) if i >= 0]
+            if not ends:
+                return None
+            end = min(ends)
+            frame = bytes(buffer[:end])
+            del buffer[:end + 1]
+            if frame:
+                return frame
+
+    def flush(self):
+        """Whatever is left over (an unterminated frame), emptying the buffer"""
+        frame = bytes(self.buffer.strip(TERMINATORS))
+        self.buffer.clear()
+        return frame
+
+    def clear(self):
+        self.buffer.clear()
+
+_parsers = weakref.WeakKeyDictionary()
+_frame_hooks = weakref.WeakKeyDictionary()
+
+def set_frame_hook(ser, hook):
+    """hook() runs before every command frame sent on ser (None removes it)"""
+    if hook is None:
+        _frame_hooks.pop(ser, None)
+    else:
+        _frame_hooks[ser] = hook
+
+def _parser(ser):
+    parser = _parsers.get(ser)
+    if parser is None:
+        parser = _parsers[ser] = FrameParser()
+    return parser
+
+def encode_command(name, value=None):
+    command = COMMANDS[name]
+    argument = ''
+    if command.argument:
+        argument = f"{value:g}" if isinstance(value, float) else str(value)
+    return (command.code + argument + '\r').encode('utf-8')
+
+def read_frame(ser, parser=None):
+    """Reads until one reply frame is complete or the port times out.
+
+    Reads what is already waiting instead of a fixed 100 bytes, so a reply
+    returns as soon as its terminator arrives rather than after the timeout.
+    Returns the frame, a partial frame on timeout, or b'' if nothing came back.
+    """
+    parser = parser or _parser(ser)
+    while True:
+        frame = parser.next_frame()
+        if frame is not None:
+            return frame
+        data = ser.read(max(getattr(ser, "in_waiting", 0), 1))
+        if not data:
+            return parser.flush()
+        parser.feed(data)
+
+def decode_reply(name, frame):
+    """Typed value of a reply frame: True/False for set commands, a number for queries"""
+    command = COMMANDS[name]
+    if command.reply == "ok":
+        return b'OK' in frame.upper()
+    match = NUMBER.search(frame)
+    if match is None:
+        raise HotplateResponseError(f"No {command.label} data received (reply {frame!r})")
+    value = float(match.group())
+    return value if command.reply is float else int(round(value))
+
+def _drop_late_replies(ser):
+    """Discards late replies to earlier commands, buffered here and still in the OS input buffer"""
+    _parser(ser).clear()
+    ser.reset_input_buffer()
+
+def _exchange(ser, name, value=None):
+    """Sends one command frame and returns its reply frame"""
+    hook = _frame_hooks.get(ser)
+    if hook:
+        hook()
+    with hotplate_profiler.section("serial " + name):
+        _drop_late_replies(ser)
+        ser.write(encode_command(name, value))
+        return read_frame(ser, _parser(ser))
+
+def transact(ser, name, value=None):
+    """Sends one command and returns its decoded reply"""
+    return decode_reply(name, _exchange(ser, name, value))
+
+def _exchange_many(ser, commands):
+    """Sends several command frames in one write and returns their reply frames, in order.
+
+    The plate answers commands in the order it receives them, so the n-th
+    frame back is the reply to the n-th command. Once a reply times out the
+    rest are b'' without waiting out the timeout again.
+    """
+    hook = _frame_hooks.get(ser)
+    if hook:
+        hook()
+    with hotplate_profiler.section("serial set_many"):
+        _drop_late_replies(ser)
+        parser = _parser(ser)
+        ser.write(b"".join(encode_command(name, value) for name, value in commands))
+        frames = []
+        for _ in commands:
+            frame = read_frame(ser, parser) if not frames or frames[-1] else b''
+            frames.append(frame)
+        return frames
+
+def _set(ser, name, value=None):
+    label = COMMANDS[name].label
+    frame = _exchange(ser, name, value)
+    print(f"Response: {frame.decode('utf-8', errors='ignore')}")
+    if not decode_reply(name, frame):
+        print(f"{label} Failed!")
+        return False
+    print(f"{label} Success!")
+    return True
+
+def _get(ser, name):
+    try:
+        return transact(ser, name)
+    except HotplateResponseError as e:
+        print(f"Warning: {e}")
+        raise
+
+### Temperature listeners ###
+# Called with every temperature get_temp reads, whichever thread read it,
+# so monitors (e.g. the watchdog) see the freshest sample without polling.
+_temp_listeners = []
+
+def add_temp_listener(listener):
+    _temp_listeners.append(listener)
+
+def remove_temp_listener(listener):
+    if listener in _temp_listeners:
+        _temp_listeners.remove(listener)
 
 ### Serial communication port commands ###
-def open_comm():
+def open_comm(port='COM3', baudrate=2400, timeout=1):
     """ Opens an RS-232 communication line to hotplate"""
     # Print each port's details
     ports = serial.tools.list_ports.comports()
-    for port in ports:
-      print(f"Port: {port.device}, Description: {port.description}, HWID: {port.hwid}")
+    for info in ports:
+      print(f"Port: {info.device}, Description: {info.description}, HWID: {info.hwid}")
 
     # Open a serial port
-    ser = serial.Serial('COM3', 2400, timeout=1)
+    ser = serial.Serial(port, baudrate, timeout=timeout)
     print(ser.name)
     return ser
 
@@ -36,93 +212,31 @@ def set_heater_temp(ser, temp):
         print("Heater temp too low, turn off heater instead!")
         return set_heater_off(ser)
     print("Setting heater temp to: "+str(temp)+" C...")
-    cmdheat = 'A'+str(temp)+'\r'
-    ser.write(cmdheat.encode('utf-8'))
-    data = ser.read(100) # Read up to 100 bytes
-    try:
-        response = data.decode('utf-8', errors='ignore')
-        print(f"Response: {response}")
-        if 'OK' not in response.upper():
-            print("Set Heater Temp Failed!")
-            return False
-    except Exception as e:
-        print(f"Error decoding response: {e}")
-        return False
-    print("Set Heater Temp Success!")
-    return True
+    return _set(ser, "set_heater_temp", temp)
     
 def set_heater_ramp(ser, ramp):
     print("Setting heater ramp to: "+str(ramp)+" C/hr...")
-    cmdheat = 'D'+str(ramp)+'\r'
-    ser.write(cmdheat.encode('utf-8'))
-    data = ser.read(100) # Read up to 100 bytes
-    try:
-        response = data.decode('utf-8', errors='ignore')
-        print(f"Response: {response}")
-        if 'OK' not in response.upper():
-            print("Set Heater Ramp Failed!")
-            return False
-    except Exception as e:
-        print(f"Error decoding response: {e}")
-        return False
-    print("Set Heater Ramp Success!")
-    return True
+    return _set(ser, "set_heater_ramp", ramp)
 
 def set_heater_off(ser):
     print("Turning off heater...")
-    cmdstir = 'G\r'
-    ser.write(cmdstir.encode('utf-8'))
-    data = ser.read(100) # Read up to 100 bytes
-    try:
-        response = data.decode('utf-8', errors='ignore')
-        print(f"Response: {response}")
-        if 'OK' not in response.upper():
-            print("Heater Turn Off Failed!")
-            return False
-    except Exception as e:
-        print(f"Error decoding response: {e}")
-        return False
-    print("Heater Turn Off Success!")
-    return True
+    return _set(ser, "set_heater_off")
 
 def get_temp(ser):
+    """Current plate temperature (°C, fractional). Raises HotplateResponseError if no reading."""
     print("Getting current hotplate temp...")
-    cmdgettemp = 'a\r'
-    ser.write(cmdgettemp.encode('utf-8'))
-    data = ser.read(100)
-    curtemp = re.findall(r"-?\d+", data.decode('utf-8'))  # Extracts all sequences of digits
-    if not curtemp:
-        print("Warning: No temperature data received")
-        return 0
-    curtemp = [int(x) for x in curtemp]  # Converts to integers
-    curtemp = curtemp[0]
-    return curtemp
+    temp = _get(ser, "get_temp")
+    for listener in list(_temp_listeners):
+        listener(temp)
+    return temp
 
 def get_target_temp(ser):
     print("Getting current hotplate temp...")
-    cmdgettemp = 'e\r'
-    ser.write(cmdgettemp.encode('utf-8'))
-    data = ser.read(100) 
-    curtemp = re.findall(r"-?\d+", data.decode('utf-8'))  # Extracts all sequences of digits
-    if not curtemp:
-        print("Warning: No target temperature data received")
-        return 0
-    curtemp = [int(x) for x in curtemp]  # Converts to integers
-    curtemp = curtemp[0]
-    return curtemp
+    return _get(ser, "get_target_temp")
 
 def get_ramp(ser):
     print("Getting hotplate ramp...")
-    cmdgettemp = 'd\r'
-    ser.write(cmdgettemp.encode('utf-8'))
-    data = ser.read(100)
-    curtemp = re.findall(r"-?\d+", data.decode('utf-8'))  # Extracts all sequences of digits
-    if not curtemp:
-        print("Warning: No ramp data received")
-        return 0
-    curtemp = [int(x) for x in curtemp]  # Converts to integers
-    curtemp = curtemp[0]
-    return curtemp
+    return _get(ser, "get_ramp")
     
 ##### Stirrer Functions #####
 def set_stir(ser, stir):
@@ -130,48 +244,35 @@ def set_stir(ser, stir):
         print("Ramp speed too low, turn off stirrer instead!")
         return set_stir_off(ser)
     print("Setting stirrer speed to: "+str(stir)+" RPM...")
-    cmdstir = 'E'+str(stir)+'\r'
-    ser.write(cmdstir.encode('utf-8'))
-    data = ser.read(100) # Read up to 100 bytes
-    try:
-        response = data.decode('utf-8', errors='ignore')
-        print(f"Response: {response}")
-        if 'OK' not in response.upper():
-            print("Set Stir Speed Failed!")
-            return False
-    except Exception as e:
-        print(f"Error decoding response: {e}")
-        return False
-    print("Set Stir Speed Success!")
-    return True
+    return _set(ser, "set_stir", stir)
 
 def set_stir_off(ser):
     print("Turning off stirrer...")
-    cmdstir = 'F\r'
-    ser.write(cmdstir.encode('utf-8'))
-    data = ser.read(100) # Read up to 100 bytes
-    try:
-        response = data.decode('utf-8', errors='ignore')
-        print(f"Response: {response}")
-        if 'OK' not in response.upper():
-            print("Stirrer Turn Off Failed!")
-            return False
-    except Exception as e:
-        print(f"Error decoding response: {e}")
-        return False
-    print("Stirrer Turn Off Success!")
-    return True
+    return _set(ser, "set_stir_off")
 
 def get_stir(ser):
     print("Getting stirrer speed...")
-    cmdgetspeed = 'g\r'
-    ser.write(cmdgetspeed.encode('utf-8'))
-    data = ser.read(100)
-    print(data.decode('utf-8'))
-    curspeed = re.findall(r"-?\d+", data.decode('utf-8'))  # Extracts all sequences of digits
-    if not curspeed:
-        print("Warning: No stir speed data received")
-        return 0
-    curspeed = [int(x) for x in curspeed]  # Converts to integers
-    curspeed = curspeed[0]
-    return curspeed
+    return _get(ser, "get_stir")
+
+##### Multi-command Transactions #####
+def _plate_command(name, value):
+    """The command actually sent for a setting: too-low temperatures / stir speeds turn that part off"""
+    if name == "set_heater_temp" and value <= 25:
+        return "set_heater_off", None
+    if name == "set_stir" and value <= 1:
+        return "set_stir_off", None
+    return name, value
+
+def set_many(ser, commands):
+    """Sends several set commands (a list of (name, value) pairs, value None for the off
+    commands) back to back in one burst. Returns each command's success, in order."""
+    commands = [_plate_command(name, value) for name, value in commands]
+    print("Sending " + ", ".join(COMMANDS[name].label + ("" if value is None else f" {value}")
+                                 for name, value in commands) + "...")
+    frames = _exchange_many(ser, commands)
+    results = []
+    for (name, _), frame in zip(commands, frames):
+        ok = decode_reply(name, frame)
+        print(f"{COMMANDS[name].label} {'Success' if ok else 'Failed'}! (response: {frame.decode('utf-8', errors='ignore')})")
+        results.append(ok)
+    return results
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+import hotplate_estimator as estimator
+import hotplate_runscript as runscript
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hotplatescripts")
+
+
+def estimate(name, **kwargs):
+    return estimator.estimate_recipe(runscript.compile_recipe(os.path.join(SCRIPTS, name)), **kwargs)
+
+
+def test_test_recipe_duration():
+    result = estimate("test.txt")
+    durations = [step["duration"] for step in result["steps"]]
+    assert durations == pytest.approx([543.2, 1089.2], abs=0.5)
+    assert result["total_seconds"] == pytest.approx(sum(durations))
+    assert estimator.format_duration(result["total_seconds"]) == "00:27:12"
+
+
+def test_shipped_recipe_totals():
+    assert estimator.format_duration(estimate("PMMATransferBake.txt")["total_seconds"]) == "01:34:56"
+    assert estimator.format_duration(estimate("PSTransferBake.txt")["total_seconds"]) == "03:24:43"
+
+
+def test_final_step_ends_cooled():
+    last = estimate("test.txt")["steps"][-1]
+    assert last["target_temp"] == 25
+    assert last["stabilize_seconds"] > 0
+    assert last["end_temp"] <= estimator.FINAL_COOLING_THRESHOLD
+
+
+def test_trace_covers_the_run():
+    result = estimate("test.txt")
+    assert result["times"][-1] == pytest.approx(result["total_seconds"], abs=1.0)
+    assert set(result["step_index"]) == {1, 2}
+
+
+def test_remaining_seconds():
+    result = estimate("test.txt")
+    first, second = (step["duration"] for step in result["steps"])
+    assert estimator.remaining_seconds(result, 1) == pytest.approx(first + second)
+    assert estimator.remaining_seconds(result, 1, 100.0) == pytest.approx(first + second - 100.0)
+    assert estimator.remaining_seconds(result, 2, 1e9) == 0.0
+    assert estimator.remaining_seconds(result, 3) == 0.0
+
+
+def test_unreachable_target_is_unbounded():
+    model = estimator.ThermalModel(gain=0.5)
+    steps = [{"kind": "setpoint", "target_temp": 300, "ramp_rate": 0, "stir_speed": 0,
+              "dwell_seconds": 60, "stabilize": 1}]
+    result = estimator.estimate_recipe(steps, model=model)
+    assert not result["steps"][0]["reachable"]
+    assert estimator.format_duration(result["total_seconds"]) == "--"
+
+
+CYCLE = "120 600 0 60 1\n60 600 0 30 0\n"
+
+
+def estimate_text(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return estimator.estimate_recipe(runscript.compile_recipe(str(path)))
+
+
+def assert_matches_unrolled(repeated, unrolled):
+    steps = unrolled["steps"]
+    assert repeated["total_seconds"] == pytest.approx(unrolled["total_seconds"])
+    for number in range(1, len(steps) + 1):
+        result = estimator.step_result(repeated, number)
+        assert result["duration"] == pytest.approx(steps[number - 1]["duration"])
+        assert result["cooling_seconds"] == pytest.approx(steps[number - 1]["cooling_seconds"])
+        assert estimator.seconds_after(repeated, number) == pytest.approx(
+            sum(step["duration"] for step in steps[number:]), abs=1e-6)
+    assert estimator.step_result(repeated, len(steps) + 1) is None
+
+
+def test_repeat_estimate_matches_unrolled_recipe(tmp_path):
+    repeated = estimate_text(tmp_path, "repeat.txt", "40 450 0 10 0\nrepeat 40 {\n" + CYCLE + "}\n25 450 0 0 0\n")
+    unrolled = estimate_text(tmp_path, "unrolled.txt", "40 450 0 10 0\n" + CYCLE * 40 + "25 450 0 0 0\n")
+    # The converged cycles are one block rather than 80 step results
+    assert len(repeated["steps"]) < len(unrolled["steps"])
+    assert_matches_unrolled(repeated, unrolled)
+
+
+def test_nested_repeat_estimate_matches_unrolled_recipe(tmp_path):
+    inner = "repeat 3 {\n" + CYCLE + "}\n"
+    repeated = estimate_text(tmp_path, "nested.txt", "repeat 25 {\n150 600 0 20 0\n" + inner + "}\n25 450 0 0 0\n")
+    unrolled = estimate_text(tmp_path, "unrolled.txt", ("150 600 0 20 0\n" + CYCLE * 3) * 25 + "25 450 0 0 0\n")
+    assert_matches_unrolled(repeated, unrolled)
+
+
+def test_recipe_ending_in_a_repeat_still_simulates_the_last_step(tmp_path):
+    # The plate stabilizes at 31 °C, so only the final step also waits to cool below 30 °C
+    cycle = "100 600 0 30 0\n29 600 300 0 0\n"
+    repeated = estimate_text(tmp_path, "repeat.txt", "repeat 10 {\n" + cycle + "}\n")
+    unrolled = estimate_text(tmp_path, "unrolled.txt", cycle * 10)
+    assert unrolled["steps"][-1]["cooling_seconds"] > 0
+    assert_matches_unrolled(repeated, unrolled)
+
+
+def test_long_repeat_stays_bounded(tmp_path):
+    result = estimate_text(tmp_path, "long.txt", "repeat 10000 {\n" + CYCLE + "}\n25 450 0 0 0\n")
+    assert len(result["times"]) <= estimator.TRACE_POINTS
+    assert result["times"][-1] == pytest.approx(result["total_seconds"], rel=1e-3)
+    cycle = estimator.step_result(result, 19999)["duration"] + estimator.step_result(result, 20000)["duration"]
+    assert estimator.remaining_seconds(result, 19999) == pytest.approx(
+        cycle + estimator.step_result(result, 20001)["duration"])
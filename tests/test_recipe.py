@@ -0,0 +1,99 @@
+import pytest
+
+from hotplate_recipe import RecipeError, load_recipe
+
+NESTED = """\
+let HOT = 150
+40 450 0 10 0
+repeat 3 {
+    $HOT 600 0 20 0
+    repeat 2 {
+        60 600 0 5 0
+        70 600 0 5 0
+    }
+    80 600 0 5 0
+}
+25 450 0 0 0
+"""
+NESTED_TARGETS = [40] + [150, 60, 70, 60, 70, 80] * 3 + [25]
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def targets(steps):
+    return [step["target_temp"] for step in steps]
+
+
+def test_plain_recipe(tmp_path):
+    recipe = load_recipe(write(tmp_path, "plain.txt", "# comment\n40 450 0 60 0\n\n25 450 0 0 0\n"))
+    assert len(recipe) == 2
+    assert list(recipe) == [
+        {"kind": "setpoint", "target_temp": 40, "ramp_rate": 450, "stir_speed": 0, "dwell_seconds": 60, "stabilize": 0},
+        {"kind": "setpoint", "target_temp": 25, "ramp_rate": 450, "stir_speed": 0, "dwell_seconds": 0, "stabilize": 0},
+    ]
+
+
+def test_nested_repeats_expand_in_order(tmp_path):
+    recipe = load_recipe(write(tmp_path, "nested.txt", NESTED))
+    assert len(recipe) == len(NESTED_TARGETS) == 20
+    assert targets(recipe) == NESTED_TARGETS
+
+
+def test_enumerate_from_every_start_matches_full_expansion(tmp_path):
+    recipe = load_recipe(write(tmp_path, "nested.txt", NESTED))
+    expanded = list(enumerate(recipe, start=1))
+    for start in range(1, len(recipe) + 2):
+        resumed = list(recipe.enumerate(start))
+        assert [number for number, _ in resumed] == list(range(start, len(recipe) + 1))
+        assert all(step is expected for (_, step), (_, expected) in zip(resumed, expanded[start - 1:]))
+
+
+def test_enumerate_resumes_inside_a_nested_repeat(tmp_path):
+    recipe = load_recipe(write(tmp_path, "nested.txt", NESTED))
+    # Step 9 is the inner repeat's first step in the second outer cycle
+    number, step = next(iter(recipe.enumerate(9)))
+    assert (number, step["target_temp"]) == (9, 60)
+    assert targets(step for _, step in recipe.enumerate(13)) == [80] + [150, 60, 70, 60, 70, 80] + [25]
+    assert next(iter(recipe.enumerate(0)))[0] == 1
+
+
+def test_empty_repeat_adds_no_steps(tmp_path):
+    recipe = load_recipe(write(tmp_path, "empty.txt", "40 450 0 10 0\nrepeat 0 {\n60 600 0 5 0\n}\n25 450 0 0 0\n"))
+    assert len(recipe) == 2
+    assert [(number, step["target_temp"]) for number, step in recipe.enumerate(2)] == [(2, 25)]
+
+
+def test_include_relative_to_the_recipe(tmp_path):
+    (tmp_path / "parts").mkdir()
+    write(tmp_path, "parts/cycle.txt", "60 600 0 5 0\n70 600 0 5 0\n")
+    recipe = load_recipe(write(tmp_path, "main.txt", "repeat 2 {\ninclude parts/cycle.txt\n}\ninclude parts/cycle.txt\n"))
+    assert targets(recipe) == [60, 70] * 3
+    assert len(recipe.files) == 2
+
+
+def test_self_include_is_an_error(tmp_path):
+    path = write(tmp_path, "loop.txt", "40 450 0 10 0\ninclude loop.txt\n")
+    with pytest.raises(RecipeError, match="loop.txt includes itself"):
+        load_recipe(path)
+
+
+def test_include_cycle_is_an_error(tmp_path):
+    write(tmp_path, "b.txt", "include a.txt\n")
+    path = write(tmp_path, "a.txt", "40 450 0 10 0\ninclude b.txt\n")
+    with pytest.raises(RecipeError, match="a.txt includes itself"):
+        load_recipe(path)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("40 450 0 10 0\n}\n", "line 2: unmatched }"),
+    ("repeat 2 {\n40 450 0 10 0\n", "line 1: repeat block is missing its closing }"),
+    ("$HOT 450 0 10 0\n", "line 1: undefined variable \\$HOT"),
+    ("40 450 0 10\n", "line 1: not all commands have 5 inputs"),
+])
+def test_syntax_errors_name_the_line(tmp_path, text, message):
+    with pytest.raises(RecipeError, match=message):
+        load_recipe(write(tmp_path, "bad.txt", text))